@@ -0,0 +1,117 @@
+# backend/answer_cache.py
+
+import math
+import time
+from collections import OrderedDict
+
+# Bumped by vector_db/store_in_qdrant.py whenever the collection is re-ingested
+INGEST_GENERATION_KEY = "ingest_generation:news_articles"
+
+def _unit(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+class AnswerCache:
+    """
+    Semantic cache of generated answers.
+
+    Entries are grouped by the set of retrieved passage IDs. A lookup reuses
+    an answer only when the same sources were retrieved and the cached query
+    embedding has cosine similarity >= `threshold` with the new one.
+
+    `generation_fn` is an optional coroutine function returning the current
+    ingest generation; when it changes, every entry is dropped.
+    """
+
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1000, per_source_set=8,
+                 generation_fn=None, generation_check_interval=5.0):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.per_source_set = per_source_set
+        self.generation_fn = generation_fn
+        self.generation_check_interval = generation_check_interval
+        self._entries = OrderedDict()
+        self._size = 0
+        self._generation = None
+        self._generation_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def source_key(source_ids):
+        return tuple(sorted(str(i) for i in source_ids))
+
+    def invalidate(self):
+        self._entries.clear()
+        self._size = 0
+        self.invalidations += 1
+
+    async def _check_generation(self):
+        if self.generation_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._generation_checked_at < self.generation_check_interval:
+            return
+        self._generation_checked_at = now
+        try:
+            generation = await self.generation_fn()
+        except Exception as e:
+            print(f"Warning: Could not read ingest generation: {e}")
+            return
+        if generation != self._generation:
+            if self._generation is not None:
+                self.invalidate()
+            self._generation = generation
+
+    async def get(self, vector, source_ids):
+        """Return a cached answer for a similar query over the same sources, or None"""
+        await self._check_generation()
+        key = self.source_key(source_ids)
+        entries = self._entries.get(key)
+        if entries:
+            now = time.monotonic()
+            live = [e for e in entries if e[2] > now]
+            self._size -= len(entries) - len(live)
+            if live:
+                self._entries[key] = live
+                self._entries.move_to_end(key)
+                query = _unit(vector)
+                best_score, best_answer = max(
+                    (sum(a * b for a, b in zip(query, cached)), answer)
+                    for cached, answer, _ in live
+                )
+                if best_score >= self.threshold:
+                    self.hits += 1
+                    return best_answer
+            else:
+                del self._entries[key]
+        self.misses += 1
+        return None
+
+    async def put(self, vector, source_ids, answer):
+        key = self.source_key(source_ids)
+        entries = self._entries.setdefault(key, [])
+        entries.append((_unit(vector), answer, time.monotonic() + self.ttl))
+        self._size += 1
+        if len(entries) > self.per_source_set:
+            entries.pop(0)
+            self._size -= 1
+        self._entries.move_to_end(key)
+        while self._size > self.max_entries and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "source_sets": len(self._entries),
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,120 @@
+# bench/article_cache_lookup.py
+#
+# Per-URL JSON files versus the SQLite article cache: disk usage and file
+# count, single-URL lookups (hits and misses), and a full bulk read as the
+# embedding stage does it. The JSON directory is then migrated into a fresh
+# cache and checked for equality, which doubles as a test of the migration.
+#
+# Run from the backend directory:
+#     python bench/article_cache_lookup.py --articles 20000
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+from article_cache import ArticleCache, migrate_directory
+
+WORDS = ("market shares bank rates inflation trade minister election court oil deliveries airline "
+         "quarter profit forecast tariff central government talks ceasefire").split()
+
+def make_article(i, rng):
+    return {
+        "title": f"Article {i}: " + " ".join(rng.choices(WORDS, k=8)),
+        "date_publish": "2025-05-07T10:00:00Z",
+        "text": " ".join(rng.choices(WORDS, k=rng.randint(300, 900))),
+        "url": f"https://www.reuters.com/world/article-{i}-2025-05-07/",
+        "author": "Reuters Staff",
+    }
+
+def legacy_filename(url):
+    return f"article_{hashlib.md5(url.encode()).hexdigest()}.json"
+
+def legacy_get(cache_dir, url):
+    path = os.path.join(cache_dir, legacy_filename(url))
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def disk_usage(path):
+    if os.path.isfile(path):
+        return os.stat(path).st_blocks * 512, 1
+    total, files = 0, 0
+    for entry in os.scandir(path):
+        total += entry.stat().st_blocks * 512
+        files += 1
+    return total, files
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite article cache against per-URL JSON files")
+    parser.add_argument("--articles", type=int, default=20000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    articles = [make_article(i, rng) for i in range(args.articles)]
+    urls = [a["url"] for a in articles]
+    probes = rng.sample(urls, min(args.lookups, len(urls))) + [f"https://example.com/missing-{i}" for i in range(args.lookups // 4)]
+    rng.shuffle(probes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_dir = os.path.join(tmp, "reuters_cache")
+        os.makedirs(legacy_dir)
+
+        def write_legacy():
+            for article in articles:
+                with open(os.path.join(legacy_dir, legacy_filename(article["url"])), "w", encoding="utf-8") as f:
+                    json.dump(article, f, ensure_ascii=False)
+        _, legacy_write = timed(write_legacy)
+
+        cache = ArticleCache(os.path.join(tmp, "direct.sqlite"))
+        _, sqlite_write = timed(lambda: cache.put_many(articles))
+
+        _, legacy_lookup = timed(lambda: [legacy_get(legacy_dir, url) for url in probes])
+        _, sqlite_lookup = timed(lambda: [cache.get(url) for url in probes])
+        _, sqlite_many = timed(lambda: cache.get_many(probes))
+
+        def read_legacy_all():
+            return sum(1 for entry in os.scandir(legacy_dir) if json.load(open(entry.path, encoding="utf-8")))
+        legacy_count, legacy_scan = timed(read_legacy_all)
+        sqlite_count, sqlite_scan = timed(lambda: sum(1 for _ in cache.iter_articles()))
+        cache.close()
+
+        migrated_path = os.path.join(tmp, "migrated.sqlite")
+        (migrated, skipped), migrate_seconds = timed(lambda: migrate_directory(legacy_dir, migrated_path))
+        migrated_cache = ArticleCache(migrated_path)
+        identical = migrated_cache.get_many(urls) == {a["url"]: a for a in articles}
+        migrated_cache.close()
+
+        legacy_bytes, legacy_files = disk_usage(legacy_dir)
+        sqlite_bytes, _ = disk_usage(migrated_path)
+
+    n = len(probes)
+    print(f"{args.articles} articles, {n} lookups ({args.lookups // 4} misses)")
+    print(f"{'':>22} {'JSON files':>12} {'SQLite':>12}")
+    print(f"{'disk MB':>22} {legacy_bytes / 1e6:>12.1f} {sqlite_bytes / 1e6:>12.1f}")
+    print(f"{'files':>22} {legacy_files:>12} {1:>12}")
+    print(f"{'write articles/s':>22} {args.articles / legacy_write:>12.0f} {args.articles / sqlite_write:>12.0f}")
+    print(f"{'lookups/s':>22} {n / legacy_lookup:>12.0f} {n / sqlite_lookup:>12.0f}")
+    print(f"{'bulk lookups/s':>22} {'-':>12} {n / sqlite_many:>12.0f}")
+    print(f"{'full read articles/s':>22} {legacy_count / legacy_scan:>12.0f} {sqlite_count / sqlite_scan:>12.0f}")
+    print(f"Migrated {migrated} files ({skipped} skipped) in {migrate_seconds:.2f}s")
+    if not identical or migrated != args.articles:
+        print("❌ Migrated cache does not match the JSON files")
+        sys.exit(1)
+    print("✅ Migrated cache matches the JSON files")
+
+if __name__ == "__main__":
+    main()
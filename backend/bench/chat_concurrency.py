@@ -0,0 +1,87 @@
+# bench/chat_concurrency.py
+#
+# Fires N concurrent /chat requests against the app with slow stubbed
+# dependencies and checks that they overlap instead of running serially.
+#
+# Run from the backend directory:
+#     python bench/chat_concurrency.py --requests 20 --delay 0.5
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import main
+
+class SlowRetriever:
+    name = "stub"
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def search(self, vector, limit=5):
+        await asyncio.sleep(self.delay)
+        return [
+            {"id": str(i), "chunk_ids": [i], "title": f"Stub {i}", "url": "", "text": "stub", "score": 1.0, "vector": None}
+            for i in range(limit)
+        ]
+
+def install_stubs(delay):
+    """Replace every I/O-bound dependency of /chat with an async stub that sleeps for `delay`"""
+    async def fake_encode(text):
+        return [0.0] * 384
+
+    async def fake_gemini(query, passages):
+        await asyncio.sleep(delay)
+        return f"Stub answer for {query}"
+
+    async def fake_add_turn(session_id, user_text, bot_text):
+        await asyncio.sleep(delay / 10)
+
+    async def fake_recent_history(session_id):
+        await asyncio.sleep(delay / 10)
+        return []
+
+    main.hybrid_retriever.dense = SlowRetriever(delay / 10)
+    main.encode_query_async = fake_encode
+    main.generate_gemini_response_async = fake_gemini
+    main.add_turn = fake_add_turn
+    main.recent_history = fake_recent_history
+    main.answer_cache.generation_fn = None
+
+async def run(num_requests, delay):
+    install_stubs(delay)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            http.post("/chat", data={"query": f"question {i}"})
+            for i in range(num_requests)
+        ])
+        elapsed = time.perf_counter() - started
+
+    failed = [r for r in responses if r.status_code != 200]
+    # Each request costs roughly 1.3x delay end to end when run on its own
+    serial_estimate = num_requests * delay * 1.3
+    print(f"{num_requests} requests, {len(failed)} failed, {elapsed:.2f}s elapsed "
+          f"(serial would take ~{serial_estimate:.2f}s)")
+    return not failed and elapsed < serial_estimate / 2
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Check that concurrent /chat requests overlap")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.5, help="Simulated Gemini latency in seconds")
+    args = parser.parse_args()
+
+    if not asyncio.run(run(args.requests, args.delay)):
+        print("❌ Requests did not overlap")
+        sys.exit(1)
+    print("✅ Requests overlapped")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,100 @@
+# bench/cold_start.py
+#
+# Measures cold-start time of the API: seconds from launching uvicorn until the
+# first liveness response and until the readiness probe passes.
+#
+# Run from the backend directory:
+#     python bench/cold_start.py --runs 3
+#
+# To compare against an older revision, --compare checks it out into a
+# temporary worktree and measures both. The old app has no /healthz or /readyz,
+# so it is probed on /docs; it blocked import until ingest finished, so its
+# first response is also its ready time:
+#     python bench/cold_start.py --compare <rev>
+# Or probe a worktree by hand:
+#     git worktree add /tmp/before <rev>
+#     python bench/cold_start.py --app-dir /tmp/before/backend --live-path /docs --ready-path /docs
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def probe(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+def measure(app_dir, port, live_path, ready_path, timeout):
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=app_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    live_at = ready_at = None
+    try:
+        while time.monotonic() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            now = time.monotonic() - started
+            if live_at is None and probe(f"http://127.0.0.1:{port}{live_path}"):
+                live_at = now
+            if live_at is not None and probe(f"http://127.0.0.1:{port}{ready_path}"):
+                ready_at = time.monotonic() - started
+                break
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+    if ready_at is None:
+        raise RuntimeError(f"Server was not ready within {timeout}s")
+    return live_at, ready_at
+
+def run(label, app_dir, port, live_path, ready_path, runs, timeout):
+    lives, readies = [], []
+    for i in range(runs):
+        live_at, ready_at = measure(app_dir, port, live_path, ready_path, timeout)
+        lives.append(live_at)
+        readies.append(ready_at)
+        print(f"{label}run {i + 1}: live after {live_at:.2f}s, ready after {ready_at:.2f}s")
+    live, ready = statistics.median(lives), statistics.median(readies)
+    print(f"{label}median: live {live:.2f}s, ready {ready:.2f}s")
+    return live, ready
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API cold-start time")
+    parser.add_argument("--app-dir", default=BACKEND_DIR)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--live-path", default="/healthz")
+    parser.add_argument("--ready-path", default="/readyz")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--compare", metavar="REV", help="Also measure this git revision, probed on /docs")
+    args = parser.parse_args()
+
+    if not args.compare:
+        run("", args.app_dir, args.port, args.live_path, args.ready_path, args.runs, args.timeout)
+        sys.exit(0)
+
+    worktree = tempfile.mkdtemp(prefix="cold-start-")
+    subprocess.run(["git", "worktree", "add", "--detach", worktree, args.compare], cwd=BACKEND_DIR, check=True,
+                   stdout=subprocess.DEVNULL)
+    try:
+        old_app_dir = os.path.join(worktree, os.path.relpath(args.app_dir, os.path.dirname(BACKEND_DIR)))
+        before = run("before: ", old_app_dir, args.port, "/docs", "/docs", args.runs, args.timeout)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=BACKEND_DIR)
+        shutil.rmtree(worktree, ignore_errors=True)
+    after = run("after:  ", args.app_dir, args.port, args.live_path, args.ready_path, args.runs, args.timeout)
+
+    print(f"live:  {before[0]:.2f}s -> {after[0]:.2f}s")
+    print(f"ready: {before[1]:.2f}s -> {after[1]:.2f}s")
@@ -0,0 +1,219 @@
+# bench/crawler_stub.py
+#
+# Runs the sitemap crawler against a local stub HTTP server serving fixture
+# sitemaps, pages and robots.txt, and checks that it behaves:
+#   - every listed page is fetched once and robots.txt Disallow rules are obeyed
+#   - requests to a host are spaced by the per-host rate or its Crawl-delay,
+#     while different hosts are crawled concurrently within the pool limit
+#   - a refresh with nothing changed downloads no sitemaps or pages
+#   - after one page changes, only that page and its sitemap are downloaded
+#   - cached pages are revalidated with ETags and a 304 reuses the cache
+#   - a page that failed is retried on the next crawl, although its sitemap
+#     has not changed since
+# The stub serves two "hosts" (127.0.0.1 and localhost on the same port) with
+# different robots.txt files. Exits non-zero when a check fails.
+#
+# Run from the backend directory:
+#     python bench/crawler_stub.py
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+from sitemap_crawler import iter_crawl
+
+ROBOTS = {
+    "127.0.0.1": "User-agent: *\nCrawl-delay: 0.1\nDisallow: /private/\n",
+    "localhost": "User-agent: *\nDisallow:\n",
+}
+SITEMAP_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n'
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+class StubSite:
+    """Fixture sitemaps and pages, plus a log of every request the crawler made"""
+
+    def __init__(self, pages_per_host, page_delay):
+        self.page_delay = page_delay
+        self.lock = threading.Lock()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.pages = {}
+        self.lastmod = {}
+        # (host, path) pairs answered with a 404 whatever the page is
+        self.failing = set()
+        self.sitemaps = {"127.0.0.1": "/sitemaps/news-1.xml", "localhost": "/sitemaps/news-2.xml"}
+        for host in self.sitemaps:
+            for i in range(pages_per_host):
+                self.set_page(host, f"/article/{i}", f"<html><h1>{host} {i}</h1><p>Body {i}</p></html>", "2025-05-01")
+        self.set_page("127.0.0.1", "/private/secret", "<html>private</html>", "2025-05-01")
+
+    def set_page(self, host, path, html, lastmod):
+        self.pages[(host, path)] = html
+        self.lastmod[(host, path)] = lastmod
+
+    def body(self, host, path, port):
+        if path == "/robots.txt":
+            return ROBOTS.get(host)
+        if path == "/sitemap-index.xml":
+            entries = "".join(
+                f"<sitemap><loc>http://{h}:{port}{sitemap}</loc><lastmod>{self.sitemap_lastmod(h)}</lastmod></sitemap>"
+                for h, sitemap in self.sitemaps.items()
+            ) + f"<sitemap><loc>http://127.0.0.1:{port}/sitemaps/video-1.xml</loc></sitemap>"
+            return f"{SITEMAP_HEAD}<sitemapindex {NS}>{entries}</sitemapindex>"
+        for h, sitemap in self.sitemaps.items():
+            if host == h and path == sitemap:
+                entries = "".join(
+                    f"<url><loc>http://{h}:{port}{p}</loc><lastmod>{self.lastmod[(h, p)]}</lastmod></url>"
+                    for (page_host, p) in self.pages if page_host == h
+                )
+                return f"{SITEMAP_HEAD}<urlset {NS}>{entries}</urlset>"
+        return None if (host, path) in self.failing else self.pages.get((host, path))
+
+    def sitemap_lastmod(self, host):
+        return max(lastmod for (h, _), lastmod in self.lastmod.items() if h == host)
+
+    def page_requests(self, since=0):
+        return [(host, path, status) for _, host, path, status in self.requests[since:] if path.startswith(("/article/", "/private/"))]
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            host, port = self.headers["Host"].rsplit(":", 1)
+            arrived = time.monotonic()
+            with site.lock:
+                site.in_flight += 1
+                site.max_in_flight = max(site.max_in_flight, site.in_flight)
+            try:
+                body = site.body(host, self.path, port)
+                if self.path.startswith("/article/"):
+                    time.sleep(site.page_delay)
+                if body is None:
+                    status = 404
+                    self.send_response(404)
+                    self.end_headers()
+                else:
+                    data = body.encode("utf-8")
+                    etag = f'"{hashlib.md5(data).hexdigest()}"'
+                    status = 304 if self.headers.get("If-None-Match") == etag else 200
+                    self.send_response(status)
+                    self.send_header("ETag", etag)
+                    if status == 200:
+                        self.send_header("Content-Length", str(len(data)))
+                        self.end_headers()
+                        self.wfile.write(data)
+                    else:
+                        self.end_headers()
+                with site.lock:
+                    site.requests.append((arrived, host, self.path, status))
+            finally:
+                with site.lock:
+                    site.in_flight -= 1
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def crawl(base, state_path, cache, changed_only=True, urls=None, concurrency=4, rate=20.0):
+    stats = {}
+    results = list(iter_crawl(
+        f"{base}/sitemap-index.xml" if urls is None else None, urls=urls, changed_only=changed_only, stats=stats,
+        state_path=state_path, cached=cache.get, concurrency=concurrency, rate=rate
+    ))
+    for page in results:
+        if page.get("html"):
+            cache[page["url"]] = {"url": page["url"], "text": page["html"].decode("utf-8")}
+    return results, stats
+
+def min_gap(site, host, since=0):
+    times = [t for t, h, path, _ in site.requests[since:] if h == host and path != "/robots.txt"]
+    return min((b - a for a, b in zip(times, times[1:])), default=float("inf"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the sitemap crawler against a local stub server")
+    parser.add_argument("--pages", type=int, default=12, help="Pages per host")
+    parser.add_argument("--page-delay", type=float, default=0.05, help="Server time per page")
+    parser.add_argument("--rate", type=float, default=20.0, help="Crawler requests per second per host")
+    args = parser.parse_args()
+
+    site = StubSite(args.pages, args.page_delay)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(site))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    base = f"http://127.0.0.1:{port}"
+    failures = []
+
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        if not ok:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, "crawl_state.json")
+        cache = {}
+
+        started = time.monotonic()
+        results, stats = crawl(base, state_path, cache, rate=args.rate)
+        elapsed = time.monotonic() - started
+        fetched = {page["url"] for page in results if page.get("html")}
+        check(len(fetched) == 2 * args.pages, f"First crawl fetched {len(fetched)}/{2 * args.pages} pages in {elapsed:.2f}s")
+        check(not any(path.startswith("/private/") for _, path, _ in site.page_requests()),
+              f"robots.txt Disallow obeyed ({stats['disallowed']} URL skipped)")
+        check(not any("video" in path for _, _, path, _ in site.requests), "Only news sitemaps were selected")
+        crawl_delay, interval = 0.1, 1.0 / args.rate
+        gap = min_gap(site, "127.0.0.1")
+        check(gap >= crawl_delay * 0.8, f"127.0.0.1 requests at least its Crawl-delay apart (min gap {gap * 1000:.0f} ms)")
+        gap = min_gap(site, "localhost")
+        check(gap >= interval * 0.8, f"localhost requests at least 1/rate apart (min gap {gap * 1000:.0f} ms)")
+        serial = args.pages * (crawl_delay + interval)
+        check(site.max_in_flight > 1 and elapsed < serial,
+              f"Hosts crawled concurrently (max {site.max_in_flight} in flight, {elapsed:.2f}s vs {serial:.2f}s serial)")
+
+        mark = len(site.requests)
+        results, stats = crawl(base, state_path, cache)
+        check(not results and not site.page_requests(mark),
+              f"Unchanged refresh fetched no pages ({len(site.requests) - mark} requests, "
+              f"{stats['sitemaps_not_modified']} sitemap not modified)")
+
+        site.set_page("127.0.0.1", "/article/3", "<html><h1>Updated</h1><p>New body</p></html>", "2025-05-02")
+        mark = len(site.requests)
+        results, stats = crawl(base, state_path, cache)
+        paths = [path for _, _, path, _ in site.requests[mark:]]
+        check([page["url"] for page in results] == [f"http://127.0.0.1:{port}/article/3"],
+              f"After one page changed, only it was fetched (requests: {', '.join(paths)})")
+        check("/sitemaps/news-2.xml" not in paths, "Unchanged sitemap was not downloaded")
+
+        mark = len(site.requests)
+        urls = sorted(cache)[:5]
+        results, stats = crawl(base, state_path, cache, changed_only=False, urls=urls)
+        statuses = [status for _, _, status in site.page_requests(mark)]
+        check(statuses == [304] * len(urls) and all("article" in page for page in results),
+              f"Cached pages revalidated with ETags: {statuses.count(304)}/{len(urls)} returned 304")
+
+        site.set_page("127.0.0.1", "/article/new", "<html><h1>New</h1><p>Fresh story</p></html>", "2025-05-03")
+        site.failing.add(("127.0.0.1", "/article/new"))
+        results, stats = crawl(base, state_path, cache)
+        new_url = f"http://127.0.0.1:{port}/article/new"
+        check([page["url"] for page in results if page.get("html")] == [] and stats["failed"] == 1,
+              "A new page that failed was reported as failed")
+        site.failing.clear()
+        mark = len(site.requests)
+        results, stats = crawl(base, state_path, cache)
+        paths = [path for _, _, path, _ in site.requests[mark:]]
+        check([page["url"] for page in results if page.get("html")] == [new_url],
+              f"The failed page was retried with its sitemap unchanged (requests: {', '.join(paths)})")
+
+    server.shutdown()
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench/embedding_store_load.py
+#
+# Compares the legacy pretty-printed JSON embeddings file with the float32
+# .npy + metadata store: file size, time to stream every record and peak RSS.
+# Each loader runs in a fresh subprocess so RSS numbers don't leak between runs.
+#
+# Run from the backend directory:
+#     python bench/embedding_store_load.py --articles 20000
+#     python bench/embedding_store_load.py --base embeddings/article_embeddings
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+from embeddings.embedding_store import (
+    save_store, export_json, iter_records, iter_json_records, json_path, matrix_path, metadata_path
+)
+
+def make_corpus(base, num_articles, dim=384, text_chars=3000):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((num_articles, dim), dtype=np.float32)
+    articles = [
+        {"title": f"Article {i}", "url": f"https://example.com/{i}", "text": "lorem ipsum " * (text_chars // 12)}
+        for i in range(num_articles)
+    ]
+    save_store(vectors, articles, base)
+    export_json(base)
+
+def peak_rss_mb():
+    # ru_maxrss survives fork+exec on Linux, so prefer the per-process high-water mark
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(fmt, base):
+    """Stream every record in one format and print timing and RSS as JSON"""
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    records = iter_records(base) if fmt == "npy" else iter_json_records(json_path(base))
+    count = 0
+    checksum = 0.0
+    for meta, vector in records:
+        checksum += float(vector[0])
+        count += 1
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "format": fmt,
+        "records": count,
+        "seconds": elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_growth_mb": peak_rss_mb() - baseline,
+    }))
+
+def run(base):
+    sizes = {
+        "json": os.path.getsize(json_path(base)),
+        "npy": os.path.getsize(matrix_path(base)) + os.path.getsize(metadata_path(base)),
+    }
+    for fmt in ("json", "npy"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--measure", fmt, "--base", base],
+            check=True, capture_output=True, text=True
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{fmt:>5}: {sizes[fmt] / 1e6:8.1f} MB on disk, {result['records']} records in "
+              f"{result['seconds']:.3f}s, peak RSS {result['peak_rss_mb']:.0f} MB "
+              f"(+{result['rss_growth_mb']:.0f} MB while loading)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding store load time and memory")
+    parser.add_argument("--articles", type=int, default=10000, help="Synthetic corpus size")
+    parser.add_argument("--base", default=None, help="Existing store base path (skips synthetic corpus)")
+    parser.add_argument("--measure", choices=["json", "npy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.base)
+    elif args.base:
+        run(args.base)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            base = os.path.join(tmp, "article_embeddings")
+            make_corpus(base, args.articles)
+            run(base)
@@ -0,0 +1,164 @@
+# bench/encoder_backends.py
+#
+# Compares the query encoder backends: load time, single-query latency, batch
+# throughput and memory, and checks that every backend's vectors match the
+# torch reference within a cosine tolerance. Exits non-zero when a backend
+# drifts past its tolerance, so it doubles as the equivalence check for CI.
+# Each backend runs in a fresh subprocess so imports and RSS don't leak between them.
+#
+# Export the ONNX models first (python encoder_backends.py export), then run
+# from the backend directory:
+#     python bench/encoder_backends.py --threads 1 --queries 200
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+from encoder_backends import ENCODER_BACKENDS, ENCODER_MODEL_DIR, MODEL_NAME
+from embeddings.embedding_store import iter_metadata
+
+# Minimum cosine similarity to the torch vector for the same text
+TOLERANCES = {"torch": 1.0 - 1e-6, "onnx": 0.9999, "onnx-int8": 0.98}
+
+QUERIES = [
+    "What happened with Airbus deliveries?",
+    "Who is likely to become the next pope?",
+    "Will Mexico's central bank cut rates again?",
+    "EU car CO2 emission targets",
+    "latest news",
+]
+
+def sample_texts():
+    """Query-like strings plus titles and passages from the repo corpus, short and long"""
+    texts = list(QUERIES)
+    for meta in iter_metadata():
+        texts.append(meta["title"])
+        texts.append(meta["text"])
+    return texts
+
+def memory_mb():
+    """(current, peak) resident set size of this process"""
+    current = peak = 0.0
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return current, peak
+
+def measure(args):
+    """Load one backend, time it and save its vectors for the sample texts"""
+    started = time.perf_counter()
+    if args.measure == "torch":
+        from encoder_backends import TorchEncoder
+        encoder = TorchEncoder(args.model, num_threads=args.threads)
+    else:
+        from encoder_backends import OnnxEncoder
+        encoder = OnnxEncoder(args.model_dir, quantized=args.measure == "onnx-int8", num_threads=args.threads)
+    load_seconds = time.perf_counter() - started
+    rss_loaded, _ = memory_mb()
+
+    texts = sample_texts()
+    np.save(args.vectors, encoder.encode(texts))
+
+    encoder.encode([QUERIES[0]])  # warm up
+    latencies = []
+    for i in range(args.queries):
+        started = time.perf_counter()
+        encoder.encode([QUERIES[i % len(QUERIES)]])
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    batch = [texts[i % len(texts)] for i in range(args.batch_size)]
+    rounds = max(1, args.queries // args.batch_size)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        encoder.encode(batch)
+    throughput = rounds * args.batch_size / (time.perf_counter() - started)
+
+    rss, peak = memory_mb()
+    print(json.dumps({
+        "load_seconds": load_seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+        "texts_per_second": throughput,
+        "rss_loaded_mb": rss_loaded,
+        "rss_mb": rss,
+        "peak_rss_mb": peak,
+    }))
+
+def run(args):
+    results, vectors = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            path = os.path.join(tmp, f"{backend}.npy")
+            out = subprocess.run(
+                [sys.executable, __file__, "--measure", backend, "--vectors", path,
+                 "--model", args.model, "--model-dir", args.model_dir, "--threads", str(args.threads),
+                 "--queries", str(args.queries), "--batch-size", str(args.batch_size)],
+                capture_output=True, text=True
+            )
+            if out.returncode != 0:
+                print(f"{backend}: failed to run\n{out.stderr.strip().splitlines()[-1] if out.stderr.strip() else ''}")
+                continue
+            results[backend] = json.loads(out.stdout.strip().splitlines()[-1])
+            vectors[backend] = np.load(path)
+
+    threads = args.threads or "default"
+    print(f"Threads per encoder: {threads}; batch size {args.batch_size}")
+    print(f"{'backend':>10} {'load s':>7} {'p50 ms':>7} {'p95 ms':>7} {'texts/s':>8} {'RSS MB':>7} {'peak MB':>8} {'min cos':>8}")
+    reference = vectors.get("torch")
+    failures = []
+    for backend, r in results.items():
+        similarity = "-"
+        if reference is not None:
+            worst = float(np.min(np.sum(reference * vectors[backend], axis=1) / (
+                np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors[backend], axis=1))))
+            similarity = f"{worst:.5f}"
+            if worst < TOLERANCES[backend]:
+                failures.append(f"{backend} min cosine {worst:.5f} < {TOLERANCES[backend]}")
+        print(f"{backend:>10} {r['load_seconds']:>7.2f} {r['p50_ms']:>7.2f} {r['p95_ms']:>7.2f} "
+              f"{r['texts_per_second']:>8.1f} {r['rss_mb']:>7.0f} {r['peak_rss_mb']:>8.0f} {similarity:>8}")
+
+    if reference is None:
+        print("torch backend unavailable; equivalence not checked")
+    missing = [backend for backend in args.backends if backend not in results]
+    if failures or missing:
+        for failure in failures:
+            print(f"❌ {failure}")
+        if missing:
+            print(f"❌ Could not run: {', '.join(missing)}")
+        sys.exit(1)
+    print("✅ All backends within tolerance")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark and cross-check the query encoder backends")
+    parser.add_argument("--backends", nargs="+", choices=ENCODER_BACKENDS, default=list(ENCODER_BACKENDS))
+    parser.add_argument("--model", default=MODEL_NAME, help="Model for the torch backend")
+    parser.add_argument("--model-dir", default=ENCODER_MODEL_DIR, help="ONNX export directory")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads per encoder (0 = library default)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--measure", choices=ENCODER_BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args)
+    else:
+        run(args)
@@ -0,0 +1,148 @@
+# bench/fake_gemini.py
+#
+# A local stand-in for Gemini's REST API (generateContent and
+# streamGenerateContent?alt=sse) with adjustable latency, generation speed and
+# failures, so the client and the app can be exercised without an API key or quota.
+#
+# Run it and point the backend at it:
+#     python bench/fake_gemini.py --port 8089 --latency 0.5
+#     GEMINI_API_BASE=http://127.0.0.1:8089/v1beta uvicorn main:app
+# or start it in-process with FakeGemini(...).start(), as bench/gemini_client_check.py does.
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeGemini:
+    """
+    Answers every prompt with `answer` after `latency` seconds, plus one second
+    per `tokens_per_second` words when that is set (streamed answers pace their
+    pieces at that rate). Set `status` to e.g. 429 or 503 to fail calls (with
+    `retry_after` on 429s), or `hang` to never answer. Counts calls and the most
+    that were in flight at once.
+    """
+
+    def __init__(self, latency=0.0, answer="Fake Gemini answer.", stream_pieces=4, tokens_per_second=None,
+                 host="127.0.0.1", port=0):
+        self.latency = latency
+        self.answer = answer
+        self.stream_pieces = stream_pieces
+        self.tokens_per_second = tokens_per_second
+        self.status = 200
+        self.retry_after = None
+        self.hang = False
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.server = ThreadingHTTPServer((host, port), make_handler(self))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def generation_time(self, words):
+        return words / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def reset(self, **settings):
+        with self.lock:
+            self.calls = 0
+            self.prompts = []
+            self.max_in_flight = 0
+        for name, value in settings.items():
+            setattr(self, name, value)
+
+def _candidate(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = "".join(part.get("text", "") for c in body.get("contents", []) for part in c.get("parts", []))
+            with fake.lock:
+                fake.calls += 1
+                fake.prompts.append(prompt)
+                fake.in_flight += 1
+                fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+            try:
+                if fake.hang:
+                    time.sleep(3600)
+                time.sleep(fake.latency)
+                if fake.status != 200:
+                    self.send_json(fake.status, {"error": {"code": fake.status, "message": "fake failure"}},
+                                   {"Retry-After": str(fake.retry_after)} if fake.retry_after is not None else {})
+                elif ":streamGenerateContent" in self.path:
+                    self.send_stream(fake.answer)
+                elif ":generateContent" in self.path:
+                    time.sleep(fake.generation_time(len(fake.answer.split())))
+                    self.send_json(200, _candidate(fake.answer))
+                else:
+                    self.send_json(404, {"error": {"code": 404, "message": "not found"}})
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                with fake.lock:
+                    fake.in_flight -= 1
+
+        def send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_stream(self, text):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = text.split(" ")
+            step = max(1, -(-len(words) // fake.stream_pieces))
+            for start in range(0, len(words), step):
+                time.sleep(fake.generation_time(len(words[start:start + step])))
+                piece = " ".join(words[start:start + step]) + (" " if start + step < len(words) else "")
+                self.wfile.write(f"data: {json.dumps(_candidate(piece))}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+            self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake Gemini REST API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each answer")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Generation speed, in words")
+    parser.add_argument("--status", type=int, default=200, help="HTTP status to fail every call with")
+    args = parser.parse_args()
+
+    fake = FakeGemini(latency=args.latency, tokens_per_second=args.tokens_per_second, port=args.port)
+    fake.status = args.status
+    print(f"Fake Gemini on {fake.base_url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,107 @@
+# bench/gemini_client_check.py
+#
+# Runs GeminiClient against bench/fake_gemini.py and checks that:
+#   - concurrent identical prompts share one upstream call
+#   - upstream concurrency never exceeds max_concurrency
+#   - a hung call is cut off at the timeout and answered locally
+#   - after `threshold` failures the breaker opens, and requests are answered
+#     locally at once without calling upstream
+#   - a 429's Retry-After keeps the breaker open at least that long
+#   - once the API recovers, a trial call closes the breaker again
+#   - streaming works, and falls back locally when the API fails
+# Exits non-zero when a check fails.
+#
+# Run from the backend directory:
+#     python bench/gemini_client_check.py
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_gemini import FakeGemini
+from gemini_client import GeminiClient, CircuitBreaker, is_fallback_response
+
+PASSAGES = [{"title": "Oil", "text": "Oil prices rose as OPEC cut output.", "url": "https://example.com/oil"}]
+
+async def run(fake, failures):
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        if not ok:
+            failures.append(message)
+
+    client = GeminiClient(base_url=fake.base_url, api_key="fake", max_concurrency=4, timeout=1.0,
+                          breaker=CircuitBreaker(threshold=3, cooldown=0.5))
+
+    fake.reset(latency=0.2)
+    answers = await asyncio.gather(*(client.answer("oil prices", PASSAGES) for _ in range(20)))
+    check(fake.calls == 1 and all(a == fake.answer for a in answers),
+          f"20 identical concurrent prompts made {fake.calls} upstream call(s)")
+
+    fake.reset(latency=0.2)
+    started = time.perf_counter()
+    await asyncio.gather(*(client.answer(f"question {i}", PASSAGES) for i in range(16)))
+    elapsed = time.perf_counter() - started
+    check(fake.max_in_flight <= 4 and fake.calls == 16,
+          f"16 distinct prompts peaked at {fake.max_in_flight} in flight (limit 4), {elapsed:.2f}s")
+
+    fake.reset(hang=True)
+    started = time.perf_counter()
+    answer = await client.answer("hung call", PASSAGES)
+    elapsed = time.perf_counter() - started
+    check(is_fallback_response(answer) and elapsed < 1.5, f"Hung call fell back locally after {elapsed:.2f}s")
+
+    fake.reset(hang=False, latency=0.0, status=503)
+    for i in range(2):
+        await client.answer(f"failing {i}", PASSAGES)
+    check(client.breaker.state == "open", f"Breaker {client.breaker.state} after 3 failures (threshold 3)")
+
+    calls_before = fake.calls
+    started = time.perf_counter()
+    answers = await asyncio.gather(*(client.answer(f"while open {i}", PASSAGES) for i in range(50)))
+    elapsed = time.perf_counter() - started
+    check(fake.calls == calls_before and all(is_fallback_response(a) for a in answers) and elapsed < 0.1,
+          f"50 requests with the breaker open answered locally in {elapsed * 1000:.1f}ms, "
+          f"{fake.calls - calls_before} upstream calls")
+
+    fake.reset(status=200)
+    await asyncio.sleep(0.6)
+    answer = await client.answer("after recovery", PASSAGES)
+    check(answer == fake.answer and client.breaker.state == "closed",
+          f"Trial call after the cooldown closed the breaker ({client.breaker.state})")
+
+    fake.reset(status=429, retry_after=2)
+    await client.answer("rate limited", PASSAGES)
+    fake.reset(status=200)
+    await asyncio.sleep(0.6)
+    answer = await client.answer("still inside retry-after", PASSAGES)
+    check(is_fallback_response(answer) and fake.calls == 0,
+          "A 429 with Retry-After: 2 kept the breaker open past the 0.5s cooldown")
+    client.breaker.open_until = 0.0
+
+    fake.reset(status=200, latency=0.0)
+    pieces = [piece async for piece in client.answer_stream("stream me", PASSAGES)]
+    check(len(pieces) > 1 and "".join(pieces) == fake.answer, f"Streamed answer arrived in {len(pieces)} pieces")
+
+    fake.reset(status=500)
+    pieces = [piece async for piece in client.answer_stream("stream failure", PASSAGES)]
+    check(is_fallback_response("".join(pieces)), "Failed stream fell back to the local answer")
+
+    print(f"Client stats: {client.stats()}")
+    await client.aclose()
+
+def main():
+    fake = FakeGemini(answer="Oil prices rose after OPEC agreed to cut output further.").start()
+    failures = []
+    try:
+        asyncio.run(run(fake, failures))
+    finally:
+        fake.stop()
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
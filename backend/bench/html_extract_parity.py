@@ -0,0 +1,112 @@
+# bench/html_extract_parity.py
+#
+# Checks the lxml extractor against the original BeautifulSoup one on a corpus
+# of saved article pages, then compares their speed: pages/sec for each, the lxml
+# one with and without the class prefilter (so the prefilter's saving shows apart
+# from the parser's), and the lxml one through a process pool.
+#
+# html.parser does not build the tree the HTML spec (and lxml) does for broken
+# markup: an unclosed <p> swallows the paragraphs after it, so the original
+# extractor repeats their text. Where the outputs differ, the reference is run
+# again on lxml's tree; if that matches, the difference is the parser's and is
+# reported but allowed. Any other difference exits non-zero, so this doubles as
+# the parity test when selectors change.
+#
+# Fixtures are named <host>__<name>.html so each page gets a URL on its host;
+# point --dir at a folder of real saved pages to check those too. The two
+# www.mixed-news.com pages share a template, but only one has an article body,
+# so each must get its own selector.
+#
+# Run from the backend directory (needs beautifulsoup4 for the reference):
+#     python bench/html_extract_parity.py --rounds 20 --workers 4
+
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "data"))
+
+from html_extract import extract_article, extract_article_bs4, extract_pages
+
+FIXTURES_DIR = os.path.join(BACKEND_DIR, "bench", "fixtures", "html")
+FIELDS = ("title", "date_publish", "text", "url", "author")
+
+def load_pages(directory):
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith((".html", ".htm")):
+            continue
+        stem = name.rsplit(".", 1)[0]
+        host, _, slug = stem.partition("__") if "__" in stem else ("fixtures.local", "", stem)
+        with open(os.path.join(directory, name), "rb") as f:
+            pages.append({"url": f"https://{host}/{slug}/", "html": f.read(), "name": name})
+    return pages
+
+def first_difference(a, b):
+    i = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+    return f"at char {i}: {a[max(0, i - 30):i + 30]!r} vs {b[max(0, i - 30):i + 30]!r}"
+
+def pages_per_second(fn, pages, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            fn(page["html"], page["url"])
+    return rounds * len(pages) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check lxml extraction parity with BeautifulSoup and compare speed")
+    parser.add_argument("--dir", default=FIXTURES_DIR, help="Folder of saved .html pages")
+    parser.add_argument("--rounds", type=int, default=10, help="Passes over the corpus when timing")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Processes for the pool run")
+    args = parser.parse_args()
+
+    pages = load_pages(args.dir)
+    if not pages:
+        sys.exit(f"No .html files in {args.dir}")
+    total_kb = sum(len(page["html"]) for page in pages) / 1024
+
+    mismatches, tree_differences = [], []
+    for page in pages:
+        expected = extract_article_bs4(page["html"], page["url"])
+        got = extract_article(page["html"], page["url"])
+        same_tree = None
+        for field in FIELDS:
+            if got[field] == expected[field]:
+                continue
+            same_tree = same_tree or extract_article_bs4(page["html"], page["url"], parser="lxml")
+            difference = f"{page['name']} {field} {first_difference(got[field], expected[field])}"
+            (tree_differences if got[field] == same_tree[field] else mismatches).append(difference)
+        # Skipping selectors by class must never change which one wins
+        unfiltered = extract_article(page["html"], page["url"], prefilter=False)
+        mismatches.extend(f"{page['name']} {field} changes without the class prefilter"
+                          for field in FIELDS if unfiltered[field] != got[field])
+
+    bs4_rate = pages_per_second(extract_article_bs4, pages, max(1, args.rounds // 5))
+    cascade_rate = pages_per_second(lambda html, url: extract_article(html, url, prefilter=False), pages, args.rounds)
+    lxml_rate = pages_per_second(extract_article, pages, args.rounds)
+
+    batch = pages * args.rounds * args.workers
+    started = time.perf_counter()
+    extracted = sum(1 for _ in extract_pages(({"url": p["url"], "html": p["html"]} for p in batch), workers=args.workers))
+    pool_rate = extracted / (time.perf_counter() - started)
+
+    print(f"{len(pages)} pages, {total_kb / len(pages):.0f} KB average")
+    print(f"{'BeautifulSoup html.parser':>28}: {bs4_rate:8.0f} pages/s")
+    print(f"{'lxml, full cascade':>28}: {cascade_rate:8.0f} pages/s ({cascade_rate / bs4_rate:.1f}x)")
+    print(f"{'lxml + class prefilter':>28}: {lxml_rate:8.0f} pages/s ({lxml_rate / bs4_rate:.1f}x, "
+          f"{lxml_rate / cascade_rate:.2f}x the full cascade)")
+    print(f"{f'lxml, {args.workers} processes':>28}: {pool_rate:8.0f} pages/s (includes pool start-up)")
+
+    for difference in tree_differences:
+        print(f"⚠️  html.parser tree differs: {difference}")
+    if mismatches:
+        for mismatch in mismatches:
+            print(f"❌ {mismatch}")
+        sys.exit(1)
+    print(f"✅ All {len(pages)} pages match the BeautifulSoup extractor"
+          + (f" ({len(tree_differences)} fields differ only by parse tree)" if tree_differences else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+# bench/load_test.py
+#
+# Load and latency benchmark for the API. It starts the app under uvicorn in a
+# subprocess with:
+#   - bench/fake_gemini.py in place of Gemini (--llm-latency, --tokens-per-second)
+#   - the in-repo embeddings/article_embeddings.json corpus converted into a
+#     temporary store for the in-process NumPy + BM25 retriever (no Qdrant)
+#   - fakeredis in place of Redis
+# It then replays a seeded query mix built from the corpus titles at a fixed
+# concurrency. The mix covers /search, /chat with follow-up turns in the same
+# session, and /chat/stream, and a share of its queries repeat.
+#
+# The report gives:
+#   - p50/p95/p99 latency overall and per endpoint, and throughput;
+#   - a per-stage breakdown from the Server-Timing headers and streamed `done`
+#     events, plus the cache hit rates from /stats;
+#   - the server's peak RSS.
+# --save-baseline writes the results to a JSON file. --baseline compares a run
+# against one and exits non-zero when latency, throughput or memory is worse
+# by more than --tolerance.
+#
+# Run from the backend directory (needs fakeredis):
+#     python bench/load_test.py --requests 400 --concurrency 16 --save-baseline bench/baseline.json
+#     python bench/load_test.py --requests 400 --concurrency 16 --baseline bench/baseline.json
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from embeddings.bm25_index import build_index, tokenize
+from embeddings.embedding_store import convert_json, json_path
+
+CORPUS = json_path()
+# Latency changes smaller than this are scheduler noise, whatever the percentage
+NOISE_FLOOR_MS = 5.0
+ENDPOINTS = ("search", "chat", "stream")
+ANSWER = ("Based on the reports, the decision followed weeks of talks between the parties and was welcomed by "
+          "markets, although analysts cautioned that the details remain unclear and that further announcements "
+          "are expected in the coming days as officials review the impact on trade, prices and jobs.")
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+def summarize(values):
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+            "mean": sum(values) / len(values) if values else 0.0, "count": len(values)}
+
+# --- Server side -------------------------------------------------------------
+
+def build_store(directory):
+    """The JSON corpus as a binary store plus BM25 index under `directory`; returns its base path"""
+    base = os.path.join(directory, "article_embeddings")
+    convert_json(CORPUS, base)
+    build_index(base)
+    return base
+
+def serve(args):
+    """Run the app with fake Redis and the benchmark store (started by the harness as a subprocess)"""
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("The load test needs fakeredis: pip install fakeredis")
+    import uvicorn
+
+    import session_manager
+    session_manager.r = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    import main
+    from retriever import NumpyRetriever, BM25Retriever, HybridRetriever
+    main.retriever = NumpyRetriever(args.store)
+    main.hybrid_retriever = HybridRetriever(main.retriever, BM25Retriever(args.store, dense=main.retriever))
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def peak_rss_mb(pid):
+    """Peak resident memory of a running process, where the platform reports it"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process(pid).memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1e6
+    except Exception:
+        return None
+
+# --- Workload ----------------------------------------------------------------
+
+def load_titles():
+    with open(CORPUS, "r", encoding="utf-8") as f:
+        return sorted({record["title"] for record in json.load(f) if record.get("title")})
+
+def make_workload(titles, num_requests, mix, repeat_rate, follow_up_rate, seed):
+    """
+    A reproducible list of (endpoint, query, session) requests. Fresh queries are
+    titles or keyword questions about them; `repeat_rate` of them re-ask earlier
+    queries, popular ones more often; chat turns continue a session with a
+    follow-up question `follow_up_rate` of the time.
+    """
+    rng = random.Random(seed)
+    keywords = [[w for w in tokenize(title) if len(w) > 2] or title.split() for title in titles]
+    templates = ["{title}", "latest on {a} {b}", "What happened with {a} {b}?", "{a} {b} {c}",
+                 "why is {a} in the news"]
+    follow_ups = ["what about {a}?", "why did they do that?", "and how did markets react?", "what happens next?",
+                  "how does it affect {a}?"]
+    endpoints, weights = zip(*mix.items())
+    issued, sessions, requests = [], [], []
+
+    for _ in range(num_requests):
+        endpoint = rng.choices(endpoints, weights)[0]
+        words = rng.choice(keywords)
+        fill = {"title": rng.choice(titles), "a": rng.choice(words), "b": rng.choice(words), "c": rng.choice(words)}
+
+        if endpoint != "search" and sessions and rng.random() < follow_up_rate:
+            requests.append((endpoint, rng.choice(follow_ups).format(**fill), rng.choice(sessions)))
+            continue
+        if issued and rng.random() < repeat_rate:
+            # Zipf-like: earlier (popular) queries are repeated more
+            query = issued[min(len(issued) - 1, int(rng.paretovariate(1.2)) - 1)]
+        else:
+            query = rng.choice(templates).format(**fill)
+            issued.append(query)
+        session = None
+        if endpoint != "search":
+            session = f"load-{len(sessions)}"
+            sessions.append(session)
+        requests.append((endpoint, query, session))
+    return requests
+
+# --- Client side -------------------------------------------------------------
+
+def parse_server_timing(header):
+    timings = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if name and name != "total" and params.startswith("dur="):
+            timings[name] = float(params[4:])
+    return timings
+
+async def send(http, endpoint, query, session):
+    """One request; returns (status, latency, time to first token or None, stage timings)"""
+    started = time.perf_counter()
+    if endpoint == "search":
+        response = await http.get("/search", params={"query": query})
+        return response.status_code, time.perf_counter() - started, None, parse_server_timing(
+            response.headers.get("server-timing"))
+    if endpoint == "chat":
+        response = await http.post("/chat", data={"query": query, "session_id": session})
+        return response.status_code, time.perf_counter() - started, None, parse_server_timing(
+            response.headers.get("server-timing"))
+
+    first_token, timings, event = None, {}, None
+    async with http.stream("POST", "/chat/stream", data={"query": query, "session_id": session}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+            elif line.startswith("data:") and event == "done":
+                timings = json.loads(line[5:]).get("timings", {})
+            elif line.startswith("data:") and event == "error":
+                return 500, time.perf_counter() - started, first_token, timings
+    return response.status_code, time.perf_counter() - started, first_token, timings
+
+async def run_load(base_url, workload, concurrency, warmup):
+    """Send the first `warmup` requests one by one, then the rest from `concurrency` closed-loop workers"""
+    import httpx
+
+    results = []
+    queue = list(reversed(workload[warmup:]))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as http:
+        for endpoint, query, session in workload[:warmup]:
+            await send(http, endpoint, query, session)
+
+        async def worker():
+            while queue:
+                endpoint, query, session = queue.pop()
+                try:
+                    status, latency, ttft, timings = await send(http, endpoint, query, session)
+                except Exception as e:
+                    print(f"Warning: Request failed: {e}")
+                    status, latency, ttft, timings = 0, 0.0, None, {}
+                results.append({"endpoint": endpoint, "status": status, "latency": latency, "ttft": ttft,
+                                "timings": timings})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stats = (await http.get("/stats")).json()
+    return results, elapsed, stats
+
+def wait_ready(base_url, process, timeout=180):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"The app exited during startup with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    sys.exit(f"The app was not ready within {timeout}s")
+
+# --- Report ------------------------------------------------------------------
+
+def build_report(results, elapsed, stats, rss, config):
+    ok = [r for r in results if r["status"] == 200]
+    report = {
+        "config": config,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "latency_ms": summarize([r["latency"] * 1000 for r in ok]),
+        "endpoints": {},
+        "stages_ms": {},
+        "peak_rss_mb": rss,
+        "embedding_cache_hit_rate": stats.get("embedding_cache", {}).get("hit_rate"),
+        "answer_cache_hit_rate": stats.get("answer_cache", {}).get("hit_rate"),
+        "gemini_calls": stats.get("gemini", {}).get("calls"),
+        "gemini_coalesced": stats.get("gemini", {}).get("coalesced"),
+    }
+    for endpoint in ENDPOINTS:
+        chosen = [r for r in ok if r["endpoint"] == endpoint]
+        if chosen:
+            report["endpoints"][endpoint] = summarize([r["latency"] * 1000 for r in chosen])
+            ttfts = [r["ttft"] * 1000 for r in chosen if r["ttft"] is not None]
+            if ttfts:
+                report["endpoints"][endpoint]["first_token_p50"] = percentile(ttfts, 50)
+    stages = {}
+    for r in ok:
+        for stage, ms in r["timings"].items():
+            stages.setdefault(stage, []).append(ms)
+    report["stages_ms"] = {stage: summarize(values) for stage, values in stages.items()}
+    return report
+
+def print_report(report):
+    latency = report["latency_ms"]
+    print(f"\n{report['requests']} requests, {report['errors']} errors, "
+          f"{report['throughput_rps']:.1f} req/s at concurrency {report['config']['concurrency']}")
+    print(f"{'':>14} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}   (ms)")
+    print(f"{'all':>14} {latency['p50']:9.1f} {latency['p95']:9.1f} {latency['p99']:9.1f} {latency['mean']:9.1f}")
+    for endpoint, s in report["endpoints"].items():
+        extra = f"   first token p50 {s['first_token_p50']:.1f}" if "first_token_p50" in s else ""
+        print(f"{endpoint:>14} {s['p50']:9.1f} {s['p95']:9.1f} {s['p99']:9.1f} {s['mean']:9.1f}{extra}")
+    print("Stages:")
+    for stage, s in sorted(report["stages_ms"].items(), key=lambda item: -item[1]["mean"]):
+        print(f"{stage:>14} {s['p50']:9.1f} {s['p95']:9.1f} {s['p99']:9.1f} {s['mean']:9.1f}   ({s['count']} spans)")
+    rss = report["peak_rss_mb"]
+    print(f"Peak RSS: {f'{rss:.0f} MB' if rss is not None else 'n/a'}; "
+          f"embedding cache hit rate {report['embedding_cache_hit_rate'] or 0:.2f}, "
+          f"answer cache hit rate {report['answer_cache_hit_rate'] or 0:.2f}, "
+          f"{report['gemini_calls']} Gemini calls ({report['gemini_coalesced']} coalesced)")
+
+def compare(report, baseline, tolerance):
+    """Print each headline metric against the baseline; returns the regressions"""
+    checks = [(f"latency {q}", report["latency_ms"][q], baseline["latency_ms"][q], "lower", NOISE_FLOOR_MS)
+              for q in ("p50", "p95", "p99")]
+    checks.append(("throughput", report["throughput_rps"], baseline["throughput_rps"], "higher", 0.0))
+    if report["peak_rss_mb"] is not None and baseline.get("peak_rss_mb"):
+        checks.append(("peak RSS", report["peak_rss_mb"], baseline["peak_rss_mb"], "lower", 0.0))
+
+    if report["config"] != baseline.get("config"):
+        print("⚠️  The baseline was recorded with different settings; the comparison may not be fair")
+    regressions = []
+    print(f"\nAgainst the baseline (tolerance {tolerance:.0%}):")
+    for name, value, base, better, floor in checks:
+        change = (value - base) / base if base else 0.0
+        if better == "lower":
+            worse = change > tolerance and value - base > floor
+        else:
+            worse = change < -tolerance
+        print(f"{'❌' if worse else '✅'} {name}: {value:.1f} vs {base:.1f} ({change:+.1%})")
+        if worse:
+            regressions.append(name)
+    if report["errors"] > baseline.get("errors", 0):
+        print(f"❌ errors: {report['errors']} vs {baseline.get('errors', 0)}")
+        regressions.append("errors")
+    for stage, s in report["stages_ms"].items():
+        base = baseline.get("stages_ms", {}).get(stage)
+        if base and base["p95"] and (s["p95"] - base["p95"]) / base["p95"] > tolerance \
+                and s["p95"] - base["p95"] > NOISE_FLOOR_MS:
+            print(f"⚠️  stage {stage} p95: {s['p95']:.1f} vs {base['p95']:.1f} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API against local stand-ins and compare to a baseline")
+    parser.add_argument("--requests", type=int, default=300, help="Measured requests")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent one by one before measuring")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default="search=0.3,chat=0.5,stream=0.2", help="Endpoint weights")
+    parser.add_argument("--repeat-rate", type=float, default=0.3, help="Share of queries re-asked")
+    parser.add_argument("--follow-up-rate", type=float, default=0.3, help="Share of chat turns that are follow-ups")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Stub Gemini seconds before answering")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Stub Gemini generation speed")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against this JSON file and exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change before failing")
+    parser.add_argument("--output", help="Also write the full report as JSON here")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--store", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    mix = {name: float(weight) for name, weight in (part.split("=") for part in args.mix.split(","))}
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        sys.exit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    config = {key: getattr(args, key) for key in
+              ("requests", "warmup", "concurrency", "mix", "repeat_rate", "follow_up_rate", "llm_latency",
+               "tokens_per_second", "seed")}
+
+    from fake_gemini import FakeGemini
+    fake = FakeGemini(latency=args.llm_latency, tokens_per_second=args.tokens_per_second, answer=ANSWER,
+                      stream_pieces=8).start()
+    workload = make_workload(load_titles(), args.warmup + args.requests, mix, args.repeat_rate,
+                             args.follow_up_rate, args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = build_store(directory)
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = {**os.environ, "RETRIEVER": "numpy", "GEMINI_API_BASE": fake.base_url, "EMBEDDING_CACHE_REDIS": "0"}
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--store", store,
+                                    "--port", str(port)], cwd=BACKEND_DIR, env=env)
+        try:
+            wait_ready(base_url, process)
+            print(f"App ready; sending {args.warmup} warmup and {args.requests} measured requests "
+                  f"at concurrency {args.concurrency}")
+            results, elapsed, stats = asyncio.run(run_load(base_url, workload, args.concurrency, args.warmup))
+            rss = peak_rss_mb(process.pid)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            fake.stop()
+
+    report = build_report(results, elapsed, stats, rss, config)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# bench/quantization_recall.py
+#
+# Recall@k and latency of scalar (int8) and binary quantization against exact
+# float32 search, with and without full-precision rescoring.
+#
+# The corpus is the article embeddings in the repo (binary store, or the legacy
+# article_embeddings.json). It holds only a handful of rows, so --size grows it
+# with noisy random mixtures of the real vectors; queries are drawn the same way,
+# so they sit in the same region of the space as real questions about the corpus.
+#
+# The in-process NumPy engine always runs. Qdrant runs too when a server is
+# reachable at --qdrant-host/--qdrant-port; each configuration gets a
+# throwaway collection that is dropped afterwards.
+#
+# Run from the backend directory:
+#     python bench/quantization_recall.py --size 100000 --queries 200 --k 10
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from embeddings.embedding_store import DEFAULT_BASE, iter_any, save_store
+from retriever import NumpyRetriever
+
+# (label, quantization, rescore)
+CONFIGS = [
+    ("float32", "none", True),
+    ("int8", "scalar", False),
+    ("int8+rescore", "scalar", True),
+    ("binary", "binary", False),
+    ("binary+rescore", "binary", True),
+]
+
+def unit(rows):
+    return rows / np.linalg.norm(rows, axis=-1, keepdims=True)
+
+def load_corpus(base):
+    vectors = np.asarray([vector for _, vector in iter_any(base)], dtype=np.float32)
+    if not len(vectors):
+        raise SystemExit(f"No embeddings found at {base}")
+    return unit(vectors)
+
+def expand(seeds, size, noise, rng):
+    """
+    Random sparse mixtures of the seed vectors plus noise, so the expanded corpus
+    spreads through the region the real embeddings occupy instead of forming tight
+    clusters of near-duplicates
+    """
+    weights = rng.dirichlet(np.full(len(seeds), 0.3), size=size).astype(np.float32)
+    return unit(weights @ seeds + rng.standard_normal((size, seeds.shape[1]), dtype=np.float32) * noise)
+
+def recall(found, truth):
+    return len(set(found) & set(truth)) / len(truth)
+
+def summarize(samples, recalls):
+    samples = sorted(samples)
+    return {
+        "recall": statistics.fmean(recalls),
+        "p50": statistics.median(samples) * 1000,
+        "p95": samples[max(int(len(samples) * 0.95) - 1, 0)] * 1000,
+    }
+
+def bench_numpy(base, queries, k, oversampling):
+    truth, results = None, {}
+    for label, quantization, rescore in CONFIGS:
+        engine = NumpyRetriever(base, quantization=quantization, oversampling=oversampling, rescore=rescore).load()
+        engine.top_k(queries[0], k)  # warm up
+        samples, found = [], []
+        for query in queries:
+            started = time.perf_counter()
+            rows, _ = engine.top_k(query, k)
+            samples.append(time.perf_counter() - started)
+            found.append(rows.tolist())
+        if truth is None:
+            truth = found
+        footprint = engine.quantizer.nbytes if engine.quantizer is not None else engine.matrix.nbytes
+        results[label] = {**summarize(samples, [recall(f, t) for f, t in zip(found, truth)]),
+                          "mb": footprint / 1e6}
+    return results
+
+def bench_qdrant(host, port, vectors, queries, k, oversampling):
+    from qdrant_client import QdrantClient
+    from qdrant_client.http.models import (Distance, VectorParams, SearchParams,
+                                           QuantizationSearchParams, PointStruct)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vector_db"))
+    from store_in_qdrant import quantization_config
+
+    client = QdrantClient(host=host, port=port, timeout=120)
+    try:
+        client.get_collections()
+    except Exception:
+        print(f"Qdrant not reachable at {host}:{port}; skipping the Qdrant run")
+        return None
+
+    truth, results = None, {}
+    for quantization in ("none", "scalar", "binary"):
+        collection_name = f"bench_quantization_{quantization}"
+        if client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+        config = quantization_config(quantization)
+        client.create_collection(
+            collection_name,
+            vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE, on_disk=config is not None),
+            quantization_config=config
+        )
+        for start in range(0, len(vectors), 1000):
+            client.upsert(collection_name, [
+                PointStruct(id=start + i, vector=vector.tolist())
+                for i, vector in enumerate(vectors[start:start + 1000])
+            ])
+
+        rescore_options = [True] if quantization == "none" else [False, True]
+        for rescore in rescore_options:
+            label = "float32" if quantization == "none" else f"{quantization}{'+rescore' if rescore else ''}"
+            params = None if quantization == "none" else SearchParams(
+                quantization=QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+            )
+            samples, found = [], []
+            for query in queries:
+                started = time.perf_counter()
+                points = client.query_points(collection_name, query=query.tolist(), limit=k,
+                                             search_params=params).points
+                samples.append(time.perf_counter() - started)
+                found.append([point.id for point in points])
+            if truth is None:
+                truth = found
+            results[label] = summarize(samples, [recall(f, t) for f, t in zip(found, truth)])
+        client.delete_collection(collection_name)
+    return results
+
+def report(backend, results, k):
+    for label, r in results.items():
+        memory = f"{r['mb']:>9.1f}" if "mb" in r else f"{'-':>9}"
+        print(f"{backend:>7} {label:>15} {r['recall']:>10.3f} {r['p50']:>8.2f} {r['p95']:>8.2f} {memory}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall@k and latency of quantized vector search")
+    parser.add_argument("--base", default=DEFAULT_BASE, help="Embedding store to draw the corpus from")
+    parser.add_argument("--size", type=int, default=100000, help="Corpus rows after expansion")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.02, help="Std-dev of the noise added per dimension")
+    parser.add_argument("--oversampling", type=float, default=3.0)
+    parser.add_argument("--qdrant-host", default=os.getenv("QDRANT_HOST", "localhost"))
+    parser.add_argument("--qdrant-port", type=int, default=int(os.getenv("QDRANT_PORT", "6333")))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    seeds = load_corpus(args.base)
+    vectors = expand(seeds, args.size, args.noise, rng)
+    queries = expand(seeds, args.queries, args.noise, rng)
+    print(f"{len(seeds)} source embeddings expanded to {len(vectors)} rows; "
+          f"{len(queries)} queries, recall@{args.k}, oversampling {args.oversampling}")
+
+    print(f"{'backend':>7} {'config':>15} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8} {'index MB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, "article_embeddings")
+        save_store(vectors, [{"title": "", "url": f"https://example.com/{i}", "text": ""} for i in range(len(vectors))],
+                   base)
+        report("numpy", bench_numpy(base, queries, args.k, args.oversampling), args.k)
+
+    qdrant = bench_qdrant(args.qdrant_host, args.qdrant_port, vectors, queries, args.k, args.oversampling)
+    if qdrant is not None:
+        report("qdrant", qdrant, args.k)
+
+if __name__ == "__main__":
+    main()
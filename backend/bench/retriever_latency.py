@@ -0,0 +1,120 @@
+# bench/retriever_latency.py
+#
+# Query latency of the retrieval backends against corpus size. Builds a
+# synthetic chunked corpus per size (3 chunks per article, unit vectors),
+# then times grouped top-5 searches.
+#
+# The in-process NumPy engine always runs. Qdrant runs too when a server is
+# reachable at --qdrant-host/--qdrant-port; points go into a throwaway
+# collection that is dropped afterwards.
+#
+# Run from the backend directory:
+#     python bench/retriever_latency.py --sizes 1000 10000 100000 --queries 200
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from embeddings.embedding_store import save_store, iter_records
+from retriever import NumpyRetriever, QdrantRetriever
+
+DIM = 384
+CHUNKS_PER_ARTICLE = 3
+
+def make_corpus(base, size, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, DIM), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    chunks = [
+        {
+            "title": f"Article {i // CHUNKS_PER_ARTICLE}",
+            "url": f"https://example.com/{i // CHUNKS_PER_ARTICLE}",
+            "text": f"chunk {i}",
+            "chunk_index": i % CHUNKS_PER_ARTICLE
+        }
+        for i in range(size)
+    ]
+    save_store(vectors, chunks, base)
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        "p50": statistics.median(samples) * 1000,
+        "p95": samples[int(len(samples) * 0.95) - 1] * 1000,
+        "mean": statistics.fmean(samples) * 1000,
+    }
+
+async def time_queries(retriever, queries):
+    await retriever.search(queries[0].tolist())  # warm up
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        await retriever.search(query.tolist())
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+def qdrant_client(host, port):
+    from qdrant_client import QdrantClient
+    client = QdrantClient(host=host, port=port, timeout=60)
+    try:
+        client.get_collections()
+    except Exception:
+        return None
+    return client
+
+def load_into_qdrant(client, base, collection_name):
+    from qdrant_client.http.models import Distance, VectorParams, PointStruct, PayloadSchemaType
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    client.create_collection(collection_name, vectors_config=VectorParams(size=DIM, distance=Distance.COSINE))
+    client.create_payload_index(collection_name, "article_id", PayloadSchemaType.KEYWORD)
+    batch = []
+    for meta, vector in iter_records(base):
+        batch.append(PointStruct(id=meta["id"], vector=vector.tolist(), payload=meta))
+        if len(batch) == 1000:
+            client.upsert(collection_name, batch)
+            batch = []
+    if batch:
+        client.upsert(collection_name, batch)
+
+async def run(args):
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((args.queries, DIM), dtype=np.float32)
+    sync_qdrant = qdrant_client(args.qdrant_host, args.qdrant_port)
+    if sync_qdrant is None:
+        print(f"Qdrant not reachable at {args.qdrant_host}:{args.qdrant_port}; timing the NumPy engine only")
+
+    print(f"{'backend':>8} {'corpus':>9} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            base = os.path.join(tmp, "article_embeddings")
+            make_corpus(base, size)
+
+            results = {"numpy": await time_queries(NumpyRetriever(base).load(), queries)}
+
+            if sync_qdrant is not None:
+                from qdrant_client import AsyncQdrantClient
+                collection_name = "bench_retriever_latency"
+                load_into_qdrant(sync_qdrant, base, collection_name)
+                async_client = AsyncQdrantClient(host=args.qdrant_host, port=args.qdrant_port)
+                results["qdrant"] = await time_queries(QdrantRetriever(async_client, collection_name), queries)
+                sync_qdrant.delete_collection(collection_name)
+
+            for backend, r in results.items():
+                print(f"{backend:>8} {size:>9} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['mean']:>8.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval latency against corpus size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--qdrant-host", default=os.getenv("QDRANT_HOST", "localhost"))
+    parser.add_argument("--qdrant-port", type=int, default=int(os.getenv("QDRANT_PORT", "6333")))
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,123 @@
+# backend/context_builder.py
+
+import math
+import os
+import re
+from typing import List, Dict, Any
+
+from embeddings.chunking import split_sentences
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_PASSAGE_TOKENS = int(os.getenv("CONTEXT_PASSAGE_TOKENS", "400"))
+MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.95"))
+MIN_PASSAGE_TOKENS = 40
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = {
+    "the", "and", "for", "are", "was", "were", "what", "when", "where", "which", "who", "why",
+    "how", "with", "about", "from", "that", "this", "these", "those", "into", "has", "have",
+    "had", "did", "does", "its", "their", "there", "than", "then", "will", "would", "can",
+}
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count (~4 characters per token for English)"""
+    return math.ceil(len(text) / 4)
+
+def _passage_tokens(p: Dict[str, Any]) -> int:
+    return estimate_tokens(f"Title: {p['title']}\nText: {p['text']}\nURL: {p['url']}")
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def mmr_order(query_vector, vectors, lambda_=MMR_LAMBDA, duplicate_threshold=DUPLICATE_THRESHOLD):
+    """
+    Order candidates by maximal marginal relevance and drop near-duplicates.
+    Returns (selected indices in MMR order, indices dropped as duplicates).
+    """
+    relevance = [_cosine(query_vector, v) for v in vectors]
+    remaining = list(range(len(vectors)))
+    selected, duplicates = [], []
+    while remaining:
+        best, best_score, best_redundancy = None, -math.inf, 0.0
+        for i in remaining:
+            redundancy = max((_cosine(vectors[i], vectors[j]) for j in selected), default=0.0)
+            score = lambda_ * relevance[i] - (1 - lambda_) * redundancy
+            if score > best_score:
+                best, best_score, best_redundancy = i, score, redundancy
+        remaining.remove(best)
+        if best_redundancy >= duplicate_threshold:
+            duplicates.append(best)
+        else:
+            selected.append(best)
+    return selected, duplicates
+
+def _query_terms(query: str):
+    return {w for w in _WORD.findall(query.lower()) if len(w) > 2 and w not in _STOPWORDS}
+
+def trim_to_relevant(query: str, text: str, max_tokens: int) -> str:
+    """
+    Keep the sentences sharing the most terms with the query, within `max_tokens`,
+    in their original order. The lede gets a small bonus since news articles
+    front-load the key facts.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    terms = _query_terms(query)
+    sentences = split_sentences(text)
+    scored = sorted(
+        range(len(sentences)),
+        key=lambda i: (-(len(terms & set(_WORD.findall(sentences[i].lower()))) + (0.5 if i == 0 else 0.0)), i)
+    )
+
+    keep, used = set(), 0
+    for i in scored:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        keep.add(i)
+        used += cost
+    if not keep:
+        return text[:max_tokens * 4]
+    return " ".join(sentences[i] for i in sorted(keep))
+
+def build_context(query: str, query_vector, passages: List[Dict[str, Any]],
+                  token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  passage_tokens: int = CONTEXT_PASSAGE_TOKENS):
+    """
+    Pick a diverse, query-focused subset of passages that fits the token budget.
+    Passages need a "vector" for MMR; ones without fall back to retrieval order.
+    Returns the trimmed passages and a report of the prompt-size savings.
+    """
+    tokens_before = sum(_passage_tokens(p) for p in passages)
+
+    if query_vector is not None and passages and all(p.get("vector") for p in passages):
+        order, duplicates = mmr_order(query_vector, [p["vector"] for p in passages])
+    else:
+        order, duplicates = list(range(len(passages))), []
+
+    selected, remaining = [], token_budget
+    for i in order:
+        allowed = min(passage_tokens, remaining)
+        if allowed < MIN_PASSAGE_TOKENS:
+            break
+        p = passages[i]
+        text_tokens = allowed - _passage_tokens({**p, "text": ""})
+        if text_tokens <= 0:
+            break
+        trimmed = {**p, "text": trim_to_relevant(query, p["text"], text_tokens)}
+        remaining -= _passage_tokens(trimmed)
+        selected.append(trimmed)
+
+    report = {
+        "passages_retrieved": len(passages),
+        "passages_used": len(selected),
+        "duplicates_dropped": len(duplicates),
+        "context_tokens_before": tokens_before,
+        "context_tokens": token_budget - remaining,
+        "token_budget": token_budget,
+    }
+    return selected, report
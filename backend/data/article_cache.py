@@ -0,0 +1,196 @@
+# data/article_cache.py
+#
+# Single-file article cache on SQLite, replacing the one-JSON-file-per-URL
+# layout of data/reuters_cache. Bodies are zlib-compressed JSON keyed by the
+# same MD5-of-URL the old filenames used, with an index on fetch time so the
+# embedding stage can stream articles oldest-first or only those fetched since
+# a given moment.
+#
+# Move an existing cache directory over with:
+#     python article_cache.py migrate --from data/reuters_cache
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+CACHE_PATH = "data/article_cache.sqlite"
+LEGACY_CACHE_DIR = "data/reuters_cache"
+COMPRESSION_LEVEL = 6
+# SQLite's default limit on bound parameters is 999 on older builds
+READ_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    url_hash TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS articles_fetched_at ON articles (fetched_at, url_hash);
+"""
+
+def url_hash(url):
+    return hashlib.md5(url.encode()).hexdigest()
+
+def _pack(article):
+    return zlib.compress(json.dumps(article, ensure_ascii=False).encode("utf-8"), COMPRESSION_LEVEL)
+
+def _unpack(body):
+    return json.loads(zlib.decompress(body))
+
+class ArticleCache:
+    """Extracted articles keyed by URL; safe to share between threads"""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def get(self, url):
+        with self.lock:
+            row = self.db.execute("SELECT body FROM articles WHERE url_hash = ?", (url_hash(url),)).fetchone()
+        return _unpack(row[0]) if row else None
+
+    def get_many(self, urls):
+        """{url: article} for the cached ones among `urls`"""
+        wanted = {url_hash(url): url for url in urls}
+        found = {}
+        hashes = list(wanted)
+        for start in range(0, len(hashes), READ_BATCH):
+            batch = hashes[start:start + READ_BATCH]
+            with self.lock:
+                rows = self.db.execute(
+                    f"SELECT url_hash, body FROM articles WHERE url_hash IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+            for key, body in rows:
+                found[wanted[key]] = _unpack(body)
+        return found
+
+    def __contains__(self, url):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM articles WHERE url_hash = ?", (url_hash(url),)).fetchone() is not None
+
+    def put(self, article, fetched_at=None):
+        self.put_many([article], fetched_at)
+
+    def put_many(self, articles, fetched_at=None):
+        """Insert or replace articles in one transaction"""
+        now = time.time() if fetched_at is None else fetched_at
+        self._write([(now, article) for article in articles])
+
+    def _write(self, timed_articles):
+        rows = [(url_hash(a["url"]), a["url"], t, _pack(a)) for t, a in timed_articles]
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany("INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?)", rows)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def iter_articles(self, since=None, batch_size=READ_BATCH):
+        """
+        Every cached article in fetch order, read in batches so memory stays flat.
+        With `since`, only articles fetched at or after that Unix time.
+        """
+        # Keyset pagination on the (fetched_at, url_hash) order, so each batch is an index range scan
+        query, params = "fetched_at >= ?", (float("-inf") if since is None else since,)
+        while True:
+            with self.lock:
+                rows = self.db.execute(
+                    f"SELECT fetched_at, url_hash, body FROM articles WHERE {query} "
+                    "ORDER BY fetched_at, url_hash LIMIT ?", (*params, batch_size)
+                ).fetchall()
+            for _, _, body in rows:
+                yield _unpack(body)
+            if len(rows) < batch_size:
+                return
+            query, params = "(fetched_at, url_hash) > (?, ?)", rows[-1][:2]
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+_open_caches = {}
+_open_lock = threading.Lock()
+
+def open_cache(path=CACHE_PATH):
+    """Shared ArticleCache for `path`, opened on first use"""
+    key = os.path.abspath(path)
+    with _open_lock:
+        if key not in _open_caches:
+            _open_caches[key] = ArticleCache(path)
+        return _open_caches[key]
+
+def migrate_directory(source_dir=LEGACY_CACHE_DIR, path=CACHE_PATH, delete=False, batch_size=1000):
+    """
+    Copy every article_*.json in `source_dir` into the cache at `path`, keeping each
+    file's modification time as its fetch time. Returns (migrated, skipped) counts.
+    """
+    cache = ArticleCache(path)
+    migrated, skipped, batch, done_files = 0, 0, [], []
+
+    def flush():
+        nonlocal migrated
+        cache._write(batch)
+        migrated += len(batch)
+        if delete:
+            for name in done_files:
+                os.remove(name)
+        batch.clear()
+        done_files.clear()
+
+    with os.scandir(source_dir) as entries:
+        for entry in entries:
+            if not (entry.name.startswith("article_") and entry.name.endswith(".json")):
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    article = json.load(f)
+                if not isinstance(article, dict) or "url" not in article:
+                    raise ValueError("no url field")
+            except (OSError, ValueError) as e:
+                print(f"Warning: Skipping unreadable cache file {entry.name}: {e}")
+                skipped += 1
+                continue
+            batch.append((entry.stat().st_mtime, article))
+            done_files.append(entry.path)
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+    cache.close()
+    return migrated, skipped
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the SQLite article cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Import a directory of per-URL JSON cache files")
+    migrate.add_argument("--from", dest="source", default=LEGACY_CACHE_DIR)
+    migrate.add_argument("--db", default=CACHE_PATH)
+    migrate.add_argument("--delete", action="store_true", help="Remove each JSON file once it is imported")
+    stats = sub.add_parser("stats", help="Show article count and file size")
+    stats.add_argument("--db", default=CACHE_PATH)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrated, skipped = migrate_directory(args.source, args.db, delete=args.delete)
+        print(f"✅ Migrated {migrated} articles from {args.source} into {args.db} ({skipped} skipped)")
+    else:
+        cache = ArticleCache(args.db)
+        size = sum(os.path.getsize(p) for p in (args.db, args.db + "-wal") if os.path.exists(p))
+        print(f"{len(cache)} articles, {size / 1e6:.1f} MB")
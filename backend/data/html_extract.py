@@ -0,0 +1,188 @@
+# data/html_extract.py
+#
+# Article extraction on lxml. The selector cascades are the same as the original
+# BeautifulSoup extractor's (kept below as extract_article_bs4, the reference for
+# bench/html_extract_parity.py), but:
+#   - pages are parsed by libxml2 instead of the pure-Python html.parser
+#   - CSS selectors are compiled to XPath once, not on every call
+#   - a selector that needs a class no element on the page has is skipped
+#     without running it; the classes are gathered once per page
+#   - extract_pages can fan pages out over a process pool, apart from fetching
+
+import logging
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import lxml.html
+from lxml import etree
+from lxml.cssselect import CSSSelector
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "1"))
+
+# Tried in order, as the original extractor did; the first selector that matches wins
+SELECTORS = {
+    "title": ['h1.article-header__title', '.article-header h1', 'h1.text__heading_level_1', '.title', 'h1'],
+    "date": ['time.article-header__date', 'time', 'meta[property="article:published_time"]',
+             '.article-info__published-datetime'],
+    "body": ['.article-body__content p', '.article-body p', 'article p', '.ArticleBody-article-body p',
+             '.paywall-article p', '.articleBody p', 'p'],
+    "author": ['.author-name', '.byline', '[data-testid="author-byline"]'],
+}
+_COMPILED = {field: [CSSSelector(s, translator="html") for s in selectors] for field, selectors in SELECTORS.items()}
+# Class names each selector needs on the page to match at all (attribute values aside)
+_REQUIRED_CLASSES = {
+    field: [frozenset(re.findall(r"\.([\w-]+)", re.sub(r"\[[^\]]*\]", "", s))) for s in selectors]
+    for field, selectors in SELECTORS.items()
+}
+
+def _page_classes(root):
+    """Every class name used on the page, gathered in one pass"""
+    return frozenset(" ".join(root.xpath("//@class")).split())
+
+def _select(root, field, classes=None):
+    """Matches of the first selector in the field's cascade that finds anything"""
+    for selector, required in zip(_COMPILED[field], _REQUIRED_CLASSES[field]):
+        if classes is None or required <= classes:
+            hits = selector(root)
+            if hits:
+                return hits
+    return []
+
+def _parse(content):
+    try:
+        return lxml.html.document_fromstring(content)
+    except (etree.ParserError, ValueError):
+        return None
+
+def extract_article(content, url, prefilter=True):
+    """
+    Pull title, date, text and author out of a fetched article page.
+    `prefilter=False` runs every selector, for timing the class check.
+    """
+    root = _parse(content) if content else None
+    if root is None:
+        return {"title": "Unknown Title", "date_publish": "Unknown Date", "text": "", "url": url,
+                "author": "Unknown Author"}
+    classes = _page_classes(root) if prefilter else None
+
+    title_elem = next(iter(_select(root, "title", classes)), None)
+    title = title_elem.text_content().strip() if title_elem is not None else "Unknown Title"
+
+    date_elem = next(iter(_select(root, "date", classes)), None)
+    date_publish = None
+    if date_elem is not None:
+        date_publish = date_elem.get("datetime") or date_elem.get("content")
+    if not date_publish:
+        date_publish = "Unknown Date"
+
+    paragraphs = (p.text_content().strip() for p in _select(root, "body", classes))
+    maintext = "\n".join(text for text in paragraphs if text)
+
+    author_elem = next(iter(_select(root, "author", classes)), None)
+    author = author_elem.text_content().strip() if author_elem is not None else "Unknown Author"
+
+    return {
+        "title": title,
+        "date_publish": date_publish,
+        "text": maintext,
+        "url": url,
+        "author": author
+    }
+
+def _extract_page(page):
+    try:
+        return extract_article(page["html"], page["url"])
+    except Exception as e:
+        logging.error(f"Extraction failed for {page['url']}: {e}")
+        return None
+
+def extract_pages(pages, workers=EXTRACT_WORKERS, window=None):
+    """
+    Pipeline stage: yield (page, article) for crawled pages in order. Pages already
+    carrying an "article" pass straight through; a page whose fetch failed gets None.
+    With `workers` > 1, parsing runs in a process pool with up to `window` pages in flight.
+    """
+    if workers <= 1:
+        for page in pages:
+            if "article" in page or not page.get("html"):
+                yield page, page.get("article")
+            else:
+                yield page, _extract_page(page)
+        return
+
+    window = window or workers * 4
+    pending = deque()
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for page in pages:
+            if "article" in page or not page.get("html"):
+                pending.append((page, None))
+            else:
+                pending.append((page, pool.submit(_extract_page, page)))
+            while len(pending) > window or (pending and (pending[0][1] is None or pending[0][1].done())):
+                done_page, future = pending.popleft()
+                yield done_page, future.result() if future is not None else done_page.get("article")
+        while pending:
+            done_page, future = pending.popleft()
+            yield done_page, future.result() if future is not None else done_page.get("article")
+
+def extract_article_bs4(content, url, parser="html.parser"):
+    """
+    The original BeautifulSoup extractor, kept as the reference for parity checks.
+    With parser="lxml" it runs on the same tree extract_article sees.
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, parser)
+
+    # Extract title - multiple possible selectors based on Reuters HTML structure
+    title_elem = (soup.select_one('h1.article-header__title') or
+                 soup.select_one('.article-header h1') or
+                 soup.select_one('h1.text__heading_level_1') or
+                 soup.select_one('.title') or
+                 soup.select_one('h1'))
+    title = title_elem.get_text().strip() if title_elem else "Unknown Title"
+
+    # Extract date - multiple possible selectors
+    date_elem = (soup.select_one('time.article-header__date') or
+                soup.select_one('time') or
+                soup.select_one('meta[property="article:published_time"]') or
+                soup.select_one('.article-info__published-datetime'))
+
+    date_publish = None
+    if date_elem:
+        if date_elem.get('datetime'):
+            date_publish = date_elem.get('datetime')
+        elif date_elem.get('content'):
+            date_publish = date_elem.get('content')
+    if not date_publish:
+        date_publish = "Unknown Date"
+
+    # Extract article text - multiple possible selectors
+    article_paragraphs = (soup.select('.article-body__content p') or
+                         soup.select('.article-body p') or
+                         soup.select('article p') or
+                         soup.select('.ArticleBody-article-body p') or
+                         soup.select('.paywall-article p') or
+                         soup.select('.articleBody p'))
+
+    # Fallback to any paragraph if specific selectors fail
+    if not article_paragraphs:
+        article_paragraphs = soup.select('p')
+
+    maintext = "\n".join([p.get_text().strip() for p in article_paragraphs if p.get_text().strip()])
+
+    # Try to get author
+    author_elem = (soup.select_one('.author-name') or
+                  soup.select_one('.byline') or
+                  soup.select_one('[data-testid="author-byline"]'))
+    author = author_elem.get_text().strip() if author_elem else "Unknown Author"
+
+    return {
+        "title": title,
+        "date_publish": date_publish,
+        "text": maintext,
+        "url": url,
+        "author": author
+    }
@@ -0,0 +1,536 @@
+# data/sitemap_crawler.py
+#
+# Concurrent, polite sitemap crawler on asyncio + httpx.
+#   - One shared connection pool, capped at CRAWL_CONCURRENCY requests in flight.
+#   - Requests to each host are spaced by 1 / CRAWL_RATE seconds, or by the
+#     host's robots.txt Crawl-delay when that is longer; disallowed URLs are skipped.
+#   - Sitemap <lastmod> and HTTP validators (ETag / Last-Modified, sent back as
+#     If-None-Match / If-Modified-Since) are kept in a small state file, so a
+#     refresh only downloads the sitemaps and pages that changed. A sitemap's are
+#     recorded only once every page it lists has been crawled, so pages that
+#     failed or were never reached are retried on the next crawl.
+#
+# fetch_from_reuters_sitemap.crawl_pages drives it from synchronous code.
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
+# Requests per second to any one host
+CRAWL_RATE = float(os.getenv("CRAWL_RATE", "1.0"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "15"))
+CRAWL_MAX_RETRIES = int(os.getenv("CRAWL_MAX_RETRIES", "3"))
+CRAWLER_USER_AGENT = os.getenv("CRAWLER_USER_AGENT", "VerifastAiBot/1.0")
+# Longest Retry-After we will sleep for before giving up on a URL
+MAX_RETRY_AFTER = 60.0
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+def news_sitemaps(sitemap_urls):
+    """Prefer news/article sitemaps from an index, falling back to the first two"""
+    selected = [url for url in sitemap_urls if "news" in url.lower() or "articles" in url.lower()]
+    return selected or sitemap_urls[:2]
+
+def robots_crawl_delay(robots_text, user_agent):
+    """
+    Crawl-delay in seconds from the robots.txt group for `user_agent` (or `*`), else None.
+    urllib.robotparser only reads whole seconds, and fractional delays are common.
+    """
+    token = user_agent.split("/")[0].lower()
+    delays, agents, in_rules = {}, [], False
+    for line in robots_text.splitlines():
+        key, _, value = line.split("#", 1)[0].partition(":")
+        key, value = key.strip().lower(), value.strip()
+        if key == "user-agent":
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value.lower())
+        elif key:
+            in_rules = True
+            if key == "crawl-delay":
+                try:
+                    for agent in agents:
+                        delays.setdefault(agent, float(value))
+                except ValueError:
+                    pass
+    matched = next((delay for agent, delay in delays.items() if agent != "*" and agent in token), None)
+    return matched if matched is not None else delays.get("*")
+
+def parse_sitemap(content):
+    """
+    ("index", [(loc, lastmod), ...]) for a sitemap index, ("urlset", [...]) for a plain sitemap.
+    Gzipped sitemaps are accepted.
+    """
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    root = ET.fromstring(content)
+    kind = "index" if root.tag.endswith("sitemapindex") else "urlset"
+    entries = []
+    for node in root.findall(f"{SITEMAP_NS}sitemap" if kind == "index" else f"{SITEMAP_NS}url"):
+        loc = node.findtext(f"{SITEMAP_NS}loc")
+        if loc:
+            entries.append((loc.strip(), (node.findtext(f"{SITEMAP_NS}lastmod") or "").strip() or None))
+    return kind, entries
+
+class CrawlState:
+    """Per-URL sitemap lastmod and HTTP validators, persisted as JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable crawl state {path}: {e}")
+
+    def get(self, url):
+        return self.entries.get(url, {})
+
+    def update(self, url, **fields):
+        self.entries.setdefault(url, {}).update(fields)
+        self.dirty += 1
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = 0
+
+class SitemapProgress:
+    """
+    A sitemap whose lastmod and validators wait to be recorded until everything it
+    lists (pages, or child sitemaps for an index) has been crawled successfully
+    """
+
+    __slots__ = ("url", "fields", "parent", "pending", "listed", "failed")
+
+    def __init__(self, url, fields, parent):
+        self.url = url
+        self.fields = fields
+        self.parent = parent
+        self.pending = 0
+        self.listed = False
+        self.failed = False
+
+class HostPolicy:
+    """robots.txt rules and request spacing for one host"""
+
+    def __init__(self, robots, interval):
+        self.robots = robots
+        self.interval = interval
+        self.lock = asyncio.Lock()
+        self.next_request = 0.0
+
+    def allowed(self, url, user_agent):
+        return self.robots is None or self.robots.can_fetch(user_agent, url)
+
+    async def wait_turn(self):
+        """Block until this host may be sent another request"""
+        async with self.lock:
+            delay = self.next_request - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_request = time.monotonic() + self.interval
+
+class SitemapCrawler:
+    """
+    Walks a sitemap index and fetches its pages concurrently within per-host limits.
+
+    `cached(url)` returns the stored extraction of a page, or None. Pages whose
+    sitemap lastmod is unchanged and which are cached are not requested again;
+    cached pages that are requested carry validators, and a 304 reuses the cache.
+    """
+
+    def __init__(self, state_path=None, cached=None, concurrency=CRAWL_CONCURRENCY, rate=CRAWL_RATE,
+                 timeout=CRAWL_TIMEOUT, max_retries=CRAWL_MAX_RETRIES, user_agent=CRAWLER_USER_AGENT,
+                 select_sitemaps=news_sitemaps, transport=None):
+        self.state = CrawlState(state_path)
+        self.cached = cached or (lambda url: None)
+        self.concurrency = concurrency
+        self.min_interval = 1.0 / rate if rate > 0 else 0.0
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.user_agent = user_agent
+        self.select_sitemaps = select_sitemaps
+        self.transport = transport
+        self.hosts = {}
+        self.host_locks = {}
+        # {page url: [SitemapProgress of each sitemap listing it]}
+        self.page_sitemaps = {}
+        self.client = None
+        self.slots = None
+        self.stats = {
+            "requests": 0, "fetched": 0, "not_modified": 0, "unchanged": 0, "disallowed": 0, "failed": 0,
+            "sitemaps_fetched": 0, "sitemaps_not_modified": 0, "bytes": 0,
+        }
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            headers={**HEADERS, "User-Agent": self.user_agent},
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            transport=self.transport
+        )
+        self.slots = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        self.state.save()
+
+    async def host_policy(self, url):
+        """Robots rules and request spacing for the host of `url`, fetching robots.txt once per host"""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        if host in self.hosts:
+            return self.hosts[host]
+        lock = self.host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            if host not in self.hosts:
+                robots, delay = await self._fetch_robots(host)
+                self.hosts[host] = HostPolicy(robots, max(self.min_interval, delay or 0.0))
+        return self.hosts[host]
+
+    async def _fetch_robots(self, host):
+        """(parsed robots.txt or None, crawl delay or None)"""
+        robots = RobotFileParser(f"{host}/robots.txt")
+        try:
+            response = await self.client.get(f"{host}/robots.txt")
+            self.stats["requests"] += 1
+        except httpx.HTTPError as e:
+            logging.warning(f"Could not fetch {host}/robots.txt, crawling without it: {e}")
+            return None, None
+        if response.status_code >= 500:
+            # RFC 9309: an unreachable robots.txt means the whole host is off limits for now
+            robots.disallow_all = True
+        elif response.status_code >= 400:
+            robots.allow_all = True
+        else:
+            robots.parse(response.text.splitlines())
+            return robots, robots_crawl_delay(response.text, self.user_agent)
+        return robots, None
+
+    async def fetch(self, url, conditional=True, record=True, paced=False):
+        """
+        GET `url` politely. Returns the response (304 included), or None when the URL
+        is disallowed or every attempt failed. With `record`, a 200's validators are saved
+        for the next conditional request. `paced` means the caller already waited its turn.
+        """
+        policy = await self.host_policy(url)
+        if not policy.allowed(url, self.user_agent):
+            self.stats["disallowed"] += 1
+            logging.info(f"robots.txt disallows {url}")
+            return None
+
+        headers = {}
+        if conditional:
+            known = self.state.get(url)
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+
+        for attempt in range(self.max_retries + 1):
+            if attempt or not paced:
+                await policy.wait_turn()
+            try:
+                response = await self.client.get(url, headers=headers)
+                self.stats["requests"] += 1
+            except httpx.HTTPError as e:
+                logging.warning(f"Attempt {attempt + 1}/{self.max_retries + 1}: error fetching {url}: {e}")
+                await asyncio.sleep(min(2 ** attempt, MAX_RETRY_AFTER))
+                continue
+
+            if response.status_code in (200, 304):
+                if response.status_code == 200:
+                    self.stats["bytes"] += len(response.content)
+                    if record:
+                        self.state.update(url, **validators(response))
+                return response
+            if response.status_code == 429 or response.status_code >= 500:
+                retry_after = response.headers.get("retry-after", "")
+                wait = float(retry_after) if retry_after.isdigit() else 2 ** attempt
+                if wait > MAX_RETRY_AFTER:
+                    break
+                logging.warning(f"Got {response.status_code} for {url}, retrying in {wait:.1f}s")
+                await asyncio.sleep(wait)
+                continue
+            logging.warning(f"Got status {response.status_code} for {url}")
+            break
+
+        self.stats["failed"] += 1
+        return None
+
+    async def iter_page_urls(self, index_url, changed_only=True):
+        """
+        Yield (url, lastmod) for every page listed under `index_url`. With `changed_only`,
+        sitemaps that are unchanged since the last crawl are not downloaded at all.
+        """
+        pending = [(index_url, None, None)]
+        while pending:
+            sitemap_url, lastmod, parent = pending.pop(0)
+            known = self.state.get(sitemap_url)
+            if changed_only and lastmod and known.get("lastmod") == lastmod:
+                self.stats["sitemaps_not_modified"] += 1
+                self._item_done(parent, ok=True)
+                continue
+
+            async with self.slots:
+                response = await self.fetch(sitemap_url, conditional=changed_only, record=False)
+            if response is None:
+                logging.error(f"Failed to fetch sitemap: {sitemap_url}")
+                self._item_done(parent, ok=False)
+                continue
+            if response.status_code == 304:
+                self.stats["sitemaps_not_modified"] += 1
+                self._item_done(parent, ok=True)
+                continue
+            self.stats["sitemaps_fetched"] += 1
+            try:
+                kind, entries = parse_sitemap(response.content)
+            except ET.ParseError as e:
+                logging.error(f"Malformed sitemap {sitemap_url}: {e}")
+                self._item_done(parent, ok=False)
+                continue
+
+            progress = SitemapProgress(sitemap_url, {"lastmod": lastmod, **validators(response)}, parent)
+            if kind == "index":
+                children = entries
+                if parent is None:
+                    selected = set(self.select_sitemaps([loc for loc, _ in entries]))
+                    children = [entry for entry in entries if entry[0] in selected]
+                    logging.info(f"Found {len(entries)} sitemap files. Selected {len(children)} news sitemaps.")
+                progress.pending += len(children)
+                pending.extend((loc, child_lastmod, progress) for loc, child_lastmod in children)
+            else:
+                for loc, page_lastmod in entries:
+                    progress.pending += 1
+                    self.page_sitemaps.setdefault(loc, []).append(progress)
+                    yield loc, page_lastmod
+            # Settles now if everything listed has already finished, else when the last item does
+            progress.listed = True
+            self._settle(progress)
+
+    def _item_done(self, progress, ok):
+        """One page or child sitemap listed by `progress` has finished"""
+        if progress is None:
+            return
+        progress.pending -= 1
+        progress.failed = progress.failed or not ok
+        self._settle(progress)
+
+    def _settle(self, progress):
+        if progress.listed and progress.pending == 0:
+            if not progress.failed:
+                self.state.update(progress.url, **progress.fields)
+            self._item_done(progress.parent, ok=not progress.failed)
+
+    def page_done(self, url, ok):
+        """Count a page as crawled (or failed) for the sitemaps that list it"""
+        for progress in self.page_sitemaps.pop(url, ()):
+            self._item_done(progress, ok)
+
+    def _without_request(self, url, lastmod, cached, policy, changed_only):
+        """
+        (True, result) when the page needs no request: disallowed by robots.txt, or cached
+        with an unchanged sitemap lastmod. (False, None) when it has to be fetched.
+        """
+        if not policy.allowed(url, self.user_agent):
+            self.stats["disallowed"] += 1
+            logging.info(f"robots.txt disallows {url}")
+            self.page_done(url, ok=True)
+            return True, None
+        if cached is not None and lastmod and self.state.get(url).get("lastmod") == lastmod:
+            self.stats["unchanged"] += 1
+            self.page_done(url, ok=True)
+            return True, None if changed_only else {"url": url, "article": cached}
+        return False, None
+
+    async def _download_page(self, url, lastmod, cached, changed_only):
+        try:
+            response = await self.fetch(url, conditional=cached is not None, paced=True)
+        except Exception:
+            self.page_done(url, ok=False)
+            raise
+        self.page_done(url, ok=response is not None)
+        if response is not None and response.status_code == 304:
+            self.stats["not_modified"] += 1
+            self.state.update(url, lastmod=lastmod)
+            return None if changed_only else {"url": url, "article": cached}
+        if response is None:
+            return {"url": url, "html": None}
+        self.stats["fetched"] += 1
+        self.state.update(url, lastmod=lastmod)
+        return {"url": url, "html": response.content}
+
+    async def fetch_page(self, url, lastmod=None, changed_only=True):
+        """
+        {"url", "article"} for an unchanged cached page, {"url", "html"} for a fetched one
+        (html is None on failure), or None when the page is skipped: disallowed by
+        robots.txt, or unchanged with `changed_only`.
+        """
+        policy = await self.host_policy(url)
+        cached = self.cached(url)
+        skip, result = self._without_request(url, lastmod, cached, policy, changed_only)
+        if skip:
+            return result
+        await policy.wait_turn()
+        return await self._download_page(url, lastmod, cached, changed_only)
+
+    async def crawl(self, index_url=None, urls=None, limit=None, changed_only=True):
+        """
+        Async generator of fetch_page results for the pages under `index_url`, or for `urls`.
+        Each host gets a dispatcher that starts its requests at the host's pace, so a slow
+        host never holds up the others; at most `concurrency` requests are in flight.
+        Results arrive in completion order.
+        """
+        results = asyncio.Queue(self.concurrency * 2)
+        done = object()
+        errors = []
+        host_queues, dispatchers, downloads = {}, [], set()
+
+        async def download(url, lastmod, cached):
+            try:
+                result = await self._download_page(url, lastmod, cached, changed_only)
+                if result is not None:
+                    await results.put(result)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.slots.release()
+
+        async def dispatch(urls_for_host):
+            while (item := await urls_for_host.get()) is not None:
+                url, lastmod = item
+                policy = await self.host_policy(url)
+                cached = self.cached(url)
+                skip, result = self._without_request(url, lastmod, cached, policy, changed_only)
+                if skip:
+                    if result is not None:
+                        await results.put(result)
+                    continue
+                await self.slots.acquire()
+                await policy.wait_turn()
+                task = asyncio.create_task(download(url, lastmod, cached))
+                downloads.add(task)
+                task.add_done_callback(downloads.discard)
+
+        async def feed():
+            try:
+                source = self.iter_page_urls(index_url, changed_only) if urls is None else \
+                    _as_async((url, None) for url in urls)
+                count = 0
+                async for url, lastmod in source:
+                    if limit is not None and count >= limit:
+                        break
+                    count += 1
+                    parts = urlsplit(url)
+                    host = f"{parts.scheme}://{parts.netloc}"
+                    if host not in host_queues:
+                        host_queues[host] = asyncio.Queue()
+                        dispatchers.append(asyncio.create_task(dispatch(host_queues[host])))
+                    host_queues[host].put_nowait((url, lastmod))
+                for urls_for_host in host_queues.values():
+                    urls_for_host.put_nowait(None)
+                for result in await asyncio.gather(*dispatchers, return_exceptions=True):
+                    if isinstance(result, Exception):
+                        errors.append(result)
+                while downloads:
+                    await asyncio.gather(*list(downloads), return_exceptions=True)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                await results.put(done)
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while (result := await results.get()) is not done:
+                yield result
+                if self.state.dirty >= 100:
+                    self.state.save()
+        finally:
+            for task in [feeder, *dispatchers, *downloads]:
+                task.cancel()
+            await asyncio.gather(feeder, *dispatchers, *downloads, return_exceptions=True)
+        if errors:
+            raise errors[0]
+
+def validators(response):
+    return {"etag": response.headers.get("etag"), "last_modified": response.headers.get("last-modified")}
+
+async def _as_async(items):
+    for item in items:
+        yield item
+
+def iter_crawl(index_url=None, urls=None, limit=None, changed_only=True, stats=None, buffer=32, **crawler_options):
+    """
+    Run a SitemapCrawler on a background event loop and yield its results synchronously,
+    so it can feed a blocking consumer such as an ingest pipeline stage.
+    The crawler's counters are copied into `stats` when it finishes.
+    """
+    items = queue.Queue(buffer)
+    stop = threading.Event()
+    finished = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        async with SitemapCrawler(**crawler_options) as crawler:
+            try:
+                async for page in crawler.crawl(index_url, urls, limit, changed_only):
+                    # Blocking put off the loop thread, so in-flight requests keep going meanwhile
+                    await loop.run_in_executor(None, put, page)
+                    if stop.is_set():
+                        return
+            finally:
+                if stats is not None:
+                    stats.update(crawler.stats)
+
+    def target():
+        try:
+            asyncio.run(run())
+        except Exception as e:
+            put(e)
+        finally:
+            put(finished)
+
+    thread = threading.Thread(target=target, name="sitemap-crawler", daemon=True)
+    thread.start()
+    try:
+        while (item := items.get()) is not finished:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
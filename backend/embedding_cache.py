@@ -0,0 +1,107 @@
+# backend/embedding_cache.py
+
+import hashlib
+import math
+import re
+import time
+from array import array
+from collections import OrderedDict
+
+# Punctuation not inside a word: "AT&T", "S&P" and "3.5" keep theirs, so they don't share a key with "at t"
+_PUNCTUATION = re.compile(r"(?<!\w)[^\w\s]+|[^\w\s]+(?!\w)")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_query(text):
+    """Normalize query text so trivially different spellings share a cache key (the key only; never encoded)"""
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed on normalized query text.
+
+    Entries expire after `ttl` seconds when a TTL is set. An optional
+    redis.asyncio client adds a shared second tier so every uvicorn worker
+    benefits from vectors computed by the others.
+    """
+
+    def __init__(self, maxsize=10000, ttl=None, redis_client=None, namespace="embcache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis = redis_client
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    def _redis_key(self, key):
+        return f"{self.namespace}:{hashlib.sha1(key.encode()).hexdigest()}"
+
+    def get_local(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        vector, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return vector
+
+    def put_local(self, key, vector):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[key] = (vector, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get(self, key):
+        """Return the cached vector for a normalized key, or None on a miss"""
+        vector = self.get_local(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(self._redis_key(key))
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"Warning: Embedding cache Redis read failed: {e}")
+                raw = None
+            if raw is not None:
+                vector = array("f", raw).tolist()
+                self.put_local(key, vector)
+                self.redis_hits += 1
+                return vector
+
+        self.misses += 1
+        return None
+
+    async def put(self, key, vector):
+        self.put_local(key, vector)
+        if self.redis is not None:
+            try:
+                ttl = math.ceil(self.ttl) if self.ttl else None
+                await self.redis.set(self._redis_key(key), array("f", vector).tobytes(), ex=ttl)
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"Warning: Embedding cache Redis write failed: {e}")
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,105 @@
+# embeddings/bm25_index.py
+#
+# Compact BM25 inverted index over the rows of the embedding store, built at
+# ingest time and saved next to it as article_embeddings.bm25.npz:
+#   vocab          UTF-8 bytes of the sorted terms, newline separated
+#   term_offsets   int64, postings of term t live in [term_offsets[t], term_offsets[t + 1])
+#   postings_rows  int32 row numbers (the same rows as the embedding matrix)
+#   postings_tf    uint16 term frequency in that row
+#   doc_lengths    int32 tokens per row
+#
+# Rebuild after changing the store with:
+#     python embeddings/bm25_index.py
+
+import os
+import re
+import sys
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from embeddings.embedding_store import DEFAULT_BASE, iter_metadata
+
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"\w+(?:[.'&-]\w+)*")
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his in is it its of on or
+that the their they this to was were will with
+""".split())
+
+def bm25_path(base=DEFAULT_BASE):
+    return f"{base}.bm25.npz"
+
+def tokenize(text):
+    """Lowercased word tokens; keeps dotted and hyphenated forms like u.s. or covid-19 intact"""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+def build_index(base=DEFAULT_BASE):
+    """Tokenize every row's title and text and write the index; returns the number of rows"""
+    postings = {}
+    doc_lengths = []
+    for row, meta in enumerate(iter_metadata(base)):
+        tokens = tokenize(f"{meta['title']} {meta['text']}")
+        doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term, []).append((row, min(tf, 65535)))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    rows, tfs = [], []
+    for i, term in enumerate(terms):
+        entries = postings[term]
+        offsets[i + 1] = offsets[i] + len(entries)
+        rows.extend(r for r, _ in entries)
+        tfs.extend(tf for _, tf in entries)
+
+    tmp_path = bm25_path(base) + ".tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        vocab=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+        term_offsets=offsets,
+        postings_rows=np.asarray(rows, dtype=np.int32),
+        postings_tf=np.asarray(tfs, dtype=np.uint16),
+        doc_lengths=np.asarray(doc_lengths, dtype=np.int32),
+    )
+    os.replace(tmp_path, bm25_path(base))
+    return len(doc_lengths)
+
+class BM25Index:
+    """Loaded index; scores every row of the store for a query in one vectorized pass per term"""
+
+    def __init__(self, base=DEFAULT_BASE, k1=K1, b=B):
+        with np.load(bm25_path(base)) as data:
+            vocab = data["vocab"].tobytes().decode("utf-8")
+            self.term_offsets = data["term_offsets"]
+            self.postings_rows = data["postings_rows"]
+            self.postings_tf = data["postings_tf"].astype(np.float32)
+            doc_lengths = data["doc_lengths"].astype(np.float32)
+        self.terms = {term: i for i, term in enumerate(vocab.split("\n"))} if vocab else {}
+        self.num_rows = doc_lengths.shape[0]
+        avg_length = float(doc_lengths.mean()) if self.num_rows else 1.0
+        self.k1 = k1
+        # Per-row length normalization, precomputed once
+        self.length_norm = k1 * (1 - b + b * doc_lengths / max(avg_length, 1e-9))
+
+    def scores(self, query):
+        """BM25 score of every row for the query text"""
+        scores = np.zeros(self.num_rows, dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.terms.get(term)
+            if t is None:
+                continue
+            start, end = self.term_offsets[t], self.term_offsets[t + 1]
+            rows = self.postings_rows[start:end]
+            tf = self.postings_tf[start:end]
+            df = end - start
+            idf = np.log(1 + (self.num_rows - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + self.length_norm[rows])
+        return scores
+
+if __name__ == "__main__":
+    count = build_index()
+    print(f"✅ Built BM25 index over {count} rows at {bm25_path()}")
@@ -0,0 +1,306 @@
+# embeddings/bulk_embed.py
+#
+# Streaming bulk embedding for backfills. Articles are read and chunked lazily,
+# encoded in windows of WINDOW_CHUNKS chunks, and appended to the store as each
+# window finishes, so memory stays flat however large the corpus is.
+#   - Within a window, texts are sorted by length before batching, so each
+#     batch pads to a similar length instead of to its longest outlier.
+#   - Batches fan out over a process pool, one encoder per process, with the
+#     intra-op threads split between them.
+#   - The new store is written to .partial files next to the old one, and a
+#     checkpoint records how far it got; after a crash the next run truncates
+#     the partial files to the checkpoint and carries on from there.
+#   - Chunks whose content hash is unchanged reuse their old vector.
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from embeddings.embedding_store import (
+    DEFAULT_BASE, matrix_path, metadata_path, load_index, load_matrix, store_exists, with_ids
+)
+from embeddings.chunking import CHUNK_WORDS, OVERLAP_WORDS, chunk_article
+from encoder_backends import ENCODER_BACKEND, MODEL_NAME
+
+BATCH_SIZE = 32
+WINDOW_CHUNKS = 2048
+DEFAULT_DIM = 384
+# Fixed .npy header size, so the row count can be patched in place once the stream ends
+NPY_HEADER_BYTES = 128
+READ_BYTES = 1 << 20
+
+def default_workers():
+    return max(1, min(4, os.cpu_count() or 1))
+
+def iter_articles(path):
+    """Stream articles from a JSON array, a JSON-lines file or the SQLite article cache without loading it whole"""
+    if path.endswith(".sqlite"):
+        from data.article_cache import ArticleCache
+        cache = ArticleCache(path)
+        try:
+            yield from cache.iter_articles()
+        finally:
+            cache.close()
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer, pos, eof = "", 0, False
+        opened = False
+        while True:
+            # Skip whitespace, the opening bracket and separators
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == "," or (buffer[pos] == "[" and not opened)):
+                opened = opened or buffer[pos] == "["
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                if pos >= len(buffer):
+                    raise ValueError("need more input")
+                article, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    if buffer[pos:].strip():
+                        raise ValueError(f"Malformed JSON in {path}")
+                    return
+                more = f.read(READ_BYTES)
+                eof = not more
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield article
+            pos = end
+
+def unique_articles(path):
+    """Articles in file order, keeping only the latest copy of any URL scraped twice"""
+    last_seen = {}
+    for i, article in enumerate(iter_articles(path)):
+        last_seen[article["url"]] = i
+    for i, article in enumerate(iter_articles(path)):
+        if last_seen[article["url"]] == i:
+            yield article
+
+def iter_chunks(path, chunk_words=CHUNK_WORDS, overlap_words=OVERLAP_WORDS):
+    for article in unique_articles(path):
+        for chunk in chunk_article(article, chunk_words, overlap_words):
+            yield with_ids(chunk)
+
+def length_batches(texts, batch_size=BATCH_SIZE):
+    """Positions grouped into batches of similar-length texts, to cut padding waste"""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def _npy_header(rows, dim):
+    header = repr({"descr": "<f4", "fortran_order": False, "shape": (rows, dim)}).encode("latin1")
+    prefix = b"\x93NUMPY\x01\x00" + (NPY_HEADER_BYTES - 10).to_bytes(2, "little")
+    return prefix + header.ljust(NPY_HEADER_BYTES - 10 - 1) + b"\n"
+
+class StoreWriter:
+    """Appends vectors and metadata to .partial store files, checkpointing after every window"""
+
+    def __init__(self, base, settings, resume=True):
+        self.base = base
+        self.settings = settings
+        self.matrix_tmp = matrix_path(base) + ".partial"
+        self.metadata_tmp = metadata_path(base) + ".partial"
+        self.progress_path = f"{base}.progress.json"
+        self.rows, self.dim, meta_bytes = 0, None, 0
+
+        progress = self._read_progress() if resume else None
+        if progress is not None:
+            self.rows, self.dim, meta_bytes = progress["rows"], progress["dim"], progress["meta_bytes"]
+            self.matrix_file = open(self.matrix_tmp, "r+b")
+            self.metadata_file = open(self.metadata_tmp, "r+b")
+            # Drop anything written after the last checkpoint
+            self.matrix_file.truncate(NPY_HEADER_BYTES + self.rows * self.dim * 4)
+            self.metadata_file.truncate(meta_bytes)
+            self.matrix_file.seek(0, os.SEEK_END)
+            self.metadata_file.seek(0, os.SEEK_END)
+        else:
+            self.matrix_file = open(self.matrix_tmp, "w+b")
+            self.metadata_file = open(self.metadata_tmp, "w+b")
+
+    def _read_progress(self):
+        try:
+            with open(self.progress_path, "r", encoding="utf-8") as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if progress.get("settings") != self.settings or progress.get("dim") is None:
+            return None
+        if not (os.path.exists(self.matrix_tmp) and os.path.exists(self.metadata_tmp)):
+            return None
+        return progress
+
+    def append(self, vectors, metas):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.matrix_file.write(_npy_header(0, self.dim))
+        self.matrix_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        for meta in metas:
+            self.metadata_file.write(json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n")
+        for f in (self.matrix_file, self.metadata_file):
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows += len(metas)
+
+        tmp_path = self.progress_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "rows": self.rows, "dim": self.dim,
+                       "meta_bytes": self.metadata_file.tell()}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def finish(self):
+        """Write the final row count and swap the new store in place of the old one"""
+        if self.dim is None:
+            self.dim = DEFAULT_DIM
+            self.matrix_file.write(_npy_header(0, self.dim))
+        self.matrix_file.seek(0)
+        self.matrix_file.write(_npy_header(self.rows, self.dim))
+        for f in (self.matrix_file, self.metadata_file):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        os.replace(self.matrix_tmp, matrix_path(self.base))
+        os.replace(self.metadata_tmp, metadata_path(self.base))
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+_encoder = None
+
+def _init_worker(backend, threads):
+    global _encoder
+    from encoder_backends import load_encoder
+    _encoder = load_encoder(backend, num_threads=threads)
+
+def _encode(texts):
+    return _encoder.encode(texts)
+
+class _InlineExecutor:
+    """Single-process stand-in for the pool, so one worker skips process start-up and pickling"""
+
+    def __init__(self, backend, threads):
+        _init_worker(backend, threads)
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self):
+        pass
+
+def embed_corpus(input_path, base=DEFAULT_BASE, full=False, resume=True, workers=None, threads_per_worker=None,
+                 batch_size=BATCH_SIZE, window=WINDOW_CHUNKS, chunk_words=CHUNK_WORDS,
+                 overlap_words=OVERLAP_WORDS, backend=ENCODER_BACKEND, report_every=10.0):
+    """
+    Embed every chunk of the articles in `input_path` into the store at `base`.
+    Returns a stats dict with article, chunk, encoded, reused and removed counts and rates.
+    """
+    workers = workers or default_workers()
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    stat = os.stat(input_path)
+    settings = {
+        "input": os.path.abspath(input_path), "input_size": stat.st_size, "input_mtime": stat.st_mtime,
+        "chunk_words": chunk_words, "overlap_words": overlap_words, "backend": backend, "model": MODEL_NAME,
+        "full": full,
+    }
+    writer = StoreWriter(base, settings, resume=resume)
+    resumed_rows = writer.rows
+
+    index = load_index(base) if not full and store_exists(base) else {}
+    existing = load_matrix(base) if index else None
+
+    stats = {"articles": 0, "chunks": 0, "encoded": 0, "reused": 0, "resumed_chunks": resumed_rows}
+    matched = 0
+    chunks = iter_chunks(input_path, chunk_words, overlap_words)
+    # Chunking is deterministic, so the rows already on disk are the first `resumed_rows` chunks
+    for chunk in islice(chunks, resumed_rows):
+        stats["articles"] += chunk["chunk_index"] == 0
+        stats["chunks"] += 1
+        matched += chunk["id"] in index
+    resumed_articles = stats["articles"]
+    if resumed_rows:
+        print(f"Resuming after {resumed_articles} articles ({resumed_rows} chunks) already written")
+
+    executor = (_InlineExecutor(backend, threads_per_worker) if workers == 1 else
+                ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_init_worker, initargs=(backend, threads_per_worker)))
+
+    def submit(window_chunks):
+        reused, to_encode = {}, []
+        for i, chunk in enumerate(window_chunks):
+            stored = index.get(chunk["id"])
+            if stored is not None and stored[1] == chunk["content_hash"]:
+                reused[i] = stored[0]
+            else:
+                to_encode.append(i)
+        texts = [window_chunks[i]["text"] for i in to_encode]
+        batches = [
+            ([to_encode[p] for p in positions], executor.submit(_encode, [texts[p] for p in positions]))
+            for positions in length_batches(texts, batch_size)
+        ]
+        return window_chunks, reused, batches
+
+    def write(window_chunks, reused, batches):
+        nonlocal matched
+        encoded = [(rows, future.result()) for rows, future in batches]
+        dim = writer.dim or (encoded[0][1].shape[1] if encoded else existing.shape[1])
+        vectors = np.empty((len(window_chunks), dim), dtype=np.float32)
+        for i, row in reused.items():
+            vectors[i] = existing[row]
+        for rows, result in encoded:
+            vectors[rows] = result
+        writer.append(vectors, window_chunks)
+
+        stats["articles"] += sum(chunk["chunk_index"] == 0 for chunk in window_chunks)
+        stats["chunks"] += len(window_chunks)
+        stats["reused"] += len(reused)
+        stats["encoded"] += len(window_chunks) - len(reused)
+        matched += sum(chunk["id"] in index for chunk in window_chunks)
+
+    started = last_report = time.monotonic()
+
+    def report(final=False):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        stats["seconds"] = elapsed
+        stats["articles_per_sec"] = (stats["articles"] - resumed_articles) / elapsed
+        stats["chunks_per_sec"] = (stats["chunks"] - resumed_rows) / elapsed
+        print(f"{'Done: ' if final else ''}{stats['articles']} articles, {stats['chunks']} chunks "
+              f"({stats['encoded']} encoded, {stats['reused']} reused) in {elapsed:.1f}s: "
+              f"{stats['articles_per_sec']:.1f} articles/sec, {stats['chunks_per_sec']:.1f} chunks/sec")
+
+    try:
+        # Keep the next window encoding while the current one is written
+        pending = deque()
+        while True:
+            window_chunks = list(islice(chunks, window))
+            if window_chunks:
+                pending.append(submit(window_chunks))
+            if pending and (len(pending) > 1 or not window_chunks):
+                write(*pending.popleft())
+                if time.monotonic() - last_report >= report_every:
+                    last_report = time.monotonic()
+                    report()
+            if not window_chunks and not pending:
+                break
+    finally:
+        executor.shutdown()
+
+    writer.finish()
+    stats["removed"] = len(index) - matched
+    report(final=True)
+    return stats
@@ -0,0 +1,68 @@
+# embeddings/chunking.py
+#
+# Splits article text into overlapping, sentence-aligned chunks small enough
+# for MiniLM, which truncates its input at 256 word-pieces (~180 words).
+
+import re
+
+CHUNK_WORDS = 150
+OVERLAP_WORDS = 30
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'“‘(\[A-Z0-9])")
+
+def split_sentences(text):
+    """Split text into sentences, treating line breaks as paragraph boundaries"""
+    sentences = []
+    for paragraph in text.splitlines():
+        paragraph = paragraph.strip()
+        if paragraph:
+            sentences.extend(s.strip() for s in _SENTENCE_END.split(paragraph) if s.strip())
+    return sentences
+
+def _fit(sentences, max_words):
+    """Break any sentence longer than max_words into word windows"""
+    for sentence in sentences:
+        words = sentence.split()
+        if len(words) <= max_words:
+            yield sentence, len(words)
+        else:
+            for start in range(0, len(words), max_words):
+                piece = words[start:start + max_words]
+                yield " ".join(piece), len(piece)
+
+def chunk_text(text, max_words=CHUNK_WORDS, overlap_words=OVERLAP_WORDS):
+    """
+    Pack whole sentences into chunks of at most `max_words` words.
+    Each chunk starts with up to `overlap_words` words of trailing sentences
+    from the previous one, so facts spanning a boundary stay retrievable.
+    """
+    chunks = []
+    current, count, has_new = [], 0, False
+    for sentence, words in _fit(split_sentences(text), max_words):
+        if has_new and count + words > max_words:
+            chunks.append(" ".join(s for s, _ in current))
+            carry, carried = [], 0
+            for prev, prev_words in reversed(current):
+                if carried + prev_words > overlap_words or carried + prev_words + words > max_words:
+                    break
+                carry.insert(0, (prev, prev_words))
+                carried += prev_words
+            current, count, has_new = carry, carried, False
+        current.append((sentence, words))
+        count += words
+        has_new = True
+    if has_new:
+        chunks.append(" ".join(s for s, _ in current))
+    return chunks
+
+def chunk_article(article, max_words=CHUNK_WORDS, overlap_words=OVERLAP_WORDS):
+    """Expand an article into chunk records carrying their parent's title and url"""
+    return [
+        {
+            "title": article["title"],
+            "url": article["url"],
+            "text": chunk,
+            "chunk_index": i
+        }
+        for i, chunk in enumerate(chunk_text(article["text"], max_words, overlap_words) or [article["text"]])
+    ]
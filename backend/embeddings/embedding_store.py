@@ -0,0 +1,218 @@
+# embeddings/embedding_store.py
+#
+# Compact on-disk format for article embeddings:
+#   article_embeddings.npy         float32 matrix, one row per article (memory-mappable)
+#   article_embeddings.meta.jsonl  one {"id", "article_id", "chunk_index", "content_hash",
+#                                  "title", "url", "text"} object per line, same order
+#
+# Each row is one chunk of an article (see chunking.py). "id" is a UUID derived
+# from the article URL and chunk index, so it stays stable across runs and
+# doubles as the Qdrant point ID; "article_id" groups chunks of one article.
+# "content_hash" changes whenever the chunk's title or text does, which is
+# what incremental ingest keys on. Rows written before chunking have no
+# chunk_index and use the article ID as their own.
+#
+# The old pretty-printed article_embeddings.json is still supported as a debug
+# export and as an input for conversion.
+
+import argparse
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+
+EMBEDDINGS_DIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_BASE = os.path.join(EMBEDDINGS_DIR, "article_embeddings")
+METADATA_FIELDS = ("id", "article_id", "chunk_index", "content_hash", "title", "url", "text")
+
+def article_id(url):
+    """Stable point ID for an article, derived from its URL"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, url))
+
+def content_hash(article):
+    """Hash of the fields that feed the embedding and payload"""
+    digest = hashlib.sha256()
+    for field in ("title", "url", "text"):
+        digest.update(article.get(field, "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def chunk_id(url, chunk_index):
+    """Stable point ID for one chunk of an article"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{url}#{chunk_index}"))
+
+def with_ids(article):
+    """Return the metadata fields of an article or chunk, filling in ids and content_hash if missing"""
+    meta = {k: article[k] for k in ("title", "url", "text")}
+    meta["article_id"] = article.get("article_id") or article_id(article["url"])
+    if "chunk_index" in article:
+        meta["chunk_index"] = article["chunk_index"]
+        meta["id"] = article.get("id") or chunk_id(article["url"], article["chunk_index"])
+    else:
+        meta["chunk_index"] = 0
+        meta["id"] = article.get("id") or meta["article_id"]
+    meta["content_hash"] = article.get("content_hash") or content_hash(article)
+    return {k: meta[k] for k in METADATA_FIELDS}
+
+def matrix_path(base=DEFAULT_BASE):
+    return f"{base}.npy"
+
+def metadata_path(base=DEFAULT_BASE):
+    return f"{base}.meta.jsonl"
+
+def json_path(base=DEFAULT_BASE):
+    return f"{base}.json"
+
+def store_exists(base=DEFAULT_BASE):
+    return os.path.exists(matrix_path(base)) and os.path.exists(metadata_path(base))
+
+def save_store(embeddings, articles, base=DEFAULT_BASE):
+    """Write the embedding matrix as float32 .npy and the article fields as JSON lines"""
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(articles):
+        raise ValueError(f"Expected {len(articles)} embedding rows, got shape {matrix.shape}")
+
+    # Write to temp files and swap them in, so readers holding a memory map of the
+    # old matrix are unaffected and a crash never leaves a half-written store
+    with open(matrix_path(base) + ".tmp", "wb") as f:
+        np.save(f, matrix)
+    with open(metadata_path(base) + ".tmp", "w", encoding="utf-8") as f:
+        for article in articles:
+            f.write(json.dumps(with_ids(article), ensure_ascii=False))
+            f.write("\n")
+    os.replace(matrix_path(base) + ".tmp", matrix_path(base))
+    os.replace(metadata_path(base) + ".tmp", metadata_path(base))
+
+def load_matrix(base=DEFAULT_BASE, mmap=True):
+    """Return the embedding matrix, memory-mapped read-only by default"""
+    return np.load(matrix_path(base), mmap_mode="r" if mmap else None)
+
+def iter_metadata(base=DEFAULT_BASE):
+    with open(metadata_path(base), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield with_ids(json.loads(line))
+
+def iter_records(base=DEFAULT_BASE):
+    """
+    Stream (metadata, vector) pairs without loading the corpus into memory.
+    Vectors are float32 row views into the memory-mapped matrix.
+    """
+    matrix = load_matrix(base)
+    count = 0
+    for i, meta in enumerate(iter_metadata(base)):
+        yield meta, matrix[i]
+        count += 1
+    if count != matrix.shape[0]:
+        raise ValueError(f"Metadata has {count} rows but the embedding matrix has {matrix.shape[0]}")
+
+def iter_json_records(path):
+    """Read (metadata, vector) pairs from the legacy JSON format"""
+    with open(path, "r", encoding="utf-8") as f:
+        articles = json.load(f)
+    for article in articles:
+        yield with_ids(article), np.asarray(article["embedding"], dtype=np.float32)
+
+def iter_any(base=DEFAULT_BASE):
+    """Prefer the binary store and fall back to the legacy JSON file"""
+    if store_exists(base):
+        return iter_records(base)
+    return iter_json_records(json_path(base))
+
+def store_fingerprint(base=DEFAULT_BASE):
+    """Hash of the store files on disk, used to skip ingest when Qdrant already has this exact data"""
+    paths = [matrix_path(base), metadata_path(base)] if store_exists(base) else [json_path(base)]
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def load_index(base=DEFAULT_BASE):
+    """Map article id -> (row, content_hash) for the current store, empty if there is none"""
+    if not store_exists(base):
+        return {}
+    return {meta["id"]: (row, meta["content_hash"]) for row, meta in enumerate(iter_metadata(base))}
+
+def export_json(base=DEFAULT_BASE, output=None):
+    """Write the legacy pretty-printed JSON format, for debugging"""
+    output = output or json_path(base)
+    vector_data = [
+        {
+            "title": meta["title"],
+            "embedding": vector.tolist(),
+            "text": meta["text"],
+            "url": meta["url"]
+        }
+        for meta, vector in iter_records(base)
+    ]
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(vector_data, f, indent=2, ensure_ascii=False)
+    return output
+
+def convert_json(path, base=DEFAULT_BASE):
+    """Convert a legacy JSON embeddings file into the binary store"""
+    records = list(iter_json_records(path))
+    metas = [meta for meta, _ in records]
+    matrix = np.stack([vector for _, vector in records]) if records else np.zeros((0, 384), dtype=np.float32)
+    save_store(matrix, metas, base)
+    return len(records)
+
+def merge_store(chunks, vectors, base=DEFAULT_BASE):
+    """
+    Write `chunks` and their vectors into the store, replacing every stored chunk of
+    the articles they belong to, and swap the result in as save_store does.
+    Kept rows are streamed from the old store, so memory stays at the size of `chunks`.
+    Returns the number of rows in the new store.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(chunks), -1)
+    metas = [with_ids(chunk) for chunk in chunks]
+    replaced = {meta["article_id"] for meta in metas}
+    has_store = store_exists(base) or os.path.exists(json_path(base))
+    kept = 0
+    if has_store:
+        for meta, vector in iter_any(base):
+            if meta["article_id"] not in replaced:
+                if vector.shape[0] != vectors.shape[1]:
+                    raise ValueError(f"Store vectors have {vector.shape[0]} dimensions, new ones {vectors.shape[1]}")
+                kept += 1
+
+    # Same temp-and-swap as save_store, filled row by row instead of from one matrix
+    matrix = np.lib.format.open_memmap(matrix_path(base) + ".tmp", mode="w+", dtype=np.float32,
+                                       shape=(kept + len(metas), vectors.shape[1]))
+    with open(metadata_path(base) + ".tmp", "w", encoding="utf-8") as f:
+        row = 0
+        if has_store:
+            for meta, vector in iter_any(base):
+                if meta["article_id"] not in replaced:
+                    matrix[row] = vector
+                    f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+                    row += 1
+        matrix[row:] = vectors
+        for meta in metas:
+            f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+    matrix.flush()
+    del matrix
+    os.replace(matrix_path(base) + ".tmp", matrix_path(base))
+    os.replace(metadata_path(base) + ".tmp", metadata_path(base))
+    return kept + len(metas)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between the JSON and binary embedding formats")
+    sub = parser.add_subparsers(dest="command", required=True)
+    to_bin = sub.add_parser("convert", help="JSON -> .npy + .jsonl")
+    to_bin.add_argument("input", nargs="?", default=json_path())
+    to_json = sub.add_parser("export-json", help=".npy + .jsonl -> JSON")
+    to_json.add_argument("output", nargs="?", default=None)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        count = convert_json(args.input)
+        print(f"✅ Converted {count} embeddings to {matrix_path()} and {metadata_path()}")
+        print("Rebuild the keyword index with: python embeddings/bm25_index.py")
+    else:
+        output = export_json(output=args.output)
+        print(f"✅ Exported embeddings to {output}")
@@ -1,41 +1,58 @@
 # embeddings/generate_embeddings.py
 
-import json
-from sentence_transformers import SentenceTransformer
+import argparse
 import os
 
-# Create embeddings directory if it doesn't exist
-os.makedirs("../embeddings", exist_ok=True)
-
-# Load articles
-with open("../data/data/articles_from_sitemap.json", "r", encoding="utf-8") as f:
-    articles = json.load(f)
-
-# Load the sentence transformer model
-model = SentenceTransformer("all-MiniLM-L6-v2")
-
-# Extract texts and titles
-texts = [article["text"] for article in articles]
-titles = [article["title"] for article in articles]
-
-# Generate embeddings
-embeddings = model.encode(texts, show_progress_bar=True)
-
-# Prepare data to save
-vector_data = [
-    {
-        "title": titles[i],
-        "embedding": embeddings[i].tolist(),  # Convert NumPy array to list
-        "text": texts[i],
-        "url": articles[i]["url"]
-    }
-    for i in range(len(texts))
-]
-
-# Save to JSON
-output_dir = os.path.dirname(os.path.realpath(__file__))
-output_path = os.path.join(output_dir, "article_embeddings.json")
-with open(output_path, "w", encoding="utf-8") as f:
-    json.dump(vector_data, f, indent=2, ensure_ascii=False)
-
-print(f"✅ Saved {len(vector_data)} embeddings to {output_path}")
\ No newline at end of file
+from embedding_store import DEFAULT_BASE, matrix_path, metadata_path, export_json
+from chunking import CHUNK_WORDS, OVERLAP_WORDS
+from bm25_index import build_index, bm25_path
+from bulk_embed import embed_corpus, default_workers, BATCH_SIZE, WINDOW_CHUNKS
+from encoder_backends import ENCODER_BACKEND, ENCODER_BACKENDS
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed scraped articles into the binary embedding store")
+    parser.add_argument("--input", default="../data/data/articles_from_sitemap.json",
+                        help="Articles as a JSON array, JSON lines or the data/article_cache.sqlite cache")
+    parser.add_argument("--json", action="store_true", help="Also write the legacy article_embeddings.json for debugging")
+    parser.add_argument("--full", action="store_true", help="Re-embed every article instead of only new or changed ones")
+    parser.add_argument("--chunk-words", type=int, default=CHUNK_WORDS, help="Maximum words per chunk")
+    parser.add_argument("--overlap-words", type=int, default=OVERLAP_WORDS, help="Words carried over between chunks")
+    parser.add_argument("--backend", choices=ENCODER_BACKENDS, default=ENCODER_BACKEND, help="Encoder backend")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Encoder processes")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="Intra-op threads per encoder process (default: cores / workers)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Texts per encode call")
+    parser.add_argument("--window", type=int, default=WINDOW_CHUNKS,
+                        help="Chunks sorted by length and checkpointed together")
+    parser.add_argument("--no-resume", action="store_true", help="Start over instead of resuming an interrupted run")
+    args = parser.parse_args()
+
+    # Create embeddings directory if it doesn't exist
+    os.makedirs("../embeddings", exist_ok=True)
+
+    stats = embed_corpus(
+        args.input,
+        DEFAULT_BASE,
+        full=args.full,
+        resume=not args.no_resume,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        batch_size=args.batch_size,
+        window=args.window,
+        chunk_words=args.chunk_words,
+        overlap_words=args.overlap_words,
+        backend=args.backend
+    )
+    print(f"✅ Saved {stats['chunks']} embeddings to {matrix_path()} and {metadata_path()} "
+          f"({stats['encoded']} encoded, {stats['reused']} unchanged, {stats['removed']} removed)")
+
+    # Keyword index over the same rows, for sparse and hybrid retrieval
+    build_index(DEFAULT_BASE)
+    print(f"✅ Built BM25 index at {bm25_path()}")
+
+    if args.json:
+        output_path = export_json()
+        print(f"✅ Exported JSON copy to {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# embeddings/quantization.py
+#
+# Compressed copies of the embedding matrix for the first search pass. Rows are
+# scored on the codes, the best `oversampling` x k candidates are rescored with
+# the float32 rows, and only those rows are read from the memory-mapped store.
+#   scalar  int8 per dimension, 4x smaller, recall close to float
+#   binary  1 bit per dimension, 32x smaller, needs more oversampling at 384 dims
+#
+# The same setting drives the Qdrant collection's quantization config.
+
+import os
+
+import numpy as np
+
+QUANTIZATION_MODES = ("none", "scalar", "binary")
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "3.0"))
+QUANTIZATION_RESCORE = os.getenv("QUANTIZATION_RESCORE", "1") == "1"
+# Share of values kept inside the int8 range; the tails get clipped, as in Qdrant
+SCALAR_QUANTILE = 0.99
+# Rows converted per block when scoring int8 codes, bounding the float32 scratch space
+SCORE_BLOCK_ROWS = 2048
+
+def check_mode(mode):
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown vector quantization: {mode} (expected one of {', '.join(QUANTIZATION_MODES)})")
+    return mode
+
+class ScalarQuantizer:
+    """int8 codes of the unit-normalized rows, with one offset and scale per dimension"""
+
+    def __init__(self, matrix, inv_norms, quantile=SCALAR_QUANTILE):
+        tail = (1 - quantile) / 2
+        low, high = [], []
+        for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+            block = matrix[start:start + SCORE_BLOCK_ROWS] * inv_norms[start:start + SCORE_BLOCK_ROWS, None]
+            low.append(np.quantile(block, tail, axis=0))
+            high.append(np.quantile(block, 1 - tail, axis=0))
+        self.low = np.min(low, axis=0).astype(np.float32) if low else np.zeros(matrix.shape[1], np.float32)
+        high = np.max(high, axis=0).astype(np.float32) if high else np.ones(matrix.shape[1], np.float32)
+        self.scale = np.maximum(high - self.low, 1e-9) / 255.0
+
+        self.codes = np.empty(matrix.shape, dtype=np.int8)
+        for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+            block = matrix[start:start + SCORE_BLOCK_ROWS] * inv_norms[start:start + SCORE_BLOCK_ROWS, None]
+            levels = np.clip(np.rint((block - self.low) / self.scale), 0, 255)
+            self.codes[start:start + SCORE_BLOCK_ROWS] = (levels - 128).astype(np.int8)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def scores(self, query):
+        """
+        Approximate dot products with a unit query. Rows decode as low + scale * (code + 128),
+        so q . row = q . low + (q * scale) . (code + 128); the first term is the same for every row.
+        """
+        weights = (query * self.scale).astype(np.float32)
+        offset = float(weights.sum()) * 128 + float(query @ self.low)
+        scores = np.empty(self.codes.shape[0], dtype=np.float32)
+        for start in range(0, self.codes.shape[0], SCORE_BLOCK_ROWS):
+            block = self.codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + SCORE_BLOCK_ROWS] = block @ weights
+        return scores + offset
+
+class BinaryQuantizer:
+    """
+    Sign bit per dimension, packed; rows are ranked by Hamming distance to the query's bits.
+    Sentence embeddings share a strong common direction, so bits are taken after
+    subtracting the corpus mean, or most of them would be identical for every row.
+    """
+
+    def __init__(self, matrix, inv_norms):
+        self.dim = matrix.shape[1]
+        total = np.zeros(self.dim, dtype=np.float64)
+        for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+            total += (matrix[start:start + SCORE_BLOCK_ROWS] * inv_norms[start:start + SCORE_BLOCK_ROWS, None]).sum(axis=0)
+        self.mean = (total / max(matrix.shape[0], 1)).astype(np.float32)
+
+        self.codes = np.empty((matrix.shape[0], (self.dim + 7) // 8), dtype=np.uint8)
+        for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+            block = matrix[start:start + SCORE_BLOCK_ROWS] * inv_norms[start:start + SCORE_BLOCK_ROWS, None]
+            self.codes[start:start + SCORE_BLOCK_ROWS] = np.packbits(block > self.mean, axis=1)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def scores(self, query):
+        """Agreeing bits minus disagreeing ones, scaled to [-1, 1] like a cosine"""
+        bits = np.packbits(query > self.mean)
+        distance = np.bitwise_count(np.bitwise_xor(self.codes, bits)).sum(axis=1, dtype=np.int32)
+        return 1.0 - 2.0 * distance.astype(np.float32) / self.dim
+
+def make_quantizer(mode, matrix, inv_norms):
+    """Build the quantizer for `mode`, or None for full-precision search"""
+    if check_mode(mode) == "scalar":
+        return ScalarQuantizer(matrix, inv_norms)
+    if mode == "binary":
+        return BinaryQuantizer(matrix, inv_norms)
+    return None
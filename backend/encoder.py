@@ -0,0 +1,239 @@
+# backend/encoder.py
+
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from embedding_cache import EmbeddingCache, normalize_query
+from encoder_backends import load_encoder, MODEL_NAME, ENCODER_BACKEND
+
+ENCODE_THREADS = int(os.getenv("ENCODE_THREADS", "2"))
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "32"))
+ENCODE_MAX_WAIT_MS = float(os.getenv("ENCODE_MAX_WAIT_MS", "5"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "0")) or None  # seconds, 0 disables expiry
+EMBEDDING_CACHE_REDIS = os.getenv("EMBEDDING_CACHE_REDIS", "0") == "1"
+# Forward-pass size for explicit query batches; each pass pads only to its own longest query
+BULK_ENCODE_BATCH_SIZE = int(os.getenv("BULK_ENCODE_BATCH_SIZE", "64"))
+
+# Bounded pool so CPU-heavy encoding never runs on the event loop thread
+_executor = ThreadPoolExecutor(max_workers=ENCODE_THREADS, thread_name_prefix="encode")
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Load the encoder selected by ENCODER_BACKEND on first use"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = load_encoder()
+    return _model
+
+def is_model_loaded():
+    return _model is not None
+
+def encode_query(text):
+    """Encode a single query string into a list of floats"""
+    return get_model().encode([text])[0].tolist()
+
+def encode_batch(texts):
+    """Encode a list of query strings in one forward pass"""
+    return get_model().encode(texts).tolist()
+
+def encode_bucketed(texts, batch_size=BULK_ENCODE_BATCH_SIZE):
+    """
+    Encode many queries in length-sorted passes of `batch_size`, so short queries
+    aren't padded to the longest one in the whole list. Vectors come back in input order.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    vectors = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        for i, vector in zip(batch, encode_batch([texts[i] for i in batch])):
+            vectors[i] = vector
+    return vectors
+
+class EmbeddingBatcher:
+    """
+    Micro-batches queries from concurrent requests into a single encode call.
+
+    A batch is dispatched once `max_batch_size` queries are waiting or the
+    first query in it has waited `max_wait_ms`. At most `max_in_flight`
+    batches run at once; while they are busy new queries keep queueing, so
+    batches grow with load.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=32, max_wait_ms=5.0,
+                 executor=None, max_in_flight=1):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self._loop = None
+        self._queue = None
+        self._slots = None
+        self._worker = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.batches = 0
+        self.queries = 0
+        self.batch_sizes = Counter()
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._worker = loop.create_task(self._run())
+
+    async def encode(self, text):
+        """Queue a query and wait for its own vector"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            self._record(batch)
+            self._loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            texts = [text for text, _, _ in batch]
+            vectors = await self._loop.run_in_executor(self.executor, self.encode_fn, texts)
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def _record(self, batch):
+        now = time.perf_counter()
+        self.batches += 1
+        self.queries += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        for _, _, enqueued_at in batch:
+            wait = now - enqueued_at
+            self.total_wait += wait
+            self.max_wait_seen = max(self.max_wait_seen, wait)
+
+    def stats(self):
+        """Batch-size and queue-wait metrics for tuning max_batch_size and max_wait_ms"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "avg_queue_wait_ms": self.total_wait / self.queries * 1000 if self.queries else 0.0,
+            "max_queue_wait_ms": self.max_wait_seen * 1000,
+        }
+
+batcher = EmbeddingBatcher(
+    encode_batch,
+    max_batch_size=ENCODE_BATCH_SIZE,
+    max_wait_ms=ENCODE_MAX_WAIT_MS,
+    executor=_executor,
+    max_in_flight=ENCODE_THREADS,
+)
+
+def _make_cache():
+    redis_client = None
+    if EMBEDDING_CACHE_REDIS:
+        import redis.asyncio as redis
+        redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    return EmbeddingCache(
+        maxsize=EMBEDDING_CACHE_SIZE,
+        ttl=EMBEDDING_CACHE_TTL,
+        redis_client=redis_client,
+        # Backends agree only within a tolerance, so each keeps its own entries
+        namespace=f"embcache:{MODEL_NAME}:{ENCODER_BACKEND}",
+    )
+
+cache = _make_cache()
+_in_flight = {}
+
+async def encode_query_async(text):
+    """
+    Encode a query through the embedding cache and micro-batcher without blocking the event loop.
+    The normalized text is only the cache key; the model sees the query as typed,
+    so entities like "AT&T" or "S&P 500" keep their punctuation.
+    """
+    key = normalize_query(text)
+    vector = await cache.get(key)
+    if vector is not None:
+        return vector
+
+    # Identical queries that miss at the same time share one encode
+    pending = _in_flight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = asyncio.ensure_future(batcher.encode(text))
+    _in_flight[key] = pending
+    try:
+        vector = await asyncio.shield(pending)
+    finally:
+        _in_flight.pop(key, None)
+    await cache.put(key, vector)
+    return vector
+
+async def encode_queries_async(texts):
+    """
+    Encode a list of queries for a batch request: cached vectors are reused and the
+    distinct misses are encoded together in one trip to the encoder pool, bypassing
+    the micro-batcher. Vectors come back in input order.
+    """
+    keys = [normalize_query(text) for text in texts]
+    unique = list(dict.fromkeys(keys))
+    cached = await asyncio.gather(*(cache.get(key) for key in unique))
+    vectors = {key: vector for key, vector in zip(unique, cached) if vector is not None}
+
+    missing = [key for key in unique if key not in vectors]
+    if missing:
+        # The first spelling of each key is the one encoded
+        originals = {}
+        for key, text in zip(keys, texts):
+            originals.setdefault(key, text)
+        loop = asyncio.get_running_loop()
+        encoded = await loop.run_in_executor(_executor, encode_bucketed, [originals[key] for key in missing])
+        for key, vector in zip(missing, encoded):
+            vectors[key] = vector
+            await cache.put(key, vector)
+    return [vectors[key] for key in keys]
@@ -0,0 +1,160 @@
+# backend/encoder_backends.py
+#
+# Interchangeable query encoders, all returning float32 rows that match
+# SentenceTransformer(MODEL_NAME).encode:
+#   torch      sentence-transformers on PyTorch
+#   onnx       the same network exported to ONNX and run by ONNX Runtime
+#   onnx-int8  the ONNX export with dynamically quantized int8 weights
+#
+# The ONNX backends need neither torch nor sentence-transformers at runtime.
+# Export them once (this step does need torch) with:
+#     python encoder_backends.py export
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ENCODER_MODEL_DIR = os.getenv("ENCODER_MODEL_DIR", os.path.join(BACKEND_DIR, "models", f"{MODEL_NAME}-onnx"))
+# Intra-op threads per worker process; 0 keeps the library default (one per core).
+# Lower it to run more uvicorn workers per machine without them fighting over cores.
+ENCODER_NUM_THREADS = int(os.getenv("ENCODER_NUM_THREADS", "0"))
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+CONFIG_FILE = "encoder_config.json"
+TOKENIZER_FILE = "tokenizer.json"
+
+class TorchEncoder:
+    """sentence-transformers on PyTorch"""
+
+    def __init__(self, model_name=MODEL_NAME, num_threads=ENCODER_NUM_THREADS):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.name = "torch"
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts):
+        return self.model.encode(texts, batch_size=max(len(texts), 1), convert_to_numpy=True).astype(np.float32, copy=False)
+
+class OnnxEncoder:
+    """The exported transformer on ONNX Runtime, with the model's pooling and normalization done in NumPy"""
+
+    def __init__(self, model_dir=ENCODER_MODEL_DIR, quantized=False, num_threads=ENCODER_NUM_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; export it with: python encoder_backends.py export")
+        with open(os.path.join(model_dir, CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32, copy=False)
+
+def load_encoder(backend=ENCODER_BACKEND, num_threads=ENCODER_NUM_THREADS):
+    """Build the encoder selected by the ENCODER_BACKEND setting"""
+    if backend == "torch":
+        return TorchEncoder(num_threads=num_threads)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEncoder(quantized=backend == "onnx-int8", num_threads=num_threads)
+    raise ValueError(f"Unknown ENCODER_BACKEND: {backend} (expected one of {', '.join(ENCODER_BACKENDS)})")
+
+def export_onnx(model_name=MODEL_NAME, model_dir=ENCODER_MODEL_DIR, int8=True):
+    """Export the transformer, tokenizer and pooling settings; optionally add an int8 copy"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    network = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    pooling = next((m for m in model if isinstance(m, Pooling)), None)
+    pooling_mode = pooling.get_pooling_mode_str() if pooling is not None else "mean"
+    if pooling_mode not in ("mean", "cls"):
+        raise ValueError(f"{model_name} uses {pooling_mode} pooling, which the ONNX backend does not implement")
+
+    os.makedirs(model_dir, exist_ok=True)
+    sample = tokenizer(["export sample", "a second, longer export sample"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    onnx_path = os.path.join(model_dir, ONNX_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            network,
+            tuple(sample[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False
+        )
+
+    tokenizer.save_pretrained(model_dir)
+    with open(os.path.join(model_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "max_seq_length": model.max_seq_length,
+            "pooling": pooling_mode,
+            "normalize": any(isinstance(m, Normalize) for m in model),
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+        }, f, indent=2)
+
+    written = [onnx_path]
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(model_dir, ONNX_INT8_FILE)
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+        written.append(int8_path)
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the query encoder backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export the embedding model to ONNX (and int8 ONNX)")
+    export.add_argument("--model", default=MODEL_NAME)
+    export.add_argument("--output", default=ENCODER_MODEL_DIR)
+    export.add_argument("--no-int8", action="store_true", help="Skip the int8-quantized copy")
+    args = parser.parse_args()
+
+    for path in export_onnx(args.model, args.output, int8=not args.no_int8):
+        print(f"✅ Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
@@ -1,5 +1,36 @@
+# backend/gemini_client.py
+#
+# Answers come from Gemini's REST API through one long-lived GeminiClient:
+#   - a pooled httpx client, so connections are reused across requests
+#   - identical prompts already in flight share one upstream call (single-flight)
+#   - at most GEMINI_MAX_CONCURRENCY calls upstream at once
+#   - every call has a deadline (GEMINI_TIMEOUT)
+#   - after GEMINI_BREAKER_THRESHOLD failures in a row (or a 429) a circuit
+#     breaker opens and requests go straight to simple_local_response until a
+#     trial call succeeds after GEMINI_BREAKER_COOLDOWN seconds
+# Point GEMINI_API_BASE at bench/fake_gemini.py to run without the real API.
+
+import asyncio
+import json
 import os
-from typing import List, Dict, Any
+import re
+import time
+from typing import List, Dict, Any, AsyncIterator
+
+import httpx
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+# Longest a request waits for an upstream slot before answering locally
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+# Cap on how long a 429's Retry-After keeps the breaker open
+GEMINI_MAX_RETRY_AFTER = float(os.getenv("GEMINI_MAX_RETRY_AFTER", "300"))
+
+FALLBACK_NOTE = "Note: This is a simplified response as the AI service is currently unavailable."
 
 # Define a fallback function for when API is unavailable
 def simple_local_response(query: str, passages: List[Dict[str, Any]]) -> str:
@@ -23,36 +54,23 @@ def simple_local_response(query: str, passages: List[Dict[str, Any]]) -> str:
     for p in relevant_passages:
         response += f"From {p['title']}: {p['text'][:150]}...\n\n"
     
-    response += "\nNote: This is a simplified response as the AI service is currently unavailable."
+    response += "\n" + FALLBACK_NOTE
     return response
 
-def generate_gemini_response(query: str, passages: List[Dict[str, Any]]) -> str:
-    """
-    Generate a response using Google's Gemini API based on the query and retrieved passages.
-    Falls back to local processing if API is unavailable.
-    """
-    try:
-        # Try to import the Google AI package - if not installed, fall back to local method
-        import google.generativeai as genai
-        from google.api_core.exceptions import NotFound, ResourceExhausted
-    except ImportError:
-        # Package not installed
-        return simple_local_response(query, passages) + "\n\nError: Google Generative AI package not installed. Run 'pip install google-generativeai'."
-
-    # Set your API key - preferably from environment variable
-    GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "test_key")
-    
-    try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-        
-        # Format context from passages
-        context = "\n\n".join([
-            f"Title: {p['title']}\nText: {p['text']}\nURL: {p['url']}"
-            for p in passages
-        ])
-        
-        # Create prompt with query and context
-        prompt = f"""
+def is_fallback_response(text: str) -> bool:
+    """True when the answer came from simple_local_response rather than Gemini"""
+    return FALLBACK_NOTE in text
+
+def build_prompt(query: str, passages: List[Dict[str, Any]]) -> str:
+    """Build the Gemini prompt from the query and retrieved passages"""
+    # Format context from passages
+    context = "\n\n".join([
+        f"Title: {p['title']}\nText: {p['text']}\nURL: {p['url']}"
+        for p in passages
+    ])
+
+    # Create prompt with query and context
+    return f"""
         User Query: {query}
         
         Context Information:
@@ -62,16 +80,327 @@ def generate_gemini_response(query: str, passages: List[Dict[str, Any]]) -> str:
         If the information isn't sufficient, please indicate what's missing.
         Include relevant facts from the provided context.
         """
-        
-        # Try to use a model that's more likely to be available with free tier
+
+class GeminiError(Exception):
+    """A failed Gemini call; `status` is the HTTP status, if there was a response"""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def unhealthy(self):
+        """Whether the failure says something about the API rather than this prompt"""
+        return self.status != 400
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `threshold` consecutive failures it opens and
+    calls are refused for `cooldown` seconds (or a 429's Retry-After), then one
+    trial call is let through (half-open); its outcome closes or reopens it.
+    """
+
+    def __init__(self, threshold=GEMINI_BREAKER_THRESHOLD, cooldown=GEMINI_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.trial_started = 0.0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        if self.failures < self.threshold:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half_open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        # A trial that never reported back (e.g. its request was cancelled) is given up on after a cooldown
+        if state == "half_open" and (not self.trial_in_flight or time.monotonic() - self.trial_started > self.cooldown):
+            self.trial_in_flight = True
+            self.trial_started = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self, retry_after=None):
+        self.trial_in_flight = False
+        self.failures += 1
+        if retry_after is not None:
+            # Rate limited: no point trying again before the API says so
+            self.failures = max(self.failures, self.threshold)
+        if self.failures >= self.threshold:
+            cooldown = self.cooldown if retry_after is None else max(self.cooldown, retry_after)
+            self.open_until = time.monotonic() + cooldown
+            self.opened += 1
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "open_for_seconds": max(0.0, round(self.open_until - time.monotonic(), 1)),
+        }
+
+def _retry_after(response):
+    try:
+        return min(float(response.headers.get("Retry-After", "")), GEMINI_MAX_RETRY_AFTER)
+    except ValueError:
+        return GEMINI_BREAKER_COOLDOWN if response.status_code == 429 else None
+
+def _response_text(data):
+    """Concatenated text parts of the first candidate, as the SDK's response.text"""
+    candidates = data.get("candidates") or []
+    if not candidates:
+        reason = (data.get("promptFeedback") or {}).get("blockReason", "no candidates")
+        raise GeminiError(f"Gemini returned no answer: {reason}", status=400)
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+class GeminiClient:
+    """Long-lived Gemini client shared by every request; see the module comment"""
+
+    def __init__(self, api_key=None, model=GEMINI_MODEL, base_url=GEMINI_API_BASE,
+                 max_concurrency=GEMINI_MAX_CONCURRENCY, timeout=GEMINI_TIMEOUT,
+                 queue_timeout=GEMINI_QUEUE_TIMEOUT, breaker=None, transport=None):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.transport = transport
+        self._http = None
+        self._loop = None
+        self._slots = None
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.fallbacks = 0
+        self.active = 0
+        self.max_active = 0
+
+    def _bind(self):
+        """The HTTP client and semaphore belong to the running event loop; rebuild them if it changed"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._in_flight = {}
+            self._http = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self._loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _url(self, method):
+        return f"{self.base_url}/models/{self.model}:{method}"
+
+    def _headers(self):
+        return {"x-goog-api-key": self.api_key or os.environ.get("GOOGLE_API_KEY", "test_key")}
+
+    @staticmethod
+    def _payload(prompt):
+        return {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+
+    async def _acquire(self):
         try:
-            model = genai.GenerativeModel('gemini-2.0-flash')  # Use standard model first
-            response = model.generate_content(prompt)
-            return response.text
-        except (NotFound, ResourceExhausted) as e:
-            # If rate limited or model not found, fall back to local method
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise GeminiError(f"No Gemini slot free within {self.queue_timeout:.0f}s") from None
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+
+    def _release(self):
+        self.active -= 1
+        self._slots.release()
+
+    def _failed(self, error):
+        self.failures += 1
+        if isinstance(error, GeminiError) and not error.unhealthy:
+            # A bad prompt isn't a sign the API is down
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure(getattr(error, "retry_after", None))
+
+    @staticmethod
+    def _check(response):
+        if response.status_code >= 400:
+            raise GeminiError(f"Gemini API returned {response.status_code}: {response.text[:200]}",
+                              status=response.status_code, retry_after=_retry_after(response))
+
+    async def generate(self, prompt: str) -> str:
+        """One Gemini answer for `prompt`; raises GeminiError when the breaker is open or the call fails"""
+        http = self._bind()
+        if not self.breaker.allow():
+            raise GeminiError("Gemini circuit breaker is open")
+        self.calls += 1
+        await self._acquire()
+        try:
+            response = await asyncio.wait_for(
+                http.post(self._url("generateContent"), headers=self._headers(), json=self._payload(prompt)),
+                self.timeout
+            )
+            self._check(response)
+            text = _response_text(response.json())
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            error = GeminiError(f"Gemini call timed out after {self.timeout:.0f}s")
+            self._failed(error)
+            raise error from None
+        except (GeminiError, httpx.HTTPError, ValueError) as e:
+            if isinstance(e, httpx.TimeoutException):
+                self.timeouts += 1
+            self._failed(e)
+            raise e if isinstance(e, GeminiError) else GeminiError(f"Gemini call failed: {e!r}") from e
+        finally:
+            self._release()
+        self.breaker.record_success()
+        return text
+
+    async def generate_coalesced(self, prompt: str) -> str:
+        """generate(), with identical prompts already in flight sharing one upstream call"""
+        self._bind()
+        pending = self._in_flight.get(prompt)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        pending = asyncio.ensure_future(self.generate(prompt))
+        self._in_flight[prompt] = pending
+        try:
+            return await asyncio.shield(pending)
+        finally:
+            if self._in_flight.get(prompt) is pending:
+                del self._in_flight[prompt]
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Text pieces of one Gemini answer as they arrive; raises GeminiError as generate() does"""
+        http = self._bind()
+        if not self.breaker.allow():
+            raise GeminiError("Gemini circuit breaker is open")
+        self.calls += 1
+        await self._acquire()
+        deadline = time.monotonic() + self.timeout
+        try:
+            async with http.stream("POST", self._url("streamGenerateContent"), params={"alt": "sse"},
+                                   headers=self._headers(), json=self._payload(prompt)) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    self._check(response)
+                async for line in response.aiter_lines():
+                    if time.monotonic() > deadline:
+                        self.timeouts += 1
+                        raise GeminiError(f"Gemini stream exceeded {self.timeout:.0f}s")
+                    if line.startswith("data:"):
+                        text = _response_text(json.loads(line[5:]))
+                        if text:
+                            yield text
+        except (GeminiError, httpx.HTTPError, ValueError) as e:
+            if isinstance(e, httpx.TimeoutException):
+                self.timeouts += 1
+            self._failed(e)
+            raise e if isinstance(e, GeminiError) else GeminiError(f"Gemini stream failed: {e!r}") from e
+        finally:
+            self._release()
+        self.breaker.record_success()
+
+    async def answer(self, query: str, passages: List[Dict[str, Any]]) -> str:
+        """Gemini's answer, or the local fallback when the call fails or the breaker is open"""
+        try:
+            return await self.generate_coalesced(build_prompt(query, passages))
+        except GeminiError as e:
+            self.fallbacks += 1
             return simple_local_response(query, passages) + f"\n\nAPI Error: {str(e)}"
-        
-    except Exception as e:
-        # Catch-all for other errors
-        return simple_local_response(query, passages) + f"\n\nError: {str(e)}"
\ No newline at end of file
+
+    async def answer_stream(self, query: str, passages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """
+        Stream a Gemini answer as text pieces as they arrive.
+        Errors before the first piece stream the local fallback instead; errors
+        after it are raised, since the answer already sent is incomplete and must
+        not be cached or stored as if it were whole.
+        """
+        started = False
+        try:
+            async for piece in self.stream(build_prompt(query, passages)):
+                started = True
+                yield piece
+        except GeminiError as e:
+            if started:
+                raise
+            else:
+                self.fallbacks += 1
+                async for piece in stream_local_response(query, passages, f"\n\nAPI Error: {str(e)}"):
+                    yield piece
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "fallbacks": self.fallbacks,
+            "in_flight": self.active,
+            "max_in_flight": self.max_active,
+            "max_concurrency": self.max_concurrency,
+            "breaker": self.breaker.stats(),
+        }
+
+gemini = GeminiClient()
+
+def generate_gemini_response(query: str, passages: List[Dict[str, Any]]) -> str:
+    """
+    Generate a response using Google's Gemini API based on the query and retrieved passages.
+    Falls back to local processing if API is unavailable. Blocking; for scripts.
+    """
+    async def answer_once():
+        # A client of its own, closed on the loop it was opened on; the shared one stays
+        # bound to the server's loop. It still shares the circuit breaker.
+        async with GeminiClient(api_key=gemini.api_key, model=gemini.model, base_url=gemini.base_url,
+                                timeout=gemini.timeout, breaker=gemini.breaker) as client:
+            return await client.answer(query, passages)
+    return asyncio.run(answer_once())
+
+async def generate_gemini_response_async(query: str, passages: List[Dict[str, Any]]) -> str:
+    """Async variant of generate_gemini_response for the FastAPI request path"""
+    return await gemini.answer(query, passages)
+
+async def stream_local_response(query: str, passages: List[Dict[str, Any]], suffix: str = "") -> AsyncIterator[str]:
+    """Stream simple_local_response word by word so the fallback looks like a Gemini stream"""
+    text = simple_local_response(query, passages) + suffix
+    for piece in re.findall(r"\S+\s*|\s+", text):
+        yield piece
+        await asyncio.sleep(0)
+
+async def stream_gemini_response_async(query: str, passages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Stream a Gemini answer; see GeminiClient.answer_stream"""
+    async for piece in gemini.answer_stream(query, passages):
+        yield piece
@@ -0,0 +1,327 @@
+# backend/ingest_pipeline.py
+#
+# Streaming ingest: crawl -> extract -> embed -> upsert, each stage a generator
+# running in its own thread and connected to the next by a bounded queue. A slow
+# stage fills its input queue and blocks the stages before it (backpressure),
+# so memory stays flat, and every article is searchable as soon as its own
+# batch is upserted instead of after the whole crawl. Each upserted batch is also
+# merged into the local embedding store and the BM25 index is rebuilt, because
+# the startup sync deletes Qdrant points that the store lacks, and the NumPy
+# failover and keyword search only read the store.
+#
+# Every stage is a plain generator over an iterable, so each still runs on its
+# own: the crawler's main() (crawl + extract into a JSON file),
+# embeddings/generate_embeddings.py (embed into the local store) and
+# vector_db/store_in_qdrant.py (upsert the store).
+#
+# Run from the backend directory:
+#     python ingest_pipeline.py --limit 50
+#     python ingest_pipeline.py --articles data/data/articles_from_sitemap.json   # skip crawling
+
+import argparse
+import json
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+from itertools import islice
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "vector_db"))
+
+from embeddings.bm25_index import build_index
+from embeddings.chunking import CHUNK_WORDS, OVERLAP_WORDS, chunk_article
+from embeddings.embedding_store import DEFAULT_BASE, merge_store, with_ids
+from encoder_backends import load_encoder
+from store_in_qdrant import (
+    COLLECTION_NAME, UPSERT_MAX_RETRIES, ensure_collection, make_point, publish_ingest_generation,
+    upsert_with_retry
+)
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+EMBED_BATCH_ARTICLES = int(os.getenv("PIPELINE_EMBED_BATCH", "16"))
+UPSERT_BATCH_ARTICLES = int(os.getenv("PIPELINE_UPSERT_BATCH", "64"))
+# Answer-cache invalidations are published at most this often while streaming
+PUBLISH_INTERVAL = 5.0
+DATA_DIR = os.path.join(BACKEND_DIR, "data", "data")
+
+_DONE = object()
+
+class Channel:
+    """Bounded queue between two stages that records depth and how long each side waited"""
+
+    def __init__(self, maxsize, stop_event):
+        self.queue = queue.Queue(maxsize)
+        self.stop_event = stop_event
+        self.closed = False
+        self.items = 0
+        self.max_depth = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+
+    def put(self, item):
+        started = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.put_wait += time.monotonic() - started
+        self.items += item is not _DONE
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def close(self):
+        self.put(_DONE)
+
+    def _get(self, block):
+        started = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    item = self.queue.get(block=block, timeout=0.1 if block else None)
+                except queue.Empty:
+                    if not block:
+                        raise
+                    continue
+                if item is _DONE:
+                    self.closed = True
+                    raise queue.Empty
+                return item
+            raise queue.Empty
+        finally:
+            self.get_wait += time.monotonic() - started
+
+    def __iter__(self):
+        while not self.closed:
+            try:
+                yield self._get(block=True)
+            except queue.Empty:
+                return
+
+    def take_available(self, limit):
+        """Up to `limit` items that are already queued, without waiting"""
+        items = []
+        while len(items) < limit and not self.closed:
+            try:
+                items.append(self._get(block=False))
+            except queue.Empty:
+                break
+        return items
+
+    def depth(self):
+        return self.queue.qsize()
+
+def drain_batches(source, max_size):
+    """
+    Wait for one item, then add whatever is already queued behind it, up to `max_size`.
+    Batches grow with load but a lone item never waits for company.
+    """
+    take = getattr(source, "take_available", None)
+    iterator = iter(source)
+    for item in iterator:
+        yield [item] + (take(max_size - 1) if take else list(islice(iterator, max_size - 1)))
+
+def embed_articles(articles, encoder=None, batch_size=EMBED_BATCH_ARTICLES,
+                   chunk_words=CHUNK_WORDS, overlap_words=OVERLAP_WORDS):
+    """Stage: chunk articles and encode their chunks; yields (article, chunks, vectors)"""
+    encoder = encoder or load_encoder()
+    for batch in drain_batches(articles, batch_size):
+        chunked = [(article, [with_ids(c) for c in chunk_article(article, chunk_words, overlap_words)])
+                   for article in batch]
+        vectors = encoder.encode([c["text"] for _, chunks in chunked for c in chunks])
+        offset = 0
+        for article, chunks in chunked:
+            yield article, chunks, vectors[offset:offset + len(chunks)]
+            offset += len(chunks)
+
+def upsert_articles(embedded, client, collection_name=COLLECTION_NAME, batch_size=UPSERT_BATCH_ARTICLES,
+                    sink=None, store_base=DEFAULT_BASE, max_retries=UPSERT_MAX_RETRIES):
+    """
+    Stage: upsert embedded articles, delete chunks an updated article no longer has,
+    write each batch to the local store at `store_base` (None to skip) and append each
+    article to `sink` (a JSON-lines file object) if given.
+    Yields (url, seconds since extraction) once the article is searchable.
+    """
+    from qdrant_client.http.models import FieldCondition, Filter, FilterSelector, MatchValue, Range
+
+    ensure_collection(client, collection_name)
+    last_publish, unpublished = time.monotonic(), False
+    for batch in drain_batches(embedded, batch_size):
+        points = [make_point(chunk, vector) for _, chunks, vector_rows in batch
+                  for chunk, vector in zip(chunks, vector_rows)]
+        upsert_with_retry(client, collection_name, points, max_retries)
+
+        stale = Filter(should=[
+            Filter(must=[
+                FieldCondition(key="article_id", match=MatchValue(value=chunks[0]["article_id"])),
+                FieldCondition(key="chunk_index", range=Range(gte=len(chunks)))
+            ])
+            for _, chunks, _ in batch if chunks
+        ])
+        client.delete(collection_name=collection_name, points_selector=FilterSelector(filter=stale))
+        if store_base is not None:
+            write_local_store([(chunks, vector_rows) for _, chunks, vector_rows in batch if chunks], store_base)
+
+        if sink is not None:
+            for article, _, _ in batch:
+                sink.write(json.dumps({k: v for k, v in article.items() if not k.startswith("_")},
+                                      ensure_ascii=False) + "\n")
+            sink.flush()
+
+        unpublished = True
+        if time.monotonic() - last_publish >= PUBLISH_INTERVAL:
+            publish_ingest_generation(collection_name)
+            last_publish, unpublished = time.monotonic(), False
+
+        now = time.monotonic()
+        for article, _, _ in batch:
+            yield article["url"], now - article.get("_extracted_at", now)
+
+    if unpublished:
+        publish_ingest_generation(collection_name)
+
+def write_local_store(written, base=DEFAULT_BASE):
+    """Merge one batch of upserted (chunks, vectors) into the local embedding store and rebuild its BM25 index"""
+    if not written:
+        return 0
+    chunks = [chunk for article_chunks, _ in written for chunk in article_chunks]
+    vectors = [vector for _, vector_rows in written for vector in vector_rows]
+    rows = merge_store(chunks, vectors, base)
+    build_index(base)
+    return rows
+
+def timestamped(articles):
+    """Stage: mark when each article left extraction, for the time-to-searchable stat"""
+    for article in articles:
+        yield {**article, "_extracted_at": time.monotonic()}
+
+class Pipeline:
+    """
+    Runs a source generator and a chain of generator stages in threads joined by Channels.
+    The first exception in any stage stops the whole pipeline and is re-raised by run().
+    """
+
+    def __init__(self, source, stages, queue_size=PIPELINE_QUEUE_SIZE, report_every=10.0):
+        self.stop_event = threading.Event()
+        self.names = [name for name, _ in [source] + stages]
+        self.source = source[1]
+        self.stages = [fn for _, fn in stages]
+        self.channels = [Channel(queue_size, self.stop_event) for _ in stages]
+        self.sink = Channel(queue_size, self.stop_event)
+        self.report_every = report_every
+        self.errors = []
+        self.started = None
+        self.finished = {}
+        self.results = []
+
+    def _run_stage(self, index, output):
+        name = self.names[index]
+        try:
+            items = self.source() if index == 0 else self.stages[index - 1](self.channels[index - 1])
+            for item in items:
+                if self.stop_event.is_set():
+                    break
+                output.put(item)
+        except Exception as e:
+            self.errors.append((name, e))
+            self.stop_event.set()
+        finally:
+            self.finished[name] = time.monotonic()
+            output.close()
+
+    def stats(self):
+        """Per stage: items emitted, rate, busy share of wall time, and depth of its input queue"""
+        now = time.monotonic()
+        outputs = self.channels + [self.sink]
+        rows = []
+        for i, name in enumerate(self.names):
+            elapsed = max(self.finished.get(name, now) - self.started, 1e-9)
+            waited = outputs[i].put_wait + (self.channels[i - 1].get_wait if i else 0.0)
+            rows.append({
+                "stage": name,
+                "items": outputs[i].items,
+                "per_second": outputs[i].items / elapsed,
+                "busy": max(0.0, 1 - waited / elapsed),
+                "queue_depth": self.channels[i - 1].depth() if i else None,
+                "max_queue_depth": self.channels[i - 1].max_depth if i else None,
+            })
+        return rows
+
+    def report(self):
+        for row in self.stats():
+            depth = "" if row["queue_depth"] is None else \
+                f", input queue {row['queue_depth']} (max {row['max_queue_depth']})"
+            print(f"  {row['stage']:>8}: {row['items']} items, {row['per_second']:.1f}/s, "
+                  f"{row['busy']:.0%} busy{depth}")
+
+    def run(self):
+        """Run to completion; returns what the last stage yielded"""
+        self.started = time.monotonic()
+        threads = [
+            threading.Thread(target=self._run_stage, args=(i, output), name=f"pipeline-{self.names[i]}", daemon=True)
+            for i, output in enumerate(self.channels + [self.sink])
+        ]
+        for thread in threads:
+            thread.start()
+
+        last_report = time.monotonic()
+        for result in self.sink:
+            self.results.append(result)
+            if time.monotonic() - last_report >= self.report_every:
+                last_report = time.monotonic()
+                print(f"[{last_report - self.started:.0f}s]")
+                self.report()
+        for thread in threads:
+            thread.join()
+
+        if self.errors:
+            name, error = self.errors[0]
+            raise RuntimeError(f"Pipeline stage '{name}' failed: {error}") from error
+        return self.results
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl, extract, embed and upsert articles as one streaming pipeline")
+    parser.add_argument("--articles",
+                        help="Read extracted articles from this JSON, JSON-lines or article cache file instead of crawling")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many article URLs")
+    parser.add_argument("--out", default=os.path.join(DATA_DIR, "articles_from_pipeline.jsonl"),
+                        help="Append every ingested article here, for rebuilding the local embedding store")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE, help="Items buffered between stages")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between stats reports")
+    args = parser.parse_args()
+
+    from qdrant_client import QdrantClient
+    from start import QDRANT_HOST, QDRANT_PORT
+    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+
+    if args.articles:
+        from embeddings.bulk_embed import iter_articles
+        source = ("read", lambda: islice(iter_articles(args.articles), args.limit))
+        stages = [("extract", timestamped)]
+    else:
+        sys.path.insert(0, os.path.join(BACKEND_DIR, "data"))
+        from fetch_from_reuters_sitemap import configure_logging, crawl_pages, extract_articles
+        configure_logging()
+        cache_path = os.path.join(DATA_DIR, "article_cache.sqlite")
+        source = ("crawl", lambda: crawl_pages(cache_path=cache_path, limit=args.limit, changed_only=True))
+        stages = [("extract", lambda pages: timestamped(extract_articles(pages, cache_path)))]
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "a", encoding="utf-8") as sink:
+        pipeline = Pipeline(source, stages + [
+            ("embed", embed_articles),
+            ("upsert", lambda embedded: upsert_articles(embedded, client, COLLECTION_NAME, sink=sink)),
+        ], queue_size=args.queue_size, report_every=args.report_every)
+        results = pipeline.run()
+
+    print(f"✅ Ingested {len(results)} articles into '{COLLECTION_NAME}' and the local embedding store")
+    pipeline.report()
+    if results:
+        latencies = sorted(latency for _, latency in results)
+        print(f"Extracted -> searchable: p50 {statistics.median(latencies):.2f}s, max {latencies[-1]:.2f}s")
+
+if __name__ == "__main__":
+    main()
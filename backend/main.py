@@ -1,20 +1,124 @@
 # backend/main.py
 
+import time
+_process_started = time.monotonic()
+
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Query, Form, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from qdrant_client import QdrantClient
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from pydantic import BaseModel, Field
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http.exceptions import UnexpectedResponse
-from sentence_transformers import SentenceTransformer
 # Import directly from the local module
-from gemini_client import generate_gemini_response
+from gemini_client import (generate_gemini_response_async, stream_gemini_response_async, is_fallback_response,
+                           build_prompt, gemini)
+from context_builder import build_context, estimate_tokens
+from encoder import encode_query_async, encode_queries_async, encode_query, batcher, cache as embedding_cache
+from answer_cache import AnswerCache, INGEST_GENERATION_KEY
+import json
+import os
 import uuid
-from session_manager import add_message, get_history, clear_session
-from typing import Optional
-from start import init_server
+import metrics
+import session_manager
+from metrics import span
+from session_manager import add_turn, get_history, recent_history, history_summary, clear_session, rewrite_query
+from typing import List, Optional, Literal
+from start import prepare_vector_store, QDRANT_HOST, QDRANT_PORT
+from retriever import (make_retriever, NumpyRetriever, FailoverRetriever, BM25Retriever, HybridRetriever,
+                       RETRIEVER_BACKEND, RETRIEVAL_MODE)
+
+RetrievalMode = Literal["dense", "sparse", "hybrid"]
+
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "1000"))
+# Gemini calls in flight for one batch request
+BATCH_ANSWER_CONCURRENCY = int(os.getenv("BATCH_ANSWER_CONCURRENCY", "4"))
+
+# Startup progress, reported by /readyz
+warmup_state = {"ready": False, "steps": {}, "error": None, "cold_start_seconds": None}
+# Required warmup steps retry after this many seconds, doubling up to the maximum
+WARMUP_RETRY_INTERVAL = 1.0
+WARMUP_RETRY_MAX = 30.0
+
+async def _timed_step(name, fn, retry_interval=None, max_interval=WARMUP_RETRY_MAX):
+    """
+    Run a blocking warmup step in a thread. With `retry_interval` set it is retried
+    while it fails, the wait doubling each time up to `max_interval`.
+    """
+    started = time.monotonic()
+    while True:
+        try:
+            await asyncio.to_thread(fn)
+            warmup_state["steps"][name] = round(time.monotonic() - started, 3)
+            return
+        except Exception as e:
+            warmup_state["error"] = f"{name}: {e}"
+            print(f"Warning: Warmup step '{name}' failed: {e}")
+            if retry_interval is None:
+                raise
+            await asyncio.sleep(retry_interval)
+            retry_interval = min(retry_interval * 2, max_interval)
 
-app = FastAPI()
+async def _optional_step(name, fn):
+    """A warmup step whose failure only degrades the service"""
+    try:
+        await _timed_step(name, fn)
+    except Exception:
+        pass
 
-init_server()
+def _numpy_engine():
+    """The in-process engine behind the configured retriever, if there is one"""
+    if isinstance(retriever, NumpyRetriever):
+        return retriever
+    if isinstance(retriever, FailoverRetriever):
+        return retriever.fallback
+    return None
+
+async def warmup():
+    """
+    Bring the model and retrieval backends up in the background; the app serves /healthz meanwhile.
+    With the in-process engine available the app is ready as soon as it loads, and
+    Qdrant keeps syncing behind it.
+    """
+    numpy_engine = _numpy_engine()
+    vector_store = None
+    if not isinstance(retriever, NumpyRetriever):
+        vector_store = asyncio.create_task(
+            _timed_step("vector_store", prepare_vector_store, retry_interval=5.0)
+        )
+
+    # A transient failure in any required step must not leave the worker unready until it restarts
+    required = [_timed_step("model", lambda: encode_query("warmup"), retry_interval=WARMUP_RETRY_INTERVAL)]
+    if numpy_engine is not None:
+        required.append(_timed_step("numpy_index", numpy_engine.load, retry_interval=WARMUP_RETRY_INTERVAL))
+    else:
+        required.append(vector_store)
+    if hybrid_retriever.sparse.available:
+        required.append(_optional_step("bm25_index", hybrid_retriever.sparse.load))
+
+    try:
+        await asyncio.gather(*required)
+        warmup_state["error"] = None
+        warmup_state["ready"] = True
+        warmup_state["cold_start_seconds"] = round(time.monotonic() - _process_started, 3)
+        print(f"Server ready in {warmup_state['cold_start_seconds']}s ({warmup_state['steps']})")
+        if vector_store is not None:
+            await vector_store
+    except asyncio.CancelledError:
+        # Shutdown; the Qdrant sync is only ever stopped here
+        if vector_store is not None:
+            vector_store.cancel()
+        raise
+
+@asynccontextmanager
+async def lifespan(app):
+    task = asyncio.create_task(warmup())
+    yield
+    task.cancel()
+    await gemini.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -23,81 +127,256 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Or specify: ["GET", "POST", "PUT", "DELETE"]
     allow_headers=["*"],  # Or specify exact headers allowed
+    expose_headers=["Server-Timing"],  # Lets the frontend read the per-stage breakdown
 )
+# Outermost, so its timing covers CORS too
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Initialize clients with error handling
 try:
-    client = QdrantClient(host="localhost", port=6333)
-    model = SentenceTransformer("all-MiniLM-L6-v2")
+    # Skip the server version probe so constructing the client never blocks import
+    client = AsyncQdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, check_compatibility=False)
     COLLECTION_NAME = "news_articles"
+    retriever = make_retriever(client, COLLECTION_NAME)
+    hybrid_retriever = HybridRetriever(retriever, BM25Retriever(dense=_numpy_engine()))
 except Exception as e:
     print(f"Error initializing services: {e}")
     # Application will still start but endpoints will handle errors
 
-@app.get("/search")
-def search_articles(query: str = Query(..., min_length=3)):
+async def _ingest_generation():
+    return await session_manager.r.get(INGEST_GENERATION_KEY)
+
+answer_cache = AnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+    generation_fn=_ingest_generation,
+)
+
+def public_sources(passages):
+    return [{k: v for k, v in p.items() if k != "vector"} for p in passages]
+
+async def retrieve_passages(vector, limit: int = 5, query: Optional[str] = None, mode: str = RETRIEVAL_MODE):
+    """
+    Fetch the best-matching chunks grouped by parent article, so each passage
+    carries only the chunks that matched the query. `mode` picks dense, BM25
+    or hybrid (both, fused by rank) retrieval.
+    """
+    with span("retrieve"):
+        return await hybrid_retriever.search(vector, limit, query=query, mode=mode)
+
+async def embed(query: str):
+    with span("embed"):
+        return await encode_query_async(query)
+
+def stage_error(action: str, e: Exception) -> HTTPException:
+    """
+    An HTTPException naming the stage that failed, so a failure isn't just a bare 500:
+    Qdrant errors are a 502, and a retrieval backend that's unreachable is a 503.
+    """
+    stage = metrics.failed_stage()
+    if isinstance(e, UnexpectedResponse):
+        status_code = 502
+    elif stage == "retrieve":
+        status_code = 503
+    else:
+        status_code = 500
+    where = f" in {stage}" if stage else ""
+    return HTTPException(status_code=status_code, detail=f"{action} failed{where}: {str(e)}")
+
+def prepare_context(query: str, vector, passages):
+    """Token-budgeted, de-duplicated context for the prompt, plus the answer-cache key"""
+    with span("prompt"):
+        context, report = build_context(query, vector, passages)
+        report["prompt_tokens"] = estimate_tokens(build_prompt(query, context))
+        source_ids = [chunk_id for p in passages for chunk_id in p["chunk_ids"]]
+    return context, report, source_ids
+
+async def answer_query(query: str, vector, passages):
+    """
+    Reuse a cached answer for a similar query over the same sources, otherwise
+    ask Gemini with a token-budgeted, de-duplicated context.
+    Returns the answer and a report of the prompt size.
+    """
+    context, report, source_ids = prepare_context(query, vector, passages)
+    with span("answer_cache"):
+        answer = await answer_cache.get(vector, source_ids)
+    report["answer_cached"] = answer is not None
+    if answer is None:
+        with span("llm"):
+            answer = await generate_gemini_response_async(query, context)
+        # Only real Gemini answers are worth reusing
+        if not is_fallback_response(answer):
+            await answer_cache.put(vector, source_ids, answer)
+    return answer, report
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_cached(answer: str):
+    yield answer
+
+async def stream_answer(query: str, vector, passages, session_id: Optional[str] = None, asked: Optional[str] = None):
+    """
+    Server-Sent Events for one answer: `sources` first, then a `token` event per
+    piece of text as Gemini produces it, then `done` with the full answer, or
+    `error` if the answer broke off. Only a finished answer is cached and, for
+    chat, stored in the session under `asked`, the question as the user typed it.
+    """
+    context, report, source_ids = prepare_context(query, vector, passages)
+    with span("answer_cache"):
+        cached = await answer_cache.get(vector, source_ids)
+    report["answer_cached"] = cached is not None
+    if asked and asked != query:
+        report["rewritten_query"] = query
+
+    sources_event = {"sources": public_sources(passages), "context": report}
+    if session_id:
+        sources_event["session_id"] = session_id
+    yield sse("sources", sources_event)
+
+    parts = []
     try:
-        vector = model.encode(query).tolist()
-        search_result = client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=vector,
-            limit=5
-        )
+        pieces = stream_cached(cached) if cached is not None else stream_gemini_response_async(query, context)
+        with span("llm"):
+            async for piece in pieces:
+                parts.append(piece)
+                yield sse("token", {"text": piece})
+    except Exception as e:
+        # A cut-off answer is neither cached nor saved to the session; `partial` tells the
+        # client that the tokens it already shows are incomplete
+        yield sse("error", {"detail": f"Answer streaming failed: {str(e)}", "partial": bool(parts)})
+        return
 
-        passages = [
-            {
-                "title": hit.payload.get("title", "Untitled"),
-                "url": hit.payload.get("url", ""),
-                "text": hit.payload.get("text", "No content available"),
-                "score": hit.score
-            }
-            for hit in search_result
-        ]
+    answer = "".join(parts)
+    if cached is None and not is_fallback_response(answer):
+        await answer_cache.put(vector, source_ids, answer)
+
+    if session_id:
+        try:
+            with span("session_write"):
+                await add_turn(session_id, asked or query, answer)
+        except Exception as e:
+            print(f"Warning: Failed to save session data: {e}")
+
+    # The headers went out before these stages ran, so their timings travel with the answer
+    yield sse("done", {"session_id": session_id, "answer": answer, "timings": metrics.current_timings()})
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+async def standalone_query(query: str, session_id: str) -> str:
+    """
+    Rewrite a follow-up question using the session's last few turns, so retrieval
+    sees its subject. Reads a fixed-size window, so the cost doesn't grow with the session.
+    """
+    try:
+        with span("session_read"):
+            history = await recent_history(session_id)
+    except Exception as e:
+        print(f"Warning: Failed to read session history: {e}")
+        return query
+    return rewrite_query(query, history)
+
+@app.get("/search")
+async def search_articles(query: str = Query(..., min_length=3), mode: RetrievalMode = Query(RETRIEVAL_MODE)):
+    try:
+        vector = await embed(query)
+        passages = await retrieve_passages(vector, query=query, mode=mode)
 
         # Call Gemini with retrieved passages
-        gemini_reply = generate_gemini_response(query, passages)
+        gemini_reply, context_report = await answer_query(query, vector, passages)
 
         return {
             "answer": gemini_reply,
-            "sources": passages
+            "sources": public_sources(passages),
+            "context": context_report
         }
-    except UnexpectedResponse as e:
-        raise HTTPException(status_code=500, detail=f"Qdrant search failed: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+        raise stage_error("Search", e)
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=SEARCH_BATCH_MAX)
+    mode: RetrievalMode = RETRIEVAL_MODE
+    limit: int = Field(5, ge=1, le=50)
+    # Skip Gemini and return only the retrieved sources
+    retrieval_only: bool = False
+
+def batch_error(query: str, message: str):
+    return {"query": query, "error": message}
+
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """
+    Many queries in one request: encoded together, retrieved with one batched
+    vector search and, unless `retrieval_only`, answered with bounded concurrency.
+    Results are in input order; a query that fails gets an `error` instead of failing the batch.
+    """
+    queries = request.queries
+    results = [None] * len(queries)
+    valid = []
+    for i, query in enumerate(queries):
+        if len(query.strip()) < 3:
+            results[i] = batch_error(query, "Query must be at least 3 characters")
+        else:
+            valid.append(i)
+    if not valid:
+        return {"results": results}
+
+    try:
+        with span("embed"):
+            vectors = await encode_queries_async([queries[i] for i in valid])
+        with span("retrieve"):
+            found = await hybrid_retriever.search_batch(
+                vectors, request.limit, queries=[queries[i] for i in valid], mode=request.mode
+            )
+    except Exception as e:
+        raise stage_error("Batch search", e)
+
+    answer_slots = asyncio.Semaphore(BATCH_ANSWER_CONCURRENCY)
+
+    async def finish(i, vector, passages):
+        query = queries[i]
+        if isinstance(passages, BaseException):
+            return batch_error(query, f"Search failed: {str(passages)}")
+        result = {"query": query, "sources": public_sources(passages)}
+        if request.retrieval_only:
+            return result
+        try:
+            async with answer_slots:
+                result["answer"], result["context"] = await answer_query(query, vector, passages)
+        except Exception as e:
+            return batch_error(query, f"Answer generation failed: {str(e)}")
+        return result
+
+    finished = await asyncio.gather(*(finish(i, vector, passages) for i, vector, passages in zip(valid, vectors, found)))
+    for i, result in zip(valid, finished):
+        results[i] = result
+    return {"results": results}
 
 @app.post("/chat")
 async def chat(
-    query: str = Form(..., min_length=1), 
-    session_id: Optional[str] = Form(None)
+    query: str = Form(..., min_length=1),
+    session_id: Optional[str] = Form(None),
+    mode: RetrievalMode = Form(RETRIEVAL_MODE)
 ):
     try:
         if not session_id:
             session_id = str(uuid.uuid4())
+            search_query = query
+        else:
+            search_query = await standalone_query(query, session_id)
 
-        vector = model.encode(query).tolist()
-        search_result = client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=vector,
-            limit=5
-        )
-        
-        passages = [
-            {
-                "title": hit.payload.get("title", "Untitled"),
-                "url": hit.payload.get("url", ""),
-                "text": hit.payload.get("text", "No content available"),
-                "score": hit.score
-            }
-            for hit in search_result
-        ]
-
-        answer = generate_gemini_response(query, passages)
-
-        # Store messages in Redis with error handling
+        vector = await embed(search_query)
+        passages = await retrieve_passages(vector, query=search_query, mode=mode)
+
+        answer, context_report = await answer_query(search_query, vector, passages)
+        if search_query != query:
+            context_report["rewritten_query"] = search_query
+
+        # Store the turn in Redis with error handling
         try:
-            add_message(session_id, "user", query)
-            add_message(session_id, "bot", answer)
+            with span("session_write"):
+                await add_turn(session_id, query, answer)
         except Exception as e:
             print(f"Warning: Failed to save session data: {e}")
             # Continue even if Redis fails
@@ -105,22 +384,102 @@ async def chat(
         return {
             "session_id": session_id,
             "answer": answer,
-            "sources": passages
+            "sources": public_sources(passages),
+            "context": context_report
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
+        raise stage_error("Chat processing", e)
+
+@app.get("/search/stream")
+async def search_articles_stream(query: str = Query(..., min_length=3), mode: RetrievalMode = Query(RETRIEVAL_MODE)):
+    # Retrieval runs before the response starts, so failures still return a 500
+    try:
+        vector = await embed(query)
+        passages = await retrieve_passages(vector, query=query, mode=mode)
+    except Exception as e:
+        raise stage_error("Search", e)
+
+    return StreamingResponse(
+        stream_answer(query, vector, passages),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@app.post("/chat/stream")
+async def chat_stream(
+    query: str = Form(..., min_length=1),
+    session_id: Optional[str] = Form(None),
+    mode: RetrievalMode = Form(RETRIEVAL_MODE)
+):
+    try:
+        if not session_id:
+            session_id = str(uuid.uuid4())
+            search_query = query
+        else:
+            search_query = await standalone_query(query, session_id)
+
+        vector = await embed(search_query)
+        passages = await retrieve_passages(vector, query=search_query, mode=mode)
+    except Exception as e:
+        raise stage_error("Chat processing", e)
+
+    return StreamingResponse(
+        stream_answer(search_query, vector, passages, session_id, asked=query),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: only route traffic here once Qdrant and the model are warm"""
+    return JSONResponse(status_code=200 if warmup_state["ready"] else 503, content=warmup_state)
+
+STATS_SOURCES = {
+    "encoder_batching": batcher.stats,
+    "embedding_cache": embedding_cache.stats,
+    "answer_cache": answer_cache.stats,
+    "retriever": lambda: hybrid_retriever.stats(),
+    "sessions": session_manager.stats,
+    "gemini": gemini.stats,
+}
+metrics.register_stats(STATS_SOURCES)
+
+@app.get("/stats")
+def get_stats():
+    return {name: stats_fn() for name, stats_fn in STATS_SOURCES.items()}
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint: per-stage and per-endpoint latency histograms plus the /stats counters"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/history/{session_id}")
-def get_session_history(session_id: str):
+async def get_session_history(
+    session_id: str,
+    limit: Optional[int] = Query(None, ge=1),
+    summary: bool = Query(False)
+):
+    """
+    The session's messages, or only the last `limit`. With `summary`, the message
+    count and the last few turns with long answers shortened.
+    """
     try:
-        return get_history(session_id)
+        if summary:
+            return await history_summary(session_id)
+        return await get_history(session_id, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get history: {str(e)}")
 
 @app.delete("/session/{session_id}")
-def delete_session(session_id: str):
+async def delete_session(session_id: str):
     try:
-        clear_session(session_id)
+        await clear_session(session_id)
         return {"message": f"Session {session_id} cleared."}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete session: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to delete session: {str(e)}")
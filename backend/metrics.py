@@ -0,0 +1,177 @@
+# backend/metrics.py
+#
+# Hot-path instrumentation. `span(stage)` times one stage of a request (embed,
+# retrieve, prompt, llm, session_write, ...) into the verifast_stage_seconds
+# histogram and into the current request's breakdown, which MetricsMiddleware
+# sends back as a Server-Timing header. GET /metrics serves everything in the
+# Prometheus text format, including the counters behind /stats, which are read
+# only when Prometheus scrapes.
+#
+# A span costs two perf_counter() calls, a histogram observe and a list append
+# (a few microseconds), so it stays on in production.
+
+import asyncio
+import contextvars
+import re
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from starlette.datastructures import MutableHeaders
+
+# From a cache hit to a slow Gemini answer
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram("verifast_stage_seconds", "Time spent in each stage of a request", ["stage"],
+                          buckets=BUCKETS)
+STAGE_ERRORS = Counter("verifast_stage_errors", "Stage failures", ["stage"])
+REQUEST_SECONDS = Histogram("verifast_request_seconds", "Request latency up to the end of the response body",
+                            ["endpoint"], buckets=BUCKETS)
+REQUESTS = Counter("verifast_requests", "Requests by endpoint and status", ["endpoint", "status"])
+IN_FLIGHT = Gauge("verifast_requests_in_flight", "HTTP requests being handled")
+
+class RequestTimings:
+    """Stage durations of one request, in the order they finished"""
+
+    __slots__ = ("spans", "failed_stage")
+
+    def __init__(self):
+        self.spans = []
+        self.failed_stage = None
+
+    def totals(self):
+        """{stage: milliseconds}, summing stages that ran more than once"""
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds * 1000
+        return {stage: round(ms, 1) for stage, ms in totals.items()}
+
+    def header(self, total_seconds):
+        parts = [f"{stage};dur={ms}" for stage, ms in self.totals().items()]
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+_current = contextvars.ContextVar("request_timings", default=None)
+# Label lookups are cached so a span doesn't pay for them on every call
+_stage_children = {}
+
+def _stage(stage):
+    children = _stage_children.get(stage)
+    if children is None:
+        children = _stage_children[stage] = (STAGE_SECONDS.labels(stage), STAGE_ERRORS.labels(stage))
+    return children
+
+@contextmanager
+def span(stage):
+    """Time a block as `stage` for the histogram and the request's Server-Timing breakdown"""
+    histogram, errors = _stage(stage)
+    started = time.perf_counter()
+    try:
+        yield
+    except (asyncio.CancelledError, GeneratorExit):
+        raise
+    except BaseException:
+        errors.inc()
+        timings = _current.get()
+        if timings is not None and timings.failed_stage is None:
+            timings.failed_stage = stage
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed)
+        timings = _current.get()
+        if timings is not None:
+            timings.spans.append((stage, elapsed))
+
+def current_timings():
+    """{stage: milliseconds} so far for the current request, e.g. for a streamed `done` event"""
+    timings = _current.get()
+    return timings.totals() if timings is not None else {}
+
+def failed_stage():
+    """The first stage that raised in the current request, if any"""
+    timings = _current.get()
+    return timings.failed_stage if timings is not None else None
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (it doesn't buffer streamed responses): counts requests
+    in flight, times each request by endpoint, and adds the Server-Timing header.
+    Streamed responses send their headers before the answer is generated, so
+    their later stages are reported in the stream instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.header(time.perf_counter() - started))
+                headers.append("Timing-Allow-Origin", "*")
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            IN_FLIGHT.dec()
+            # The router records the matched endpoint in the scope; label by its name, never the raw path
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+            REQUESTS.labels(endpoint, str(status)).inc()
+            _current.reset(token)
+
+def _metric_name(*parts):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join(str(p) for p in parts))
+
+def _flatten(prefix, stats):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from _flatten(f"{prefix}_{key}", value)
+        elif isinstance(value, (bool, int, float)):
+            yield _metric_name(prefix, key), float(value)
+
+class StatsCollector:
+    """
+    Exports the numeric fields of each component's stats() (cache hits and hit
+    rates, Gemini fallbacks and breaker state, failovers, Redis latency, ...)
+    as gauges, read at scrape time so the request path pays nothing for them.
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+
+    def describe(self):
+        # Names depend on the stats at scrape time; don't call collect() at registration
+        return []
+
+    def collect(self):
+        for name, stats_fn in self.sources.items():
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                print(f"Warning: Could not collect {name} stats for /metrics: {e}")
+                continue
+            for metric, value in _flatten(f"verifast_{name}", stats):
+                yield GaugeMetricFamily(metric, f"{name} stats, as in GET /stats", value=value)
+
+def register_stats(sources):
+    REGISTRY.register(StatsCollector(sources))
+
+def render():
+    """The default registry in the Prometheus text format, and its content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
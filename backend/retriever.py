@@ -0,0 +1,520 @@
+# backend/retriever.py
+
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from embeddings.bm25_index import BM25Index, bm25_path
+from embeddings.embedding_store import DEFAULT_BASE, load_matrix, metadata_path
+from embeddings.quantization import (make_quantizer, check_mode, VECTOR_QUANTIZATION,
+                                     QUANTIZATION_OVERSAMPLING, QUANTIZATION_RESCORE)
+
+# "qdrant", "numpy", or "auto" (Qdrant with the in-process engine as failover)
+RETRIEVER_BACKEND = os.getenv("RETRIEVER", "auto")
+RETRIEVAL_GROUP_SIZE = int(os.getenv("RETRIEVAL_GROUP_SIZE", "3"))
+FAILOVER_COOLDOWN = float(os.getenv("RETRIEVER_FAILOVER_COOLDOWN", "30"))
+# "dense", "sparse" (BM25) or "hybrid" (both, fused with reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Chunk hits fetched per article asked for when a batch search groups client-side
+BATCH_GROUP_OVERFETCH = int(os.getenv("BATCH_GROUP_OVERFETCH", "4"))
+# Queries scored per matrix product by the in-process engine
+NUMPY_QUERY_BLOCK = int(os.getenv("NUMPY_QUERY_BLOCK", "32"))
+
+# Same attributes as a Qdrant ScoredPoint, so both backends share group_to_passage
+ScoredHit = namedtuple("ScoredHit", ["id", "score", "payload", "vector"])
+
+def group_to_passage(article_id, hits):
+    """Merge the matching chunks of one article into a single passage, in reading order"""
+    ordered = sorted(hits, key=lambda hit: hit.payload.get("chunk_index", 0))
+    payload = ordered[0].payload
+    vectors = [hit.vector for hit in ordered if hit.vector]
+    return {
+        "id": article_id,
+        "chunk_ids": [hit.id for hit in ordered],
+        "title": payload.get("title", "Untitled"),
+        "url": payload.get("url", ""),
+        "text": " ... ".join(hit.payload.get("text", "") for hit in ordered) or "No content available",
+        "score": max(hit.score for hit in hits),
+        # Mean chunk vector, used for near-duplicate detection; stripped before responding
+        "vector": [sum(column) / len(vectors) for column in zip(*vectors)] if vectors else None
+    }
+
+def group_hits(hits, limit, group_size):
+    """Group best-first chunk hits by article: the `limit` best articles, up to `group_size` chunks each"""
+    groups = {}
+    for hit in hits:
+        article_id = hit.payload.get("article_id", hit.id)
+        if article_id not in groups:
+            if len(groups) == limit:
+                continue
+            groups[article_id] = []
+        if len(groups[article_id]) < group_size:
+            groups[article_id].append(hit)
+    return [group_to_passage(article_id, members) for article_id, members in groups.items()]
+
+async def search_many(retriever, queries, limit=5):
+    """
+    Search a batch through `retriever.search_batch` where it has one, else one search
+    per query concurrently. If the batch call fails, each query is retried on its own,
+    so one bad query can't fail the rest. Returns passages or the exception, per query.
+    """
+    search_batch = getattr(retriever, "search_batch", None)
+    if search_batch is not None:
+        try:
+            return await search_batch(queries, limit)
+        except Exception as e:
+            if len(queries) == 1:
+                return [e]
+            print(f"Warning: Batch search on {retriever.name} failed, retrying queries one by one: {e}")
+    return await asyncio.gather(*(retriever.search(query, limit) for query in queries), return_exceptions=True)
+
+class QdrantRetriever:
+    """Grouped vector search against the Qdrant collection"""
+
+    name = "qdrant"
+
+    def __init__(self, client, collection_name, group_size=RETRIEVAL_GROUP_SIZE,
+                 quantization=VECTOR_QUANTIZATION, oversampling=QUANTIZATION_OVERSAMPLING,
+                 rescore=QUANTIZATION_RESCORE):
+        self.client = client
+        self.collection_name = collection_name
+        self.group_size = group_size
+        self.search_params = None
+        if check_mode(quantization) != "none":
+            from qdrant_client.http.models import SearchParams, QuantizationSearchParams
+            # Search the quantized vectors, then rescore the oversampled candidates with the originals
+            self.search_params = SearchParams(
+                quantization=QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+            )
+
+    async def search(self, vector, limit=5):
+        result = await self.client.query_points_groups(
+            collection_name=self.collection_name,
+            query=vector,
+            group_by="article_id",
+            limit=limit,
+            group_size=self.group_size,
+            with_payload=True,
+            with_vectors=True,
+            search_params=self.search_params
+        )
+        return [group_to_passage(group.id, group.hits) for group in result.groups]
+
+    async def search_batch(self, vectors, limit=5):
+        """
+        All vectors in one query_batch_points call. Qdrant has no batched group-by,
+        so chunk hits are over-fetched and grouped by article here: the articles match
+        search(), but an article may carry fewer chunks when its others rank below the
+        over-fetch depth.
+        """
+        from qdrant_client.http.models import QueryRequest
+        depth = limit * self.group_size * BATCH_GROUP_OVERFETCH
+        responses = await self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                QueryRequest(query=vector, limit=depth, with_payload=True, with_vector=True, params=self.search_params)
+                for vector in vectors
+            ]
+        )
+        return [group_hits(response.points, limit, self.group_size) for response in responses]
+
+class NumpyRetriever:
+    """
+    In-process cosine search over the memory-mapped embedding matrix.
+
+    Only row norms, article codes and metadata byte offsets are held in RAM;
+    payloads for the top hits are read on demand from the metadata file,
+    which is held open from load so it matches the mapped matrix.
+    With `quantization` set, the first pass runs over int8 or binary codes in
+    RAM and only the oversampled candidates are rescored from the float rows.
+    """
+
+    name = "numpy"
+    min_score = -np.inf
+    # Whether a block of queries can be scored with one matrix product
+    batch_scoring = True
+
+    def __init__(self, base=DEFAULT_BASE, group_size=RETRIEVAL_GROUP_SIZE, quantization=VECTOR_QUANTIZATION,
+                 oversampling=QUANTIZATION_OVERSAMPLING, rescore=QUANTIZATION_RESCORE):
+        self.base = base
+        self.group_size = group_size
+        self.quantization = check_mode(quantization)
+        self.oversampling = oversampling
+        self.rescore = rescore
+        self.quantizer = None
+        self.matrix = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.matrix is not None
+
+    def load(self):
+        with self._load_lock:
+            if not self.loaded:
+                self._load()
+        return self
+
+    def _open_store(self):
+        """Map the matrix and index the metadata file: (matrix, metadata file, byte offsets, article ids)"""
+        # The metadata file stays open for as long as the matrix is mapped: both then keep
+        # their inode when generate_embeddings or bulk_embed replaces the store, so
+        # payloads always come from the same snapshot as the rows they describe
+        meta_file = open(metadata_path(self.base), "rb")
+        try:
+            matrix = load_matrix(self.base)
+            offsets, article_ids = [], []
+            offset = 0
+            for line in meta_file:
+                if line.strip():
+                    offsets.append(offset)
+                    meta = json.loads(line)
+                    article_ids.append(meta.get("article_id") or meta.get("id") or str(len(offsets)))
+                offset += len(line)
+            if len(offsets) != matrix.shape[0]:
+                raise ValueError(f"Metadata has {len(offsets)} rows but the embedding matrix has {matrix.shape[0]}")
+        except Exception:
+            meta_file.close()
+            raise
+        return matrix, meta_file, offsets, article_ids
+
+    def _set_rows(self, meta_file, offsets, article_ids):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.group_names, self.group_codes = np.unique(np.asarray(article_ids), return_inverse=True)
+        self._meta_file = meta_file
+        self._meta_lock = threading.Lock()
+
+    def _load(self):
+        matrix, meta_file, offsets, article_ids = self._open_store()
+        norms = np.linalg.norm(matrix, axis=1)
+        self.inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        self._set_rows(meta_file, offsets, article_ids)
+        self.quantizer = make_quantizer(self.quantization, matrix, self.inv_norms)
+        self.matrix = matrix
+
+    def _payload(self, row):
+        # Searches run in worker threads and share the handle's file position
+        with self._meta_lock:
+            self._meta_file.seek(int(self.offsets[row]))
+            meta = json.loads(self._meta_file.readline())
+        return {k: v for k, v in meta.items() if k != "id"}, meta.get("id", row)
+
+    def score_rows(self, vector):
+        """Cosine score of every row"""
+        query = np.asarray(vector, dtype=np.float32)
+        query_norm = np.linalg.norm(query) or 1.0
+        return (self.matrix @ query) * self.inv_norms / query_norm
+
+    @staticmethod
+    def _best(scores, k):
+        k = min(k, scores.shape[0])
+        if k == 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def score_block(self, vectors):
+        """Cosine scores of every row for several queries at once, one row of scores per query"""
+        queries = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+        return (queries @ self.matrix.T) * self.inv_norms
+
+    def top_k(self, query, k, scores=None):
+        """Row indices and scores of the k best rows, best first; `scores` reuses precomputed ones"""
+        if self.quantizer is None:
+            if scores is None:
+                scores = self.score_rows(query)
+            top = self._best(scores, k)
+            return top, scores[top]
+
+        query = np.asarray(query, dtype=np.float32)
+        query_norm = np.linalg.norm(query) or 1.0
+        approx = self.quantizer.scores(query / query_norm)
+        if not self.rescore:
+            top = self._best(approx, k)
+            return top, approx[top]
+        # Sorted row order keeps the reads from the memory-mapped matrix sequential
+        candidates = np.sort(self._best(approx, math.ceil(k * self.oversampling)))
+        exact = (self.matrix[candidates] @ query) * self.inv_norms[candidates] / query_norm
+        top = self._best(exact, k)
+        return candidates[top], exact[top]
+
+    def search_sync(self, query, limit=5, scores=None):
+        if not self.loaded:
+            self.load()
+        n = self.matrix.shape[0]
+        k = limit * self.group_size * 4
+        all_scores = scores
+        while True:
+            rows, scores = self.top_k(query, k, all_scores)
+            groups = {}
+            for row, score in zip(rows, scores):
+                if score <= self.min_score:
+                    break
+                code = self.group_codes[row]
+                if code not in groups:
+                    if len(groups) == limit:
+                        continue
+                    groups[code] = []
+                if len(groups[code]) < self.group_size:
+                    groups[code].append((row, float(score)))
+            # Stop once we have enough articles, have reached rows below min_score,
+            # or have looked at the whole corpus
+            if len(groups) == limit or k >= n or (len(scores) and scores[-1] <= self.min_score):
+                break
+            k *= 4
+
+        passages = []
+        for code, members in groups.items():
+            hits = []
+            for row, score in members:
+                payload, point_id = self._payload(row)
+                hits.append(ScoredHit(point_id, score, payload, self.matrix[row].tolist()))
+            passages.append(group_to_passage(str(self.group_names[code]), hits))
+        return passages
+
+    async def search(self, vector, limit=5):
+        return await asyncio.to_thread(self.search_sync, vector, limit)
+
+    def search_batch_sync(self, queries, limit=5):
+        """
+        Per-query passages or exception, in order. Without quantization, blocks of
+        queries share one pass over the matrix instead of one pass each.
+        """
+        if not self.loaded:
+            self.load()
+        results = []
+        for start in range(0, len(queries), NUMPY_QUERY_BLOCK):
+            block = queries[start:start + NUMPY_QUERY_BLOCK]
+            scores = [None] * len(block)
+            if self.batch_scoring and self.quantizer is None:
+                try:
+                    scores = self.score_block(block)
+                except Exception:
+                    pass  # e.g. a malformed vector; score the block one by one to isolate it
+            for query, query_scores in zip(block, scores):
+                try:
+                    results.append(self.search_sync(query, limit, query_scores))
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    async def search_batch(self, queries, limit=5):
+        return await asyncio.to_thread(self.search_batch_sync, queries, limit)
+
+class BM25Retriever(NumpyRetriever):
+    """
+    Keyword search over the same rows with the BM25 index built at ingest.
+    Catches exact names, tickers and figures that embeddings blur; rows
+    sharing no term with the query are never returned.
+
+    Only the BM25 index is loaded for it. Given the `dense` in-process engine over
+    the same store, it reads payloads and hit vectors through that engine's
+    mapped matrix and metadata; otherwise it maps them itself, without the
+    norms or quantized codes only cosine search needs.
+    """
+
+    name = "bm25"
+    min_score = 0.0
+    batch_scoring = False
+
+    def __init__(self, base=DEFAULT_BASE, group_size=RETRIEVAL_GROUP_SIZE, dense=None):
+        super().__init__(base, group_size, quantization="none")
+        self.dense = dense if dense is not None and dense.base == base else None
+
+    @property
+    def available(self):
+        return self.loaded or os.path.exists(bm25_path(self.base))
+
+    def _load(self):
+        index = BM25Index(self.base)
+        if self.dense is not None:
+            dense = self.dense.load()
+            self.offsets, self.group_names, self.group_codes = dense.offsets, dense.group_names, dense.group_codes
+            self._meta_file, self._meta_lock = dense._meta_file, dense._meta_lock
+            matrix = dense.matrix
+        else:
+            matrix, meta_file, offsets, article_ids = self._open_store()
+            self._set_rows(meta_file, offsets, article_ids)
+        if index.num_rows != matrix.shape[0]:
+            raise ValueError(f"BM25 index has {index.num_rows} rows but the embedding matrix has "
+                             f"{matrix.shape[0]}; rebuild it with embeddings/bm25_index.py")
+        self.index = index
+        self.matrix = matrix
+
+    def score_rows(self, query):
+        return self.index.scores(query)
+
+    async def search(self, query, limit=5):
+        return await asyncio.to_thread(self.search_sync, query, limit)
+
+def reciprocal_rank_fusion(rankings, limit, k=RRF_K):
+    """
+    Fuse ranked passage lists by summing 1 / (k + rank) per article.
+    The first list wins when an article appears in several, so dense
+    passages (with their chunk vectors) are kept over sparse ones.
+    """
+    fused, scores = {}, {}
+    for ranking in rankings:
+        for rank, passage in enumerate(ranking, start=1):
+            fused.setdefault(passage["id"], passage)
+            scores[passage["id"]] = scores.get(passage["id"], 0.0) + 1.0 / (k + rank)
+    best = sorted(fused, key=lambda article_id: -scores[article_id])[:limit]
+    return [{**fused[article_id], "score": scores[article_id]} for article_id in best]
+
+class HybridRetriever:
+    """
+    Run the dense retriever and BM25 concurrently and fuse them with RRF.
+    Modes: "dense", "sparse" or "hybrid"; without a BM25 index everything is dense.
+    """
+
+    modes = ("dense", "sparse", "hybrid")
+
+    def __init__(self, dense, sparse, candidates=HYBRID_CANDIDATES, rrf_k=RRF_K):
+        self.dense = dense
+        self.sparse = sparse
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.searches = dict.fromkeys(self.modes, 0)
+        self.sparse_errors = 0
+
+    @property
+    def name(self):
+        return f"{self.dense.name}+{self.sparse.name}"
+
+    async def search(self, vector, limit=5, query=None, mode=RETRIEVAL_MODE):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if not query or not self.sparse.available:
+            mode = "dense"
+        self.searches[mode] += 1
+
+        if mode == "dense":
+            return await self.dense.search(vector, limit)
+        if mode == "sparse":
+            return await self.sparse.search(query, limit)
+
+        depth = max(limit, self.candidates)
+        dense, sparse = await asyncio.gather(
+            self.dense.search(vector, depth), self.sparse.search(query, depth), return_exceptions=True
+        )
+        if isinstance(dense, BaseException):
+            raise dense
+        if isinstance(sparse, BaseException):
+            # Keyword search is an enhancement; answer from the dense results alone
+            self.sparse_errors += 1
+            print(f"Warning: BM25 retrieval failed, using dense results only: {sparse}")
+            return dense[:limit]
+        return reciprocal_rank_fusion([dense, sparse], limit, self.rrf_k)
+
+    async def search_batch(self, vectors, limit=5, queries=None, mode=RETRIEVAL_MODE):
+        """
+        Search many queries at once: the dense side as one batch call, BM25 in one
+        worker thread. Returns passages or the query's exception, in input order.
+        """
+        if mode not in self.modes:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if not queries or not self.sparse.available:
+            mode = "dense"
+        self.searches[mode] += len(vectors)
+
+        if mode == "dense":
+            return await search_many(self.dense, vectors, limit)
+        if mode == "sparse":
+            return await search_many(self.sparse, queries, limit)
+
+        depth = max(limit, self.candidates)
+        dense, sparse = await asyncio.gather(
+            search_many(self.dense, vectors, depth), search_many(self.sparse, queries, depth)
+        )
+        results = []
+        for dense_passages, sparse_passages in zip(dense, sparse):
+            if isinstance(dense_passages, BaseException):
+                results.append(dense_passages)
+            elif isinstance(sparse_passages, BaseException):
+                self.sparse_errors += 1
+                results.append(dense_passages[:limit])
+            else:
+                results.append(reciprocal_rank_fusion([dense_passages, sparse_passages], limit, self.rrf_k))
+        return results
+
+    def stats(self):
+        dense_stats = self.dense.stats() if hasattr(self.dense, "stats") else {"backend": self.dense.name}
+        return {
+            **dense_stats,
+            "sparse_available": self.sparse.available,
+            "default_mode": RETRIEVAL_MODE,
+            "searches": dict(self.searches),
+            "sparse_errors": self.sparse_errors,
+        }
+
+class FailoverRetriever:
+    """Use the primary backend, switching to the fallback for `cooldown` seconds after it fails"""
+
+    def __init__(self, primary, fallback, cooldown=FAILOVER_COOLDOWN):
+        self.primary = primary
+        self.fallback = fallback
+        self.cooldown = cooldown
+        self.failed_until = 0.0
+        self.failovers = 0
+        self.last_error = None
+
+    @property
+    def name(self):
+        return f"{self.primary.name}+{self.fallback.name}"
+
+    def _fail_over(self, e, what="retrieval"):
+        self.failed_until = time.monotonic() + self.cooldown
+        self.failovers += 1
+        self.last_error = str(e)
+        print(f"Warning: {self.primary.name} {what} failed, using {self.fallback.name} "
+              f"for {self.cooldown:.0f}s: {e}")
+
+    async def search(self, vector, limit=5):
+        if time.monotonic() >= self.failed_until:
+            try:
+                return await self.primary.search(vector, limit)
+            except Exception as e:
+                self._fail_over(e)
+        return await self.fallback.search(vector, limit)
+
+    async def search_batch(self, vectors, limit=5):
+        if time.monotonic() >= self.failed_until:
+            # Call the primary's batch search directly: search_many would retry each query
+            # against a backend that is down and hand back the errors instead of raising
+            try:
+                results = await self.primary.search_batch(vectors, limit)
+                errors = [r for r in results if isinstance(r, Exception)]
+                if not errors or len(errors) < len(results):
+                    return results
+                raise errors[0]
+            except Exception as e:
+                self._fail_over(e, "batch retrieval")
+        return await search_many(self.fallback, vectors, limit)
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "primary_healthy": time.monotonic() >= self.failed_until,
+            "failovers": self.failovers,
+            "last_error": self.last_error,
+        }
+
+def make_retriever(qdrant_client, collection_name, backend=RETRIEVER_BACKEND):
+    """Build the retriever selected by the RETRIEVER setting"""
+    if backend == "qdrant":
+        return QdrantRetriever(qdrant_client, collection_name)
+    if backend == "numpy":
+        return NumpyRetriever()
+    if backend == "auto":
+        return FailoverRetriever(QdrantRetriever(qdrant_client, collection_name), NumpyRetriever())
+    raise ValueError(f"Unknown RETRIEVER backend: {backend}")
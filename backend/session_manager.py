@@ -1,20 +1,180 @@
 # backend/session_manager.py
+#
+# Chat history in Redis, one list per session. A turn (question and answer) is
+# written in a single pipelined MULTI/EXEC that also trims the list to the last
+# SESSION_MAX_MESSAGES and refreshes the TTL, so each turn costs one round trip
+# and a session never grows past the cap. Messages are stored as "u|text" /
+# "b|text" rather than JSON; lists written by older versions still read back.
 
-import redis
+import redis.asyncio as redis
 import os
 import json
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", "1800"))  # 30 mins
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "100"))
+# Turns of recent history /chat reads to rewrite follow-up questions
+HISTORY_WINDOW_TURNS = int(os.getenv("HISTORY_WINDOW_TURNS", "2"))
+# Longer questions are taken as standalone even if they say "it" or "they"
+FOLLOWUP_MAX_WORDS = int(os.getenv("FOLLOWUP_MAX_WORDS", "12"))
 
-def add_message(session_id, role, text):
-    msg = {"role": role, "text": text}
-    r.rpush(session_id, json.dumps(msg))
-    r.expire(session_id, 1800)  # 30 mins TTL
+pool = redis.ConnectionPool.from_url(
+    REDIS_URL, decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS
+)
+r = redis.Redis(connection_pool=pool)
 
-def get_history(session_id):
-    messages = r.lrange(session_id, 0, -1)
-    return [json.loads(m) for m in messages]
+ROLE_CODES = {"user": "u", "bot": "b"}
+CODE_ROLES = {code: role for role, code in ROLE_CODES.items()}
 
-def clear_session(session_id):
-    r.delete(session_id)
+def encode_message(role, text):
+    code = ROLE_CODES.get(role)
+    if code is None:
+        return json.dumps({"role": role, "text": text})
+    return f"{code}|{text}"
+
+def decode_message(raw):
+    # Compact messages never start with "{", so anything that does is a legacy JSON one
+    if raw.startswith("{"):
+        return json.loads(raw)
+    code, _, text = raw.partition("|")
+    return {"role": CODE_ROLES.get(code, code), "text": text}
+
+class LatencyStats:
+    """Call count and latency percentiles over the last `window` calls, per Redis operation"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.ops = {}
+
+    def record(self, op, seconds):
+        entry = self.ops.get(op)
+        if entry is None:
+            entry = self.ops[op] = {"calls": 0, "errors": 0, "total": 0.0, "recent": deque(maxlen=self.window)}
+        entry["calls"] += 1
+        entry["total"] += seconds
+        entry["recent"].append(seconds)
+
+    def error(self, op):
+        self.ops.setdefault(op, {"calls": 0, "errors": 0, "total": 0.0, "recent": deque(maxlen=self.window)})
+        self.ops[op]["errors"] += 1
+
+    def stats(self):
+        report = {}
+        for op, entry in self.ops.items():
+            recent = sorted(entry["recent"])
+            def pct(q):
+                return recent[min(len(recent) - 1, int(q * len(recent)))] * 1000 if recent else 0.0
+            report[op] = {
+                "calls": entry["calls"],
+                "errors": entry["errors"],
+                "avg_ms": entry["total"] / entry["calls"] * 1000 if entry["calls"] else 0.0,
+                "p50_ms": pct(0.5),
+                "p95_ms": pct(0.95),
+                "max_ms": recent[-1] * 1000 if recent else 0.0,
+            }
+        return report
+
+latency = LatencyStats()
+
+@asynccontextmanager
+async def _timed(op):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        latency.error(op)
+        raise
+    latency.record(op, time.perf_counter() - started)
+
+def stats():
+    """Redis latency per session operation, for /stats"""
+    return {"max_messages": SESSION_MAX_MESSAGES, "ttl": SESSION_TTL, "redis": latency.stats()}
+
+async def add_turn(session_id, user_text, bot_text):
+    """Store a question and its answer, trim and refresh the TTL in one round trip"""
+    async with _timed("add_turn"):
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.rpush(session_id, encode_message("user", user_text), encode_message("bot", bot_text))
+            pipe.ltrim(session_id, -SESSION_MAX_MESSAGES, -1)
+            pipe.expire(session_id, SESSION_TTL)
+            await pipe.execute()
+
+async def get_history(session_id, limit=None):
+    """The whole session, or only its last `limit` messages"""
+    async with _timed("get_history"):
+        messages = await r.lrange(session_id, -limit if limit else 0, -1)
+    return [decode_message(m) for m in messages]
+
+async def recent_history(session_id, turns=HISTORY_WINDOW_TURNS):
+    """The last `turns` question/answer pairs; reads at most 2 * `turns` messages"""
+    if turns <= 0:
+        return []
+    async with _timed("recent_history"):
+        messages = await r.lrange(session_id, -2 * turns, -1)
+    return [decode_message(m) for m in messages]
+
+async def history_summary(session_id, turns=HISTORY_WINDOW_TURNS, max_chars=200):
+    """
+    Message count plus the last `turns` pairs with each text cut to `max_chars`,
+    read in one round trip; enough to show a session without fetching all of it.
+    """
+    async with _timed("history_summary"):
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.llen(session_id)
+            # (1, 0) is an empty range; -0 would read the whole list
+            pipe.lrange(session_id, *((-2 * turns, -1) if turns > 0 else (1, 0)))
+            total, messages = await pipe.execute()
+    recent = [decode_message(m) for m in messages]
+    for message in recent:
+        if max_chars and len(message["text"]) > max_chars:
+            message["text"] = message["text"][:max_chars].rstrip() + "…"
+    return {"total_messages": total, "messages": recent}
+
+async def clear_session(session_id):
+    async with _timed("clear_session"):
+        await r.delete(session_id)
+
+# Openers that continue the previous question's subject ("and Apple?", "what about AMD?")
+ELLIPSIS_PATTERN = re.compile(r"^(and|but|also|what about|how about|what else|same for)\b", re.IGNORECASE)
+# Pronouns that point back to it, unless the question names a subject of its own
+PRONOUN_PATTERN = re.compile(r"\b(it|its|they|them|their|theirs|he|him|his|she|her|hers)\b", re.IGNORECASE)
+
+# Capitalized only because they start the question
+OPENING_WORDS = {"what", "why", "how", "when", "where", "who", "which", "did", "does", "do", "is", "are", "was",
+                 "were", "will", "would", "can", "could", "should", "has", "have", "and", "but", "also", "so",
+                 "then", "tell", "show", "give", "any", "the", "a", "an", "i"}
+
+def names_subject(query):
+    """True when the question names who or what it means ("Musk and his companies"): a capitalized word"""
+    return any(word[:1].isupper() and word.lower() not in OPENING_WORDS for word in query.split())
+
+def is_followup(query):
+    """Short questions that lean on an earlier subject: "what about Apple?", "why did it fall?" """
+    if len(query.split()) > FOLLOWUP_MAX_WORDS:
+        return False
+    return bool(ELLIPSIS_PATTERN.search(query)) or (bool(PRONOUN_PATTERN.search(query)) and not names_subject(query))
+
+def _standalone(query, previous, max_context_words):
+    if not previous or not is_followup(query):
+        return query
+    return f"{' '.join(previous.split()[:max_context_words])} {query}"
+
+def rewrite_query(query, history, max_context_words=32):
+    """
+    Make a follow-up question standalone for retrieval by prefixing the previous
+    question, e.g. "what about Apple?" after "Nvidia earnings this quarter".
+    The questions in `history` are made standalone the same way first, so a
+    follow-up to a follow-up still carries the original subject. Cheap on
+    purpose: no model call, and the prefix is capped at `max_context_words`.
+    Returns `query` unchanged when it doesn't look like a follow-up.
+    """
+    previous = None
+    for message in history:
+        if message.get("role") == "user":
+            previous = _standalone(message["text"], previous, max_context_words)
+    return _standalone(query, previous, max_context_words)
@@ -3,6 +3,13 @@ import time
 import os
 import sys
 
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+# Set to 0 when Qdrant is managed outside this process (compose, k8s, CI service)
+QDRANT_MANAGE_DOCKER = os.getenv("QDRANT_MANAGE_DOCKER", "1") == "1"
+# Set to 0 when a separate ingest job owns the collection
+STARTUP_INGEST = os.getenv("STARTUP_INGEST", "1") == "1"
+
 def check_docker_running():
     """Check if Docker daemon is running"""
     try:
@@ -20,6 +27,24 @@ def is_qdrant_container_running():
     )
     return bool(result.stdout.strip())
 
+def is_qdrant_reachable(timeout=1.0):
+    """Check if the Qdrant HTTP API answers"""
+    import urllib.request
+    try:
+        with urllib.request.urlopen(f"http://{QDRANT_HOST}:{QDRANT_PORT}/readyz", timeout=timeout):
+            return True
+    except Exception:
+        return False
+
+def wait_for_qdrant(timeout=30.0, interval=0.25):
+    """Poll Qdrant until it answers instead of sleeping a fixed amount"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if is_qdrant_reachable():
+            return True
+        time.sleep(interval)
+    return False
+
 def start_qdrant_container():
     """Start the Qdrant container"""
     print("Starting Qdrant container...")
@@ -29,25 +54,49 @@ def start_qdrant_container():
     )
     # Wait for container to be fully operational
     print("Waiting for Qdrant container to initialize...")
-    time.sleep(5)
+    wait_for_qdrant()
 
-def run_vector_storage():
-    """Run the vector storage script"""
-    script_path = os.path.join(os.path.dirname(__file__), "vector_db", "store_in_qdrant.py")
-    print(f"Running vector storage script: {script_path}")
-    
-    subprocess.run([sys.executable, script_path], check=True)
-
-def init_server():
+def ensure_qdrant():
+    """Make sure Qdrant is reachable, starting the Docker container if we manage it"""
+    if is_qdrant_reachable():
+        return
+    if not QDRANT_MANAGE_DOCKER:
+        raise RuntimeError(f"Qdrant is not reachable at {QDRANT_HOST}:{QDRANT_PORT}")
     if not check_docker_running():
-        print("Error: Docker is not running. Please start Docker and try again.")
-        sys.exit(1)
-    
+        raise RuntimeError("Docker is not running. Please start Docker and try again.")
+
     if not is_qdrant_container_running():
         start_qdrant_container()
     else:
         print("Qdrant container is already running.")
-    
-    run_vector_storage()
+    if not wait_for_qdrant():
+        raise RuntimeError(f"Qdrant did not become reachable at {QDRANT_HOST}:{QDRANT_PORT}")
+
+def prepare_vector_store():
+    """Ensure Qdrant is up and holds the embeddings on disk; skips ingest when the fingerprint matches"""
+    ensure_qdrant()
+    if not STARTUP_INGEST:
+        return
+
+    from qdrant_client import QdrantClient
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_db"))
+    from store_in_qdrant import ingest, COLLECTION_NAME
+
+    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+    result = ingest(client, COLLECTION_NAME)
+    if result is None:
+        print(f"Qdrant collection '{COLLECTION_NAME}' is up to date, skipping ingest.")
+    else:
+        upserted, deleted, total = result
+        print(f"Synced '{COLLECTION_NAME}': {upserted} upserted, {deleted} deleted, {total - upserted} unchanged.")
+
+def init_server():
+    try:
+        prepare_vector_store()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
     print("Process completed successfully.")
 
+if __name__ == "__main__":
+    init_server()
@@ -1,57 +1,270 @@
 # vector_db/store_in_qdrant.py
 
-import json
+import argparse
+import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+import uuid
+import redis
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client.http.models import (
+    Distance, VectorParams, PointStruct, PointIdsList, PayloadSchemaType, ScalarQuantization,
+    ScalarQuantizationConfig, ScalarType, BinaryQuantization, BinaryQuantizationConfig, Disabled
+)
 from qdrant_client.http.exceptions import ResponseHandlingException
 
-try:
-    # Connect to Qdrant (local)
-    client = QdrantClient(host="localhost", port=6333)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from embeddings.embedding_store import iter_any, store_fingerprint
+from embeddings.quantization import VECTOR_QUANTIZATION, SCALAR_QUANTILE, check_mode
 
-    collection_name = "news_articles"
+COLLECTION_NAME = "news_articles"
+# Small side collection holding one bookkeeping point per ingested collection
+STATE_COLLECTION = "ingest_state"
+# Bump when the payload layout changes so existing points get rewritten
+PAYLOAD_SCHEMA = 2
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "256"))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "4"))
+UPSERT_MAX_RETRIES = int(os.getenv("UPSERT_MAX_RETRIES", "5"))
 
-    # Check if collection exists and create it if it doesn't
-    if client.collection_exists(collection_name):
+def quantization_config(quantization=VECTOR_QUANTIZATION):
+    """Qdrant quantization config for the VECTOR_QUANTIZATION setting; quantized vectors stay in RAM"""
+    if check_mode(quantization) == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=SCALAR_QUANTILE,
+                                                                  always_ram=True))
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    return None
+
+def _quantization_kind(config):
+    if isinstance(config, ScalarQuantization):
+        return "scalar"
+    if isinstance(config, BinaryQuantization):
+        return "binary"
+    return "none" if config is None else type(config).__name__
+
+def ensure_collection(client, collection_name, recreate=False, quantization=VECTOR_QUANTIZATION):
+    """
+    Create the collection if needed; drop and recreate it when `recreate` is set.
+    An existing collection is switched to the requested quantization in place.
+    """
+    if recreate and client.collection_exists(collection_name):
         client.delete_collection(collection_name)
-    
-    # Create collection
-    client.create_collection(
-        collection_name=collection_name,
-        vectors_config=VectorParams(size=384, distance=Distance.COSINE)  # 384 for MiniLM
+
+    config = quantization_config(quantization)
+    if not client.collection_exists(collection_name):
+        client.create_collection(
+            collection_name=collection_name,
+            # 384 for MiniLM; with quantization the originals are only read for rescoring, so keep them on disk
+            vectors_config=VectorParams(size=384, distance=Distance.COSINE, on_disk=config is not None),
+            quantization_config=config
+        )
+    elif _quantization_kind(client.get_collection(collection_name).config.quantization_config) != quantization:
+        client.update_collection(collection_name, quantization_config=config or Disabled.DISABLED)
+
+    # Chunks are grouped by their parent article at query time; creating an existing index is a no-op
+    client.create_payload_index(collection_name, "article_id", PayloadSchemaType.KEYWORD)
+
+def existing_hashes(client, collection_name):
+    """Map point id -> stored content_hash for every point written with the current payload schema"""
+    hashes = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=1000,
+            offset=offset,
+            with_payload=["content_hash", "schema"],
+            with_vectors=False
+        )
+        for point in points:
+            payload = point.payload or {}
+            hashes[point.id] = payload.get("content_hash") if payload.get("schema") == PAYLOAD_SCHEMA else None
+        if offset is None:
+            return hashes
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def upsert_with_retry(client, collection_name, points, max_retries=UPSERT_MAX_RETRIES, backoff=0.5):
+    """Upsert one batch, retrying with exponential backoff so a transient error doesn't sink the run"""
+    for attempt in range(max_retries + 1):
+        try:
+            client.upsert(collection_name=collection_name, points=points)
+            return len(points)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"Warning: Upsert of {len(points)} points failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def upload_points(client, collection_name, points, batch_size=UPSERT_BATCH_SIZE, workers=UPSERT_WORKERS,
+                  max_retries=UPSERT_MAX_RETRIES):
+    """
+    Upsert a stream of points in batches across a small thread pool.
+    At most 2 * workers batches are buffered, so memory stays flat however
+    long the stream is. Batches that still fail after retries are counted and
+    reported once the rest of the stream has been sent.
+    """
+    started = time.monotonic()
+    uploaded = failed_batches = 0
+    last_report = started
+    pending = set()
+
+    def collect(done):
+        nonlocal uploaded, failed_batches, last_report
+        for future in done:
+            try:
+                uploaded += future.result()
+            except Exception as e:
+                failed_batches += 1
+                print(f"Error: Upsert batch failed after {max_retries} retries: {e}")
+        now = time.monotonic()
+        if now - last_report >= 2.0:
+            last_report = now
+            print(f"  ... {uploaded} points upserted ({uploaded / (now - started):.0f} points/sec)")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upsert") as pool:
+        for batch in batched(points, batch_size):
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(upsert_with_retry, client, collection_name, batch, max_retries))
+        collect(wait(pending).done)
+
+    elapsed = time.monotonic() - started
+    if uploaded:
+        print(f"Upserted {uploaded} points in {elapsed:.2f}s ({uploaded / max(elapsed, 1e-9):.0f} points/sec)")
+    if failed_batches:
+        raise RuntimeError(f"{failed_batches} upsert batches failed; rerun to sync the remaining points")
+    return uploaded
+
+def make_point(chunk, vector):
+    """Qdrant point for one chunk record of the embedding store"""
+    return PointStruct(
+        id=chunk["id"],
+        vector=vector.tolist() if hasattr(vector, "tolist") else list(vector),
+        payload={
+            "title": chunk["title"],
+            "text": chunk["text"],
+            "url": chunk["url"],
+            "article_id": chunk["article_id"],
+            "chunk_index": chunk["chunk_index"],
+            "content_hash": chunk["content_hash"],
+            "schema": PAYLOAD_SCHEMA
+        }
     )
 
-    # Load embeddings
-    with open("./embeddings/article_embeddings.json", "r", encoding="utf-8") as f:
-        articles = json.load(f)
-
-    # Prepare points
-    points = [
-        PointStruct(
-            id=i,
-            vector=article["embedding"],
-            payload={
-                "title": article["title"],
-                "text": article["text"],
-                "url": article["url"]
-            }
+def sync_collection(client, collection_name=COLLECTION_NAME, full=False,
+                    batch_size=UPSERT_BATCH_SIZE, workers=UPSERT_WORKERS):
+    """
+    Bring the collection in line with the embedding store.
+    Only new or changed articles are upserted and removed ones are deleted,
+    unless `full` is set, in which case the collection is rebuilt from scratch.
+    """
+    ensure_collection(client, collection_name, recreate=full)
+    stored = {} if full else existing_hashes(client, collection_name)
+    seen = set()
+
+    def changed_points():
+        # Generator over the memory-mapped store, so only in-flight batches are held in memory
+        for article, vector in iter_any():
+            seen.add(article["id"])
+            if stored.get(article["id"]) == article["content_hash"]:
+                continue
+            yield make_point(article, vector)
+
+    upserted = upload_points(client, collection_name, changed_points(), batch_size=batch_size, workers=workers)
+
+    # Points left over from the old enumerate-index IDs are removed here too
+    removed = [point_id for point_id in stored if str(point_id) not in seen]
+    for batch in batched(removed, batch_size):
+        client.delete(collection_name=collection_name, points_selector=PointIdsList(points=batch))
+
+    return upserted, len(removed), len(seen)
+
+def _state_point_id(collection_name):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"qdrant-collection:{collection_name}"))
+
+def read_fingerprint(client, collection_name):
+    """Fingerprint of the embedding store last synced into the collection, or None"""
+    if not client.collection_exists(collection_name) or not client.collection_exists(STATE_COLLECTION):
+        return None
+    points = client.retrieve(STATE_COLLECTION, ids=[_state_point_id(collection_name)], with_payload=True)
+    return points[0].payload.get("fingerprint") if points else None
+
+def write_fingerprint(client, collection_name, fingerprint):
+    if not client.collection_exists(STATE_COLLECTION):
+        client.create_collection(
+            collection_name=STATE_COLLECTION,
+            vectors_config=VectorParams(size=1, distance=Distance.DOT)
         )
-        for i, article in enumerate(articles)
-    ]
-
-    # Upload points
-    client.upsert(collection_name=collection_name, points=points)
-
-    print(f"✅ Uploaded {len(points)} articles to Qdrant collection '{collection_name}'")
-    
-except ResponseHandlingException as e:
-    print("Error: Could not connect to Qdrant server.")
-    print("Please ensure Qdrant server is running at localhost:6333")
-    print("If using Docker, start Qdrant with:")
-    print("    docker run -p 6333:6333 -p 6334:6334 qdrant/qdrant")
-    print(f"Original error: {str(e)}")
-    sys.exit(1)
-except Exception as e:
-    print(f"An error occurred: {str(e)}")
-    sys.exit(1)
\ No newline at end of file
+    client.upsert(
+        collection_name=STATE_COLLECTION,
+        points=[PointStruct(
+            id=_state_point_id(collection_name),
+            vector=[1.0],
+            payload={"collection": collection_name, "fingerprint": fingerprint, "synced_at": time.time()}
+        )]
+    )
+
+def ingest(client, collection_name=COLLECTION_NAME, full=False, **upload_options):
+    """
+    Sync the collection unless it already holds exactly the embeddings on disk.
+    Returns (upserted, deleted, total), or None when the sync was skipped.
+    """
+    # Includes the quantization so changing it re-runs the sync, which updates the collection config
+    fingerprint = f"{PAYLOAD_SCHEMA}:{VECTOR_QUANTIZATION}:{store_fingerprint()}"
+    if not full and read_fingerprint(client, collection_name) == fingerprint:
+        return None
+
+    upserted, deleted, total = sync_collection(client, collection_name, full=full, **upload_options)
+    write_fingerprint(client, collection_name, fingerprint)
+    if upserted or deleted:
+        publish_ingest_generation(collection_name)
+    return upserted, deleted, total
+
+def publish_ingest_generation(collection_name):
+    """Tell running API workers to drop answers cached against the old collection"""
+    try:
+        r = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+        r.set(f"ingest_generation:{collection_name}", str(time.time()))
+    except Exception as e:
+        print(f"Warning: Could not publish ingest generation to Redis: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the embedding store into Qdrant")
+    parser.add_argument("--full", action="store_true", help="Drop and rebuild the collection instead of syncing changes")
+    parser.add_argument("--batch-size", type=int, default=UPSERT_BATCH_SIZE, help="Points per upsert request")
+    parser.add_argument("--workers", type=int, default=UPSERT_WORKERS, help="Parallel upsert requests")
+    args = parser.parse_args()
+
+    try:
+        # Connect to Qdrant (local)
+        client = QdrantClient(host="localhost", port=6333)
+
+        result = ingest(client, COLLECTION_NAME, full=args.full, batch_size=args.batch_size, workers=args.workers)
+        if result is None:
+            print(f"✅ Qdrant collection '{COLLECTION_NAME}' already matches the embeddings on disk")
+        else:
+            upserted, deleted, total = result
+            print(f"✅ Synced Qdrant collection '{COLLECTION_NAME}': {upserted} upserted, "
+                  f"{deleted} deleted, {total - upserted} unchanged")
+
+    except ResponseHandlingException as e:
+        print("Error: Could not connect to Qdrant server.")
+        print("Please ensure Qdrant server is running at localhost:6333")
+        print("If using Docker, start Qdrant with:")
+        print("    docker run -p 6333:6333 -p 6334:6334 qdrant/qdrant")
+        print(f"Original error: {str(e)}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
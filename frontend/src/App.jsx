@@ -2,6 +2,39 @@ import { useState, useEffect, useRef } from "react";
 import "./index.css";
 import { v4 as uuidv4 } from "uuid";
 
+// Parse one Server-Sent Events block ("event: name\ndata: {...}")
+function parseSseEvent(raw) {
+  let event = "message";
+  let data = "";
+  for (const line of raw.split("\n")) {
+    if (line.startsWith("event:")) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith("data:")) {
+      data += line.slice(5).trim();
+    }
+  }
+  return { event, data: data ? JSON.parse(data) : null };
+}
+
+// Parse a Server-Timing header ("embed;dur=8.0, retrieve;dur=2.5") into { embed: 8, retrieve: 2.5 }
+function parseServerTiming(header) {
+  const timings = {};
+  for (const entry of (header || "").split(",")) {
+    const [name, ...params] = entry.trim().split(";");
+    const dur = params.find(p => p.trim().startsWith("dur="));
+    if (name && dur) {
+      timings[name] = parseFloat(dur.trim().slice(4));
+    }
+  }
+  return timings;
+}
+
+function formatTimings(timings) {
+  return Object.entries(timings)
+    .map(([stage, ms]) => `${stage} ${Math.round(ms)} ms`)
+    .join(" · ");
+}
+
 function App() {
   const [sessionId, setSessionId] = useState(() => localStorage.getItem("session_id") || uuidv4());
   const [messages, setMessages] = useState([]);
@@ -50,19 +83,64 @@ function App() {
     const userMessage = { role: "user", text: input };
     setMessages(prev => [...prev, userMessage]);
 
+    // Show the bot message as soon as the first token arrives, then grow it in place
+    let started = false;
+    const appendToBot = (text) => {
+      if (!started) {
+        started = true;
+        setLoading(false);
+        setMessages(prev => [...prev, { role: "bot", text }]);
+        return;
+      }
+      setMessages(prev => {
+        const next = [...prev];
+        const last = next[next.length - 1];
+        next[next.length - 1] = { ...last, text: last.text + text };
+        return next;
+      });
+    };
+
     try {
       const formData = new FormData();
       formData.append("query", input);
       formData.append("session_id", sessionId);
 
-      const res = await fetch(`http://localhost:8000/chat`, {
+      const res = await fetch(`http://localhost:8000/chat/stream`, {
         method: "POST",
         body: formData,
       });
+      if (!res.ok || !res.body) {
+        throw new Error(`Chat request failed with status ${res.status}`);
+      }
+      // Stages that ran before the stream started; the rest arrive with the `done` event
+      const headerTimings = parseServerTiming(res.headers.get("Server-Timing"));
+      delete headerTimings.total;
 
-      const data = await res.json();
-      const botMessage = { role: "bot", text: data.answer };
-      setMessages(prev => [...prev, botMessage]);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const raw of events) {
+          const { event, data } = parseSseEvent(raw);
+          if (event === "token") {
+            appendToBot(data.text);
+          } else if (event === "done" && started) {
+            const timings = { ...headerTimings, ...(data.timings || {}) };
+            setMessages(prev => {
+              const next = [...prev];
+              next[next.length - 1] = { ...next[next.length - 1], timings };
+              return next;
+            });
+          } else if (event === "error") {
+            throw new Error(data.detail);
+          }
+        }
+      }
     } catch (err) {
       console.error(err);
       setMessages(prev => [...prev, { role: "bot", text: "Sorry, something went wrong." }]);
@@ -190,6 +268,11 @@ function App() {
                   <div className={`${msg.role === "bot" ? (darkMode ? 'text-gray-200' : 'text-gray-800') : (darkMode ? 'text-gray-300' : 'text-gray-700')} whitespace-pre-wrap text-sm md:text-base leading-relaxed`}>
                     {msg.text}
                   </div>
+                  {msg.timings && (
+                    <div className={`mt-2 text-xs ${darkMode ? 'text-gray-500' : 'text-gray-400'}`}>
+                      {formatTimings(msg.timings)}
+                    </div>
+                  )}
                 </div>
               </div>
             </div>